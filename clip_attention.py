@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Export-safe attention for CLIP mobile export.
+
+MobileAttention is a drop-in replacement for the nn.MultiheadAttention
+modules inside open_clip's ResidualAttentionBlocks. It avoids
+F.scaled_dot_product_attention (not available to the mobile runtime) and
+computes attention block-wise with an online softmax, so peak memory per
+head is O(chunk * chunk) instead of O(L * L). Causal masking is built in:
+fully masked key blocks are skipped and no (L, L) mask buffer is needed.
+
+Run directly to check parity against the original open_clip model:
+    python clip_attention.py --model ViT-B-32 --pretrained openai
+"""
+
+import argparse
+import math
+from typing import Optional, Tuple
+
+import torch
+import torch.nn.functional as F
+
+DEFAULT_CHUNK = 32
+
+
+class MobileAttention(torch.nn.Module):
+    """Self-attention with fused QKV projection and chunked online softmax."""
+
+    def __init__(self, embed_dim: int, num_heads: int, batch_first: bool = True,
+                 causal: bool = False, chunk: int = DEFAULT_CHUNK):
+        super().__init__()
+        if embed_dim % num_heads != 0:
+            raise ValueError(f"embed_dim {embed_dim} is not divisible by num_heads {num_heads}")
+        self.embed_dim = embed_dim
+        self.num_heads = num_heads
+        self.head_dim = embed_dim // num_heads
+        self.batch_first = batch_first
+        self.causal = causal
+        self.chunk = chunk
+        self.scale = 1.0 / math.sqrt(self.head_dim)
+        self.in_proj = torch.nn.Linear(embed_dim, 3 * embed_dim)
+        self.out_proj = torch.nn.Linear(embed_dim, embed_dim)
+
+    @classmethod
+    def from_mha(cls, mha: torch.nn.MultiheadAttention, causal: bool = False, chunk: int = DEFAULT_CHUNK):
+        """Copy weights from an nn.MultiheadAttention (packed in_proj only)."""
+        if not mha._qkv_same_embed_dim or mha.in_proj_weight is None:
+            raise ValueError("Only packed-QKV MultiheadAttention can be converted")
+        attn = cls(mha.embed_dim, mha.num_heads, mha.batch_first, causal, chunk)
+        with torch.no_grad():
+            attn.in_proj.weight.copy_(mha.in_proj_weight)
+            if mha.in_proj_bias is not None:
+                attn.in_proj.bias.copy_(mha.in_proj_bias)
+            else:
+                attn.in_proj.bias.zero_()
+            attn.out_proj.weight.copy_(mha.out_proj.weight)
+            if mha.out_proj.bias is not None:
+                attn.out_proj.bias.copy_(mha.out_proj.bias)
+            else:
+                attn.out_proj.bias.zero_()
+        return attn.to(mha.out_proj.weight.dtype)
+
+    def _mask_block(self, attn_mask: Optional[torch.Tensor], batch: int,
+                    qs: int, qe: int, ks: int, ke: int) -> Optional[torch.Tensor]:
+        """Additive mask slice for one (query, key) block, broadcastable to (B, H, q, k)."""
+        if attn_mask is None:
+            return None
+        if attn_mask.dim() == 2:
+            m = attn_mask[qs:qe, ks:ke]
+        else:
+            m = attn_mask.view(batch, self.num_heads, attn_mask.size(-2), attn_mask.size(-1))[:, :, qs:qe, ks:ke]
+        if m.dtype == torch.bool:
+            m = torch.zeros(m.shape, dtype=torch.float32, device=m.device).masked_fill(m, float("-inf"))
+        return m
+
+    def attend(self, q: torch.Tensor, k: torch.Tensor, v: torch.Tensor,
+               attn_mask: Optional[torch.Tensor] = None) -> torch.Tensor:
+        """Blocked attention over (B, H, L, D) tensors with an online softmax."""
+        batch, length = q.size(0), q.size(2)
+        q = q * self.scale
+        out_blocks = []
+        for qs in range(0, length, self.chunk):
+            qe = min(qs + self.chunk, length)
+            qb = q[:, :, qs:qe]
+            m_run = torch.full((batch, self.num_heads, qe - qs, 1), float("-inf"), dtype=q.dtype, device=q.device)
+            l_run = torch.zeros((batch, self.num_heads, qe - qs, 1), dtype=q.dtype, device=q.device)
+            acc = torch.zeros((batch, self.num_heads, qe - qs, self.head_dim), dtype=q.dtype, device=q.device)
+            k_end = qe if self.causal else length
+            for ks in range(0, k_end, self.chunk):
+                ke = min(ks + self.chunk, k_end)
+                s = torch.matmul(qb, k[:, :, ks:ke].transpose(-2, -1))
+                m = self._mask_block(attn_mask, batch, qs, qe, ks, ke)
+                if m is not None:
+                    s = s + m.to(s.dtype)
+                if self.causal and ke > qs:
+                    qi = torch.arange(qs, qe, device=q.device).unsqueeze(1)
+                    ki = torch.arange(ks, ke, device=q.device).unsqueeze(0)
+                    s = s.masked_fill(ki > qi, float("-inf"))
+                m_new = torch.maximum(m_run, s.amax(dim=-1, keepdim=True))
+                # Rows that are fully masked so far keep a finite reference point.
+                m_safe = torch.where(torch.isinf(m_new), torch.zeros_like(m_new), m_new)
+                p = torch.exp(s - m_safe)
+                corr = torch.exp(m_run - m_safe)
+                l_run = l_run * corr + p.sum(dim=-1, keepdim=True)
+                acc = acc * corr + torch.matmul(p, v[:, :, ks:ke])
+                m_run = m_new
+            out_blocks.append(acc / l_run.clamp_min(1e-30))
+        return torch.cat(out_blocks, dim=2)
+
+    def forward(self, query: torch.Tensor, key: Optional[torch.Tensor] = None,
+                value: Optional[torch.Tensor] = None, need_weights: bool = False,
+                attn_mask: Optional[torch.Tensor] = None) -> Tuple[torch.Tensor, Optional[torch.Tensor]]:
+        """Same call shape as nn.MultiheadAttention; key/value must be the query (self-attention)."""
+        x = query if self.batch_first else query.transpose(0, 1)
+        batch, length = x.size(0), x.size(1)
+        qkv = self.in_proj(x).view(batch, length, 3, self.num_heads, self.head_dim).permute(2, 0, 3, 1, 4)
+        out = self.attend(qkv[0], qkv[1], qkv[2], attn_mask)
+        out = self.out_proj(out.transpose(1, 2).reshape(batch, length, self.embed_dim))
+        if not self.batch_first:
+            out = out.transpose(0, 1)
+        return out, None
+
+
+def replace_attention(module: torch.nn.Module, causal: bool = False, chunk: int = DEFAULT_CHUNK) -> int:
+    """
+    Swap every self-attention nn.MultiheadAttention under `module` for MobileAttention.
+
+    Cross-attention blocks (those with ln_1_kv) are left untouched.
+    Returns the number of modules replaced.
+    """
+    replaced = 0
+    for parent in list(module.modules()):
+        if hasattr(parent, "ln_1_kv"):
+            continue
+        for name, child in list(parent.named_children()):
+            if isinstance(child, torch.nn.MultiheadAttention):
+                setattr(parent, name, MobileAttention.from_mha(child, causal=causal, chunk=chunk))
+                replaced += 1
+    return replaced
+
+
+def check_parity(reference: torch.nn.Module, image_encoder: torch.nn.Module, text_encoder: torch.nn.Module,
+                 batch: int = 2, context_length: int = 77, image_size: int = 224, atol: float = 1e-4):
+    """
+    Compare swapped encoders against the original open_clip encode_image/encode_text.
+
+    Returns the max abs differences (image, text); raises if either exceeds atol.
+    """
+    torch.manual_seed(0)
+    img = torch.randn(batch, 3, image_size, image_size)
+    tok = torch.randint(1, 49406, (batch, context_length), dtype=torch.long)
+    tok[:, 0] = 49406
+    tok[torch.arange(batch), torch.randint(2, context_length, (batch,))] = 49407
+    with torch.no_grad():
+        ref_img = F.normalize(reference.encode_image(img), dim=-1)
+        ref_txt = F.normalize(reference.encode_text(tok), dim=-1)
+        img_err = (image_encoder(img) - ref_img).abs().max().item()
+        txt_err = (text_encoder(tok) - ref_txt).abs().max().item()
+    if img_err > atol or txt_err > atol:
+        raise RuntimeError(f"Attention parity failed: image diff {img_err:.2e}, text diff {txt_err:.2e} (atol {atol:.0e})")
+    return img_err, txt_err
+
+
+def _self_test(model_name, pretrained, chunk):
+    import copy
+    import open_clip
+
+    model, _, _ = open_clip.create_model_and_transforms(model_name, pretrained=pretrained, device="cpu")
+    model.eval()
+    swapped = copy.deepcopy(model)
+    n_vis = replace_attention(swapped.visual, causal=False, chunk=chunk)
+    n_txt = replace_attention(swapped.transformer, causal=True, chunk=chunk)
+    print(f"🔧 Replaced {n_vis} visual and {n_txt} text attention modules (chunk={chunk})")
+
+    def image_encoder(x):
+        return F.normalize(swapped.encode_image(x), dim=-1)
+
+    def text_encoder(t):
+        # Causal masking is native, so the (L, L) mask buffer is not passed.
+        x = swapped.token_embedding(t) + swapped.positional_embedding[:t.size(1)]
+        x = swapped.ln_final(swapped.transformer(x, attn_mask=None))
+        x = x[torch.arange(x.shape[0]), t.argmax(dim=-1)] @ swapped.text_projection
+        return F.normalize(x, dim=-1)
+
+    img_err, txt_err = check_parity(model, image_encoder, text_encoder)
+    print(f"✅ Parity OK: image max diff {img_err:.2e}, text max diff {txt_err:.2e}")
+
+    attn = next(m for m in swapped.transformer.modules() if isinstance(m, MobileAttention))
+    torch.jit.script(attn)
+    print("✅ MobileAttention scripts cleanly")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check MobileAttention parity against open_clip")
+    parser.add_argument("--model", default="ViT-B-32", help="CLIP model name")
+    parser.add_argument("--pretrained", default="openai", help="Pretrained weights")
+    parser.add_argument("--chunk", type=int, default=DEFAULT_CHUNK, help="Attention block size")
+    args = parser.parse_args()
+    _self_test(args.model, args.pretrained, args.chunk)
@@ -5,15 +5,307 @@ Exports CLIP models to TorchScript Lite format for Android deployment.
 """
 
 import torch
-import math
 import torch.nn.functional as F
-from typing import Optional
+import copy
+import hashlib
 import json
+import os
+import time
 from pathlib import Path
 import argparse
 
-def export_clip_models(model_name="ViT-B-32", pretrained="openai", output_dir="mobile_models"):
-    """Export CLIP models to TorchScript Lite format."""
+from clip_attention import MobileAttention, check_parity, replace_attention
+from mobile_load_bench import load_mobile_module
+
+DEFAULT_BATCH_SIZES = (1, 8, 32, 64)
+QUANT_ENGINES = ("qnnpack", "fbgemm")
+CALIB_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+DEFAULT_PROMPTS = (
+    "a photo of a dog", "a photo of a cat", "a photo of a person", "a photo of a car",
+    "a photo of a house", "a person walking", "a city street at night", "food on a table",
+    "a beach with waves", "people dancing at a party", "a child playing", "a mountain landscape",
+)
+
+def verify_batch_sizes(img_module, txt_module, img_ref, txt_ref, batch_sizes,
+                       image_size=224, context_length=77, atol=1e-4):
+    """Check exported encoders accept every batch size and match the eager reference."""
+    for bs in batch_sizes:
+        img = torch.randn(bs, 3, image_size, image_size)
+        tok = torch.randint(1, 49407, (bs, context_length), dtype=torch.long)
+        with torch.no_grad():
+            out_img = img_module(img)
+            out_txt = txt_module(tok)
+            ref_img = img_ref(img)
+            ref_txt = txt_ref(tok)
+        if out_img.shape[0] != bs or out_txt.shape[0] != bs:
+            raise RuntimeError(f"Batch {bs}: got image {tuple(out_img.shape)}, text {tuple(out_txt.shape)}")
+        err = max((out_img - ref_img).abs().max().item(), (out_txt - ref_txt).abs().max().item())
+        if err > atol:
+            raise RuntimeError(f"Batch {bs}: max abs diff {err:.2e} vs eager exceeds {atol:.0e}")
+        print(f"  ✅ Batch {bs}: image {tuple(out_img.shape)}, text {tuple(out_txt.shape)}, max diff {err:.2e}")
+
+def benchmark_batches(img_module, txt_module, batch_sizes, image_size=224,
+                      context_length=77, warmup=1, iters=3):
+    """Measure image frames/s and text prompts/s per batch size on CPU."""
+    rows = []
+    for bs in batch_sizes:
+        img = torch.randn(bs, 3, image_size, image_size)
+        tok = torch.randint(1, 49407, (bs, context_length), dtype=torch.long)
+        with torch.no_grad():
+            for _ in range(warmup):
+                img_module(img)
+                txt_module(tok)
+            t0 = time.perf_counter()
+            for _ in range(iters):
+                img_module(img)
+            img_s = (time.perf_counter() - t0) / iters
+            t0 = time.perf_counter()
+            for _ in range(iters):
+                txt_module(tok)
+            txt_s = (time.perf_counter() - t0) / iters
+        rows.append({
+            "batch_size": bs,
+            "image_fps": round(bs / img_s, 2),
+            "image_ms_per_batch": round(img_s * 1000, 2),
+            "text_per_s": round(bs / txt_s, 2),
+            "text_ms_per_batch": round(txt_s * 1000, 2),
+        })
+    return rows
+
+def print_benchmark_table(rows):
+    """Print the batch benchmark as a fixed-width table."""
+    print(f"  {'batch':>5} | {'image fps':>10} | {'ms/batch':>9} | {'text/s':>9} | {'ms/batch':>9}")
+    print(f"  {'-' * 5}-+-{'-' * 10}-+-{'-' * 9}-+-{'-' * 9}-+-{'-' * 9}")
+    for r in rows:
+        print(f"  {r['batch_size']:>5} | {r['image_fps']:>10.2f} | {r['image_ms_per_batch']:>9.2f} | "
+              f"{r['text_per_s']:>9.2f} | {r['text_ms_per_batch']:>9.2f}")
+
+def save_for_mobile(script, path, optimize=True):
+    """
+    Run optimize_for_mobile (freeze, conv/BN folding, op fusion, prepacked
+    weights, dropout removal) and save lite-interpreter bytecode.
+
+    optimize_for_mobile needs a torch build with XNNPACK; without it the
+    module is only frozen. Returns True if the full mobile pass ran.
+    """
+    import torch.backends.xnnpack
+    from torch.utils.mobile_optimizer import optimize_for_mobile
+    optimized = optimize and torch.backends.xnnpack.enabled
+    if optimized:
+        module = optimize_for_mobile(script)
+    else:
+        if optimize:
+            print("⚠️ This torch build has no XNNPACK; saving frozen (not mobile-optimized) bytecode")
+        module = torch.jit.freeze(script.eval())
+    module._save_for_lite_interpreter(str(path))
+    return optimized
+
+TEXT_CACHE_EMBEDDINGS = "text_cache.f32"
+TEXT_CACHE_INDEX = "text_cache.index.json"
+
+def file_sha256(path, block=1 << 20):
+    """Streaming SHA256 of a file."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(block), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def normalize_prompt(prompt):
+    """Canonical prompt form: lowercase with collapsed whitespace (as ClipBPETokenizer splits)."""
+    return " ".join(prompt.lower().split())
+
+def prompt_key(prompt):
+    """64-bit hex key of the normalized prompt (first 8 bytes of SHA256)."""
+    return hashlib.sha256(normalize_prompt(prompt).encode("utf-8")).hexdigest()[:16]
+
+def load_prompts(path):
+    """One prompt per line; blank lines and #comments are skipped, duplicates dropped."""
+    seen, prompts = set(), []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            key = prompt_key(line)
+            if key not in seen:
+                seen.add(key)
+                prompts.append(line)
+    return prompts
+
+def build_text_cache(txt_enc, tokenizer, prompts, output_path, text_encoder_path, batch_size=64):
+    """
+    Batch-encode prompts and write text_cache.f32 (row-major float32, little-endian)
+    plus text_cache.index.json mapping prompt_key -> row, pinned to the text encoder SHA256.
+    """
+    rows = []
+    with torch.no_grad():
+        for i in range(0, len(prompts), batch_size):
+            rows.append(txt_enc(tokenizer(prompts[i:i + batch_size])))
+    emb = torch.cat(rows).contiguous().numpy().astype("<f4")
+    emb_path = output_path / TEXT_CACHE_EMBEDDINGS
+    emb.tofile(emb_path)
+    index = {
+        "version": 1,
+        "model_sha256": file_sha256(text_encoder_path),
+        "text_encoder": Path(text_encoder_path).name,
+        "embeddings": TEXT_CACHE_EMBEDDINGS,
+        "dim": int(emb.shape[1]),
+        "count": int(emb.shape[0]),
+        "key": "sha256(lower+collapsed whitespace)[:16]",
+        "rows": {prompt_key(p): i for i, p in enumerate(prompts)},
+        "prompts": prompts,
+    }
+    with open(output_path / TEXT_CACHE_INDEX, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+    return index
+
+def load_text_cache(model_dir):
+    """
+    Load a prompt cache and check it was built for the text encoder next to it.
+
+    Returns (index, embeddings) or raises ValueError when the cache is stale.
+    """
+    import numpy as np
+    model_dir = Path(model_dir)
+    with open(model_dir / TEXT_CACHE_INDEX, "r", encoding="utf-8") as f:
+        index = json.load(f)
+    sha = file_sha256(model_dir / index["text_encoder"])
+    if sha != index["model_sha256"]:
+        raise ValueError(f"Stale text cache: built for {index['model_sha256'][:12]}, encoder is {sha[:12]}")
+    emb = np.fromfile(model_dir / index["embeddings"], dtype="<f4").reshape(index["count"], index["dim"])
+    return index, emb
+
+def lookup_prompt(index, embeddings, prompt):
+    """O(1) cached embedding for a prompt, or None on a miss."""
+    row = index["rows"].get(prompt_key(prompt))
+    return None if row is None else embeddings[row]
+
+def verify_text_cache(model_dir, txt_enc, tokenizer, prompts, sample=16, atol=1e-5):
+    """
+    Reload the cache the way a consumer would (SHA pin included) and check that every
+    prompt, and a re-cased / re-spaced spelling of it, hits a row that matches the encoder.
+    """
+    index, emb = load_text_cache(model_dir)
+    for prompt in prompts:
+        for spelling in (prompt, "  " + prompt.upper().replace(" ", "   ") + " "):
+            if lookup_prompt(index, emb, spelling) is None:
+                raise ValueError(f"Text cache miss for {spelling!r}")
+    probe = prompts[:sample]
+    with torch.no_grad():
+        fresh = txt_enc(tokenizer(probe)).numpy()
+    for prompt, ref in zip(probe, fresh):
+        err = float(abs(lookup_prompt(index, emb, prompt) - ref).max())
+        if err > atol:
+            raise ValueError(f"Cached embedding for {prompt!r} differs from the encoder by {err:.2e}")
+    return len(probe)
+
+def select_quant_engine(engine):
+    """Pin the int8 kernel backend explicitly (qnnpack for ARM devices, fbgemm for x86 hosts)."""
+    if engine not in QUANT_ENGINES:
+        raise ValueError(f"Unknown quantization engine {engine!r}; expected one of {QUANT_ENGINES}")
+    if engine not in torch.backends.quantized.supported_engines:
+        raise RuntimeError(f"Quantization engine {engine} is not available in this torch build "
+                           f"(supported: {torch.backends.quantized.supported_engines})")
+    torch.backends.quantized.engine = engine
+
+def load_calibration_frames(calib_dir, preprocess, limit=256):
+    """Load and preprocess up to `limit` frames from a directory of images."""
+    from PIL import Image
+    paths = sorted(p for p in Path(calib_dir).rglob("*") if p.suffix.lower() in CALIB_EXTENSIONS)[:limit]
+    if not paths:
+        raise FileNotFoundError(f"No calibration images ({', '.join(CALIB_EXTENSIONS)}) in {calib_dir}")
+    return torch.stack([preprocess(Image.open(p).convert("RGB")) for p in paths])
+
+def quantize_text_encoder(txt_enc):
+    """Dynamic int8 quantization of the text transformer's Linear layers."""
+    return torch.ao.quantization.quantize_dynamic(copy.deepcopy(txt_enc), {torch.nn.Linear}, dtype=torch.qint8)
+
+def quantize_image_encoder(img_enc, frames, engine, batch_size=16):
+    """
+    Static int8 quantization of the visual tower, calibrated on real frames.
+
+    Uses FX graph mode with MobileAttention kept as an fp32 leaf (its chunk
+    loops are not symbolically traceable); if the tower still cannot be traced,
+    falls back to dynamic int8 Linear quantization. Returns (module, method).
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.fx.custom_config import PrepareCustomConfig
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+    q_enc = copy.deepcopy(img_enc)
+    custom = PrepareCustomConfig().set_non_traceable_module_classes([MobileAttention])
+    try:
+        prepared = prepare_fx(q_enc.visual, get_default_qconfig_mapping(engine), (frames[:1],),
+                              prepare_custom_config=custom)
+        with torch.no_grad():
+            for i in range(0, len(frames), batch_size):
+                prepared(frames[i:i + batch_size])
+        q_enc.visual = convert_fx(prepared)
+        return q_enc, "static_fx"
+    except Exception as e:
+        print(f"⚠️ Static quantization failed ({e}); using dynamic int8 for the visual encoder")
+        return torch.ao.quantization.quantize_dynamic(copy.deepcopy(img_enc), {torch.nn.Linear},
+                                                      dtype=torch.qint8), "dynamic"
+
+def embedding_agreement(ref_module, quant_module, inputs, batch_size=16):
+    """Cosine agreement between fp32 and int8 embeddings of the same inputs."""
+    sims = []
+    with torch.no_grad():
+        for i in range(0, len(inputs), batch_size):
+            a = ref_module(inputs[i:i + batch_size])
+            b = quant_module(inputs[i:i + batch_size])
+            sims.append(F.cosine_similarity(a, b, dim=-1))
+    sims = torch.cat(sims)
+    return {"mean_cosine": round(sims.mean().item(), 6), "min_cosine": round(sims.min().item(), 6),
+            "count": len(sims)}
+
+def latency_per_item_ms(module, inputs, iters=None):
+    """Single-item latency (batch 1), averaged over the given inputs."""
+    n = min(len(inputs), iters or 16)
+    with torch.no_grad():
+        module(inputs[:1])
+        t0 = time.perf_counter()
+        for i in range(n):
+            module(inputs[i:i + 1])
+    return round((time.perf_counter() - t0) * 1000 / n, 3)
+
+def write_quantization_report(output_path, engine, entries):
+    """Write quantization_report.json and print a summary table."""
+    report = {"engine": engine, "encoders": entries}
+    report_path = output_path / "quantization_report.json"
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"  {'encoder':>7} | {'method':>9} | {'cos mean':>8} | {'cos min':>8} | "
+          f"{'fp32 ms':>8} | {'int8 ms':>8} | {'fp32 MB':>8} | {'int8 MB':>8}")
+    for name, e in entries.items():
+        print(f"  {name:>7} | {e['method']:>9} | {e['agreement']['mean_cosine']:>8.4f} | "
+              f"{e['agreement']['min_cosine']:>8.4f} | {e['fp32_ms']:>8.2f} | {e['int8_ms']:>8.2f} | "
+              f"{e['fp32_bytes'] / 2**20:>8.1f} | {e['int8_bytes'] / 2**20:>8.1f}")
+    print(f"📝 Quantization report: {report_path}")
+    return report_path
+
+def export_clip_models(model_name="ViT-B-32", pretrained="openai", output_dir="mobile_models",
+                       batch_sizes=None, quantize=False, calib_dir=None, qengine="qnnpack",
+                       save_legacy=False, prompts_path=None):
+    """
+    Export CLIP models to TorchScript Lite format.
+
+    With batch_sizes set (batch mode), the saved encoders are reloaded and
+    verified at each batch size against the eager model, then benchmarked;
+    results are recorded in model_info.json.
+
+    With quantize set, int8 encoders are also exported (dynamic int8 for the
+    text transformer, FX static int8 calibrated on `calib_dir` frames for the
+    visual tower) and compared to fp32 in quantization_report.json.
+
+    All .ptl files go through optimize_for_mobile and are saved as
+    lite-interpreter bytecode; save_legacy also writes the old plain
+    TorchScript files (*.legacy.pt) for mobile_load_bench.py comparisons.
+
+    With prompts_path, every prompt is encoded once on the host into
+    text_cache.f32 + text_cache.index.json, so fixed vocabularies become a
+    lookup instead of a text encoder forward.
+    """
     
     print(f"🔄 Exporting {model_name} model with {pretrained} weights...")
     
@@ -49,12 +341,12 @@ def export_clip_models(model_name="ViT-B-32", pretrained="openai", output_dir="m
         @torch.jit.export
         def forward(self, x: torch.Tensor) -> torch.Tensor:
             """Forward pass for image encoding."""
-            with torch.no_grad():
-                feats = self.visual(x)
-                # Safe L2 normalization
-                l2 = torch.sqrt((feats * feats).sum(dim=-1, keepdim=True) + 1e-12)
-                feats = feats / l2
-                return feats
+            # No torch.no_grad() block here: prim::Enter is not supported by the lite interpreter
+            feats = self.visual(x)
+            # Safe L2 normalization
+            l2 = torch.sqrt((feats * feats).sum(dim=-1, keepdim=True) + 1e-12)
+            feats = feats / l2
+            return feats
     
     # Wrap text encoder
     class TextEncoder(torch.nn.Module):
@@ -65,13 +357,13 @@ def export_clip_models(model_name="ViT-B-32", pretrained="openai", output_dir="m
             self.ln_final = clip.ln_final
             self.text_projection = clip.text_projection
             self.transformer = clip.transformer
-            self.register_buffer("attn_mask", clip.attn_mask)
         
         @torch.jit.export
         def forward(self, tokens: torch.Tensor) -> torch.Tensor:
             """Forward pass for text encoding."""
             x = self.token_embedding(tokens) + self.positional_embedding[:tokens.size(1)]
-            x = self.transformer(x, attn_mask=self.attn_mask)
+            # Causal masking is built into MobileAttention, so no (L, L) mask is passed
+            x = self.transformer(x, attn_mask=None)
             x = self.ln_final(x)
             # CLS token is at eot-1 position
             x = x[torch.arange(x.shape[0]), tokens.argmax(dim=-1)] @ self.text_projection
@@ -80,63 +372,58 @@ def export_clip_models(model_name="ViT-B-32", pretrained="openai", output_dir="m
             x = x / l2
             return x
     
-    # Monkeypatch scaled_dot_product_attention to avoid unsupported mobile op
-    def _sdp_compat(q: torch.Tensor, k: torch.Tensor, v: torch.Tensor,
-                    attn_mask: Optional[torch.Tensor] = None,
-                    dropout_p: float = 0.0,
-                    is_causal: bool = False) -> torch.Tensor:
-        # q,k,v: (..., heads, len, dim)
-        scale = 1.0 / math.sqrt(q.size(-1))
-        scores = torch.matmul(q, k.transpose(-2, -1)) * scale
-        if attn_mask is not None:
-            scores = scores + attn_mask
-        weights = torch.softmax(scores, dim=-1)
-        if dropout_p and dropout_p > 0:
-            # no-op at export time; keep deterministic
-            pass
-        return torch.matmul(weights, v)
-
-    if hasattr(F, "scaled_dot_product_attention"):
-        F.scaled_dot_product_attention = _sdp_compat  # type: ignore
+    # Swap attention for the export-safe MobileAttention (no F.scaled_dot_product_attention,
+    # chunked softmax, native causal masking in the text tower). The original model is
+    # kept as the parity reference.
+    print("🔧 Replacing attention modules...")
+    reference = model
+    model = copy.deepcopy(reference)
+    n_vis = replace_attention(model.visual, causal=False)
+    n_txt = replace_attention(model.transformer, causal=True)
+    print(f"  ✅ Replaced {n_vis} visual and {n_txt} text attention modules")
 
     # Create encoders
     print("🔧 Creating encoders...")
     img_enc = ImageEncoder(model)
     txt_enc = TextEncoder(model)
+
+    print("🔍 Checking parity against open_clip...")
+    img_err, txt_err = check_parity(reference, img_enc, txt_enc)
+    print(f"  ✅ Max abs diff: image {img_err:.2e}, text {txt_err:.2e}")
+    del reference
     
-    # Example inputs for tracing
-    ex_img = torch.randn(1, 3, 224, 224)
-    ex_tok = torch.ones(1, 77, dtype=torch.long)
-    
-    # Skip dynamic quantization to avoid NoQEngine on host
-    print("⚠️ Skipping dynamic quantization for text encoder")
-    txt_enc_q = txt_enc
+    # Example inputs for tracing (batch > 1 in batch mode so the trace is not specialized to 1)
+    ex_batch = 2 if batch_sizes else 1
+    ex_img = torch.randn(ex_batch, 3, 224, 224)
+    ex_tok = torch.ones(ex_batch, 77, dtype=torch.long)
     
     # Script models
     print("📜 Scripting models...")
     try:
         img_script = torch.jit.script(img_enc)
-        txt_script = torch.jit.script(txt_enc_q)
+        txt_script = torch.jit.script(txt_enc)
         print("✅ Scripting successful")
     except Exception as e:
         print(f"⚠️ Scripting failed, falling back to tracing: {e}")
         img_script = torch.jit.trace(img_enc, ex_img)
         txt_script = torch.jit.trace(txt_enc, ex_tok)
     
-    # Optimize for mobile
-    print("🚀 Optimizing for mobile...")
-    torch._C._jit_pass_inline(img_script.graph)
-    torch._C._jit_pass_inline(txt_script.graph)
-    
-    # Save models
     img_path = output_path / "clip_image_encoder.ptl"
     txt_path = output_path / "clip_text_encoder.ptl"
-    
+
+    if save_legacy:
+        # Previous artifact format (plain TorchScript), kept for load benchmarks
+        for script, name in ((img_script, "clip_image_encoder.legacy.pt"), (txt_script, "clip_text_encoder.legacy.pt")):
+            print(f"💾 Saving legacy TorchScript to {output_path / name}")
+            script.save(str(output_path / name))
+
+    # Optimize for mobile and save lite-interpreter bytecode
+    print("🚀 Optimizing for mobile...")
     print(f"💾 Saving image encoder to {img_path}")
-    img_script.save(str(img_path))
+    img_optimized = save_for_mobile(img_script, img_path)
     
     print(f"💾 Saving text encoder to {txt_path}")
-    txt_script.save(str(txt_path))
+    txt_optimized = save_for_mobile(txt_script, txt_path)
     
     # Save model info
     model_info = {
@@ -146,9 +433,80 @@ def export_clip_models(model_name="ViT-B-32", pretrained="openai", output_dir="m
         "text_encoder": "clip_text_encoder.ptl",
         "embedding_dim": model.visual.output_dim,
         "image_size": 224,
-        "max_text_length": 77
+        "max_text_length": 77,
+        "batch_size": 1,
+        "format": "lite_interpreter",
+        "optimized_for_mobile": img_optimized and txt_optimized
     }
+
+    if batch_sizes:
+        print(f"🔍 Verifying batch sizes {list(batch_sizes)}...")
+        img_loaded = load_mobile_module(img_path)
+        txt_loaded = load_mobile_module(txt_path)
+        verify_batch_sizes(img_loaded, txt_loaded, img_enc, txt_enc, batch_sizes)
+        print("⏱️ Benchmarking batched inference...")
+        bench = benchmark_batches(img_loaded, txt_loaded, batch_sizes)
+        print_benchmark_table(bench)
+        model_info["batch_size"] = "dynamic"
+        model_info["verified_batch_sizes"] = list(batch_sizes)
+        model_info["batch_benchmark"] = bench
     
+    if quantize:
+        print(f"🧮 Quantizing to int8 with {qengine} engine...")
+        select_quant_engine(qengine)
+        frames = load_calibration_frames(calib_dir, preprocess)
+        tokenizer = open_clip.get_tokenizer(model_name)
+        prompts = tokenizer(list(DEFAULT_PROMPTS))
+        # Calibrate on the first half of the frames, evaluate on the rest.
+        split = max(1, len(frames) // 2)
+        calib_frames, eval_frames = frames[:split], frames[split:] if len(frames) > 1 else frames
+        img_q, img_method = quantize_image_encoder(img_enc, calib_frames, qengine)
+        txt_q = quantize_text_encoder(txt_enc)
+        entries = {}
+        for name, ref, q, method, inputs, fp32_path in (
+                ("image", img_enc, img_q, img_method, eval_frames, img_path),
+                ("text", txt_enc, txt_q, "dynamic", prompts, txt_path)):
+            q_path = output_path / f"clip_{name}_encoder_int8.ptl"
+            try:
+                q_script = torch.jit.script(q)
+            except Exception as e:
+                print(f"⚠️ Scripting int8 {name} encoder failed, falling back to tracing: {e}")
+                q_script = torch.jit.trace(q, inputs[:1])
+            print(f"💾 Saving int8 {name} encoder to {q_path}")
+            save_for_mobile(q_script, q_path)
+            entries[name] = {
+                "method": method,
+                "file": q_path.name,
+                "agreement": embedding_agreement(ref, q, inputs),
+                "fp32_ms": latency_per_item_ms(ref, inputs),
+                "int8_ms": latency_per_item_ms(q, inputs),
+                "fp32_bytes": os.path.getsize(fp32_path),
+                "int8_bytes": os.path.getsize(q_path),
+            }
+        write_quantization_report(output_path, qengine, entries)
+        model_info["quantized"] = {
+            "engine": qengine,
+            "image_encoder": entries["image"]["file"],
+            "text_encoder": entries["text"]["file"],
+            "report": "quantization_report.json",
+        }
+
+    model_info["text_encoder_sha256"] = file_sha256(txt_path)
+    if prompts_path:
+        prompts = load_prompts(prompts_path)
+        print(f"🗂️ Encoding {len(prompts)} prompts into the text cache...")
+        tokenizer = open_clip.get_tokenizer(model_name)
+        cache = build_text_cache(txt_enc, tokenizer, prompts, output_path, txt_path)
+        checked = verify_text_cache(output_path, txt_enc, tokenizer, prompts)
+        model_info["text_cache"] = {
+            "embeddings": TEXT_CACHE_EMBEDDINGS,
+            "index": TEXT_CACHE_INDEX,
+            "count": cache["count"],
+            "model_sha256": cache["model_sha256"],
+        }
+        print(f"  ✅ Cached {cache['count']} prompts ({cache['count'] * cache['dim'] * 4} bytes); "
+              f"lookups verified, {checked} checked against the encoder")
+
     info_path = output_path / "model_info.json"
     with open(info_path, 'w') as f:
         json.dump(model_info, f, indent=2)
@@ -164,7 +522,25 @@ if __name__ == "__main__":
     parser.add_argument("--model", default="ViT-B-32", help="CLIP model name")
     parser.add_argument("--pretrained", default="openai", help="Pretrained weights")
     parser.add_argument("--output", default="mobile_models", help="Output directory")
+    parser.add_argument("--batch-mode", action="store_true",
+                        help="Verify dynamic batch sizes and benchmark frames/s per batch")
+    parser.add_argument("--batch-sizes", default=",".join(str(b) for b in DEFAULT_BATCH_SIZES),
+                        help="Comma-separated batch sizes for --batch-mode")
+    parser.add_argument("--quantize", action="store_true",
+                        help="Also export int8 encoders and write quantization_report.json")
+    parser.add_argument("--calib-dir", default=None, help="Directory of calibration frames for --quantize")
+    parser.add_argument("--qengine", default="qnnpack", choices=QUANT_ENGINES,
+                        help="Quantized kernel backend: qnnpack (ARM/Android) or fbgemm (x86)")
+    parser.add_argument("--save-legacy", action="store_true",
+                        help="Also save unoptimized TorchScript (*.legacy.pt) for load benchmarks")
+    parser.add_argument("--prompts", default=None,
+                        help="Prompt list (one per line) to precompute into the text embedding cache")
     
     args = parser.parse_args()
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",")] if args.batch_mode else None
+    
+    if args.quantize and not args.calib_dir:
+        parser.error("--quantize requires --calib-dir")
     
-    export_clip_models(args.model, args.pretrained, args.output)
+    export_clip_models(args.model, args.pretrained, args.output, batch_sizes,
+                       args.quantize, args.calib_dir, args.qengine, args.save_legacy, args.prompts)
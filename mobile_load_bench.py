@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Mobile Model Load Benchmark
+CPU-only harness comparing exported CLIP artifacts: cold load time, peak RSS
+and first-inference latency, each measured in a fresh interpreter process.
+
+Artifacts saved with _save_for_lite_interpreter are loaded through the lite
+interpreter (as on device); plain TorchScript files go through torch.jit.load.
+
+Usage:
+    python mobile_load_bench.py mobile_models/clip_image_encoder.legacy.pt mobile_models/clip_image_encoder.ptl
+    python mobile_load_bench.py mobile_models/            # every .pt/.ptl in the directory
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import zipfile
+from pathlib import Path
+
+ARTIFACT_SUFFIXES = (".ptl", ".pt")
+
+
+def is_lite_bytecode(path):
+    """True if the archive carries lite-interpreter bytecode (bytecode.pkl)."""
+    try:
+        with zipfile.ZipFile(path) as zf:
+            return any(name.endswith("/bytecode.pkl") or name == "bytecode.pkl" for name in zf.namelist())
+    except zipfile.BadZipFile:
+        return False
+
+
+def load_mobile_module(path):
+    """Load an exported encoder the way the runtime would."""
+    import torch
+    if is_lite_bytecode(path):
+        from torch.jit.mobile import _load_for_lite_interpreter
+        return _load_for_lite_interpreter(str(path))
+    return torch.jit.load(str(path), map_location="cpu")
+
+
+def infer_kind(path):
+    """Guess the encoder input type from the artifact name."""
+    return "text" if "text" in Path(path).name else "image"
+
+
+def example_input(kind, image_size=224, context_length=77):
+    import torch
+    if kind == "text":
+        tok = torch.full((1, context_length), 0, dtype=torch.long)
+        tok[0, 0], tok[0, 1], tok[0, 2] = 49406, 320, 49407
+        return tok
+    return torch.randn(1, 3, image_size, image_size)
+
+
+def peak_rss_mb():
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes.
+    return rss / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+def measure_child(path, kind, threads):
+    """Runs inside the fresh process: import torch, load, infer once; returns metrics."""
+    t0 = time.perf_counter()
+    import torch
+    torch.set_num_threads(threads)
+    import_ms = (time.perf_counter() - t0) * 1000
+    base_rss = peak_rss_mb()
+
+    x = example_input(kind)
+    t0 = time.perf_counter()
+    module = load_mobile_module(path)
+    load_ms = (time.perf_counter() - t0) * 1000
+    load_rss = peak_rss_mb()
+
+    with torch.no_grad():
+        t0 = time.perf_counter()
+        module(x)
+        first_ms = (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter()
+        module(x)
+        second_ms = (time.perf_counter() - t0) * 1000
+
+    return {
+        "file": str(path),
+        "kind": kind,
+        "lite_bytecode": is_lite_bytecode(path),
+        "size_mb": round(os.path.getsize(path) / 2**20, 2),
+        "torch_import_ms": round(import_ms, 1),
+        "load_ms": round(load_ms, 1),
+        "first_inference_ms": round(first_ms, 1),
+        "warm_inference_ms": round(second_ms, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "load_rss_delta_mb": round(load_rss - base_rss, 1),
+    }
+
+
+def run_cold(path, kind, threads):
+    """Measure one artifact in a new CPU-only interpreter."""
+    env = dict(os.environ, CUDA_VISIBLE_DEVICES="", OMP_NUM_THREADS=str(threads))
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", str(path), "--kind", kind,
+           "--threads", str(threads)]
+    out = subprocess.run(cmd, env=env, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(f"Benchmark of {path} failed:\n{out.stderr.strip()[-2000:]}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def collect_artifacts(paths):
+    files = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            files.extend(sorted(f for f in p.iterdir() if f.suffix in ARTIFACT_SUFFIXES))
+        else:
+            files.append(p)
+    return files
+
+
+def print_table(rows):
+    print(f"  {'artifact':<36} | {'lite':>4} | {'MB':>7} | {'load ms':>8} | {'1st inf ms':>10} | "
+          f"{'warm ms':>8} | {'peak RSS MB':>11}")
+    print(f"  {'-' * 36}-+-{'-' * 4}-+-{'-' * 7}-+-{'-' * 8}-+-{'-' * 10}-+-{'-' * 8}-+-{'-' * 11}")
+    for r in rows:
+        name = Path(r["file"]).name
+        print(f"  {name:<36} | {'yes' if r['lite_bytecode'] else 'no':>4} | {r['size_mb']:>7.1f} | "
+              f"{r['load_ms']:>8.1f} | {r['first_inference_ms']:>10.1f} | {r['warm_inference_ms']:>8.1f} | "
+              f"{r['peak_rss_mb']:>11.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold load / peak RSS / first inference benchmark for mobile artifacts")
+    parser.add_argument("artifacts", nargs="*", help="Model files or directories")
+    parser.add_argument("--kind", choices=("image", "text"), default=None, help="Override input type detection")
+    parser.add_argument("--threads", type=int, default=1, help="CPU threads (default 1, like a single big core)")
+    parser.add_argument("--repeat", type=int, default=3, help="Cold runs per artifact; the median is reported")
+    parser.add_argument("--json", default=None, help="Write results to this JSON file")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure_child(args.child, args.kind or infer_kind(args.child), args.threads)))
+        return
+
+    files = collect_artifacts(args.artifacts)
+    if not files:
+        parser.error("no artifacts given")
+    rows = []
+    for f in files:
+        print(f"⏱️ {f} ...")
+        runs = [run_cold(f, args.kind or infer_kind(f), args.threads) for _ in range(args.repeat)]
+        runs.sort(key=lambda r: r["load_ms"])
+        rows.append(runs[len(runs) // 2])
+    print_table(rows)
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump(rows, fh, indent=2)
+        print(f"📝 Results: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,22 @@
-# python tools/retrieval_check.py store.f32 dim query.json
-import sys, struct, json, math
-store, dim, qpath = sys.argv[1], int(sys.argv[2]), sys.argv[3]
-buf = open(store,'rb').read()
-n = len(buf)//(4*dim)
-vecs = [list(struct.unpack_from('<'+'f'*dim, buf, i*4*dim)) for i in range(n)]
-q = json.load(open(qpath))
-s = math.sqrt(sum(x*x for x in q)); q=[x/s for x in q]
-def cos(a,b): return sum(x*y for x,y in zip(a,b))
-scores = sorted([(i,cos(q,v)) for i,v in enumerate(vecs)], key=lambda x:-x[1])[:10]
-print(scores)
+# python tools/retrieval_check.py store.emb query.json [--k 10] [--chunk-rows 65536]
+# python tools/retrieval_check.py store.f32 dim query.json  (legacy headerless store)
+# query.json holds one vector, or a list of vectors for batch mode (one result line per query).
+import sys, argparse
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / 'tools'))
+from mira.clip import search
+from mira.clip.embedding_store import read_quant
+
+ap = argparse.ArgumentParser(description="Top-k inner-product search over an .emb or .f32 embedding store")
+ap.add_argument('store'); ap.add_argument('dim_or_query'); ap.add_argument('query', nargs='?')
+ap.add_argument('--k', type=int, default=search.DEFAULT_K)
+ap.add_argument('--chunk-rows', type=int, default=search.DEFAULT_CHUNK_ROWS)
+args = ap.parse_args()
+
+dim, query = (int(args.dim_or_query), args.query) if args.query else (None, args.dim_or_query)
+vecs = search.open_store(args.store, dim)
+q, batch = search.load_queries(query)
+q = search.normalize_rows(q)
+ids, scores = search.search(vecs, q, k=args.k, chunk_rows=args.chunk_rows, quant=read_quant(args.store))
+for row_ids, row_scores in zip(ids, scores):
+    print(search.format_results(row_ids, row_scores))
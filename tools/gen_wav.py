@@ -1,35 +1,304 @@
 #!/usr/bin/env python3
-"""Generate a 1-second 16kHz WAV tone for testing."""
-import sys
-import wave
+"""
+Generate 16kHz WAV test audio.
+
+Single file (1 s 440 Hz tone, as before):
+    python3 gen_wav.py <output.wav>
+
+Long tracks are synthesized and written in fixed-size blocks, so memory stays
+constant; the header is fixed up at the end and becomes RF64 past 4 GB:
+    python3 gen_wav.py long.wav --duration 10800 [--frequency 440] [--channels 1]
+
+Synthetic corpus for Whisper load testing, synthesized with NumPy and
+generated in parallel, with a manifest.json describing every file:
+    python3 gen_wav.py --corpus out/ --count 200 --duration 30 --kind random \
+        [--sample-rate 16000] [--channels 1] [--noise 0.02] [--gaps 3] [--workers N]
+"""
+import argparse
+import json
+import os
 import struct
-import math
-
-def generate_tone(output_path, duration=1.0, sample_rate=16000, frequency=440.0):
-    """Generate a sine wave tone and save as WAV."""
-    num_samples = int(duration * sample_rate)
-    samples = []
-    
-    for i in range(num_samples):
-        t = i / sample_rate
-        sample = math.sin(2 * math.pi * frequency * t)
-        # Convert to 16-bit PCM
-        pcm_sample = int(sample * 32767)
-        samples.append(pcm_sample)
-    
-    with wave.open(output_path, 'wb') as wav_file:
-        wav_file.setnchannels(1)  # Mono
-        wav_file.setsampwidth(2)  # 16-bit
-        wav_file.setframerate(sample_rate)
-        
-        for sample in samples:
-            wav_file.writeframes(struct.pack('<h', sample))
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+KINDS = ("tone", "chirp", "mix", "noise")
+MANIFEST_NAME = "manifest.json"
+BLOCK_FRAMES = 1 << 16
+NOISE_BLOCK = 1 << 16
+RIFF_LIMIT = 0xFFFFFFFF
+
+def tone_spec(duration=1.0, frequency=440.0, **extra):
+    """Spec for a plain sine tone."""
+    return dict(kind="tone", duration=duration, tones=[[frequency, 1.0]], **extra)
+
+def synthesize(spec, sample_rate, channels=1, start=0, count=None):
+    """
+    Float32 samples in [-1, 1] for frames [start, start + count) of `spec`.
+
+    Spec keys: duration (s), tones [[freq_hz, amp], ...], chirp [f0_hz, f1_hz],
+    noise (amplitude of white noise), gaps [[t0_ms, t1_ms], ...] of silence,
+    gain and seed. Returns an array of shape (count, channels).
+    """
+    total = int(spec["duration"] * sample_rate)
+    count = total - start if count is None else min(count, total - start)
+    # Phase needs float64: 2*pi*f*t reaches ~1e7 rad after an hour.
+    t = (start + np.arange(count, dtype=np.float64)) / sample_rate
+    signal = np.zeros(count, dtype=np.float64)
+
+    for freq, amp in spec.get("tones", []):
+        signal += amp * np.sin(2 * np.pi * freq * t)
+    if spec.get("chirp"):
+        f0, f1 = spec["chirp"]
+        sweep = (f1 - f0) / (2 * spec["duration"])
+        signal += np.sin(2 * np.pi * (f0 * t + sweep * t * t))
+
+    peak = sum(abs(a) for _, a in spec.get("tones", [])) + (1.0 if spec.get("chirp") else 0.0)
+    if peak > 1.0:
+        signal /= peak
+
+    out = np.repeat(signal.astype(np.float32)[:, None], channels, axis=1)
+    if spec.get("noise"):
+        out += white_noise(spec.get("seed", 0), start, count, channels) * np.float32(spec["noise"])
+    out *= np.float32(spec.get("gain", 0.9))
+
+    for t0_ms, t1_ms in spec.get("gaps", []):
+        a = max(int(t0_ms * sample_rate // 1000) - start, 0)
+        b = min(int(t1_ms * sample_rate // 1000) - start, count)
+        if a < b:
+            out[a:b] = 0
+    return out
+
+def white_noise(seed, start, count, channels):
+    """
+    Unit white noise for frames [start, start + count).
+
+    Drawn on a fixed NOISE_BLOCK grid, so the result does not depend on how
+    the file is split into blocks.
+    """
+    out = np.empty((count, channels), dtype=np.float32)
+    first, last = start // NOISE_BLOCK, (start + count - 1) // NOISE_BLOCK
+    for g in range(first, last + 1):
+        block = np.random.default_rng([seed, g]).standard_normal((NOISE_BLOCK, channels), dtype=np.float32)
+        a = max(start, g * NOISE_BLOCK)
+        b = min(start + count, (g + 1) * NOISE_BLOCK)
+        out[a - start:b - start] = block[a - g * NOISE_BLOCK:b - g * NOISE_BLOCK]
+    return out
+
+def to_pcm16(samples):
+    """Float samples in [-1, 1] to little-endian int16 PCM."""
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype('<i2')
+
+class WavStreamWriter:
+    """
+    16-bit PCM WAV writer that streams blocks in constant memory.
+
+    The header is written with placeholder sizes and a 28-byte JUNK chunk and
+    fixed up on close. Files whose RIFF size exceeds 32 bits are promoted in
+    place to RF64 (EBU Tech 3306): the JUNK chunk becomes ds64 and the 32-bit
+    size fields are set to 0xFFFFFFFF.
+    """
+
+    HEADER_BYTES = 12 + (8 + 28) + (8 + 16) + 8
+
+    def __init__(self, output_path, sample_rate, channels=1, force_rf64=False):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.force_rf64 = force_rf64
+        self.data_bytes = 0
+        self.fh = open(output_path, 'wb')
+        block_align = channels * 2
+        self.fh.write(b"RIFF" + struct.pack('<I', 0) + b"WAVE")
+        self.fh.write(b"JUNK" + struct.pack('<I', 28) + bytes(28))
+        self.fh.write(b"fmt " + struct.pack('<IHHIIHH', 16, 1, channels, sample_rate,
+                                            sample_rate * block_align, block_align, 16))
+        self.fh.write(b"data" + struct.pack('<I', 0))
+
+    def write(self, pcm):
+        """Append an (frames, channels) int16 block."""
+        data = np.ascontiguousarray(pcm, dtype='<i2').tobytes()
+        self.fh.write(data)
+        self.data_bytes += len(data)
+
+    @property
+    def frames(self):
+        return self.data_bytes // (2 * self.channels)
+
+    def close(self):
+        if self.fh.closed:
+            return
+        riff_size = self.HEADER_BYTES - 8 + self.data_bytes
+        if self.force_rf64 or riff_size > RIFF_LIMIT:
+            self.fh.seek(0)
+            self.fh.write(b"RF64" + struct.pack('<I', RIFF_LIMIT) + b"WAVE")
+            self.fh.write(b"ds64" + struct.pack('<IQQQI', 28, riff_size, self.data_bytes, self.frames, 0))
+            self.fh.seek(self.HEADER_BYTES - 4)
+            self.fh.write(struct.pack('<I', RIFF_LIMIT))
+        else:
+            self.fh.seek(4)
+            self.fh.write(struct.pack('<I', riff_size))
+            self.fh.seek(self.HEADER_BYTES - 4)
+            self.fh.write(struct.pack('<I', self.data_bytes))
+        self.fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def iter_pcm_blocks(spec, sample_rate, channels=1, block_frames=BLOCK_FRAMES):
+    """Yield int16 blocks of at most block_frames frames covering the whole spec."""
+    total = int(spec["duration"] * sample_rate)
+    for start in range(0, total, block_frames):
+        yield to_pcm16(synthesize(spec, sample_rate, channels, start, block_frames))
+
+def write_stream(output_path, blocks, sample_rate, channels=1, force_rf64=False):
+    """Write an iterable of PCM blocks; returns the number of frames written."""
+    with WavStreamWriter(output_path, sample_rate, channels, force_rf64) as writer:
+        for block in blocks:
+            writer.write(block)
+    return writer.frames
+
+def write_wav(output_path, pcm, sample_rate):
+    """Write an (frames, channels) int16 buffer in one call."""
+    pcm = np.asarray(pcm)
+    return write_stream(output_path, [pcm], sample_rate, pcm.shape[1] if pcm.ndim == 2 else 1)
+
+def generate_tone(output_path, duration=1.0, sample_rate=16000, frequency=440.0, channels=1,
+                  block_frames=BLOCK_FRAMES):
+    """Generate a sine wave tone and save as WAV, block by block."""
+    spec = tone_spec(duration, frequency, gain=1.0)
+    return write_stream(output_path, iter_pcm_blocks(spec, sample_rate, channels, block_frames),
+                        sample_rate, channels)
+
+def random_gaps(rng, duration, n_gaps, min_ms=300, max_ms=2000):
+    """Non-overlapping silence intervals [t0_ms, t1_ms], sorted."""
+    total_ms = int(duration * 1000)
+    if n_gaps <= 0 or total_ms <= max_ms:
+        return []
+    starts = np.sort(rng.choice(total_ms - max_ms, size=n_gaps, replace=False))
+    gaps, last_end = [], 0
+    for s in starts:
+        s = max(int(s), last_end)
+        e = min(s + int(rng.integers(min_ms, max_ms + 1)), total_ms)
+        if s < e:
+            gaps.append([s, e])
+            last_end = e
+    return gaps
+
+def corpus_specs(count, kind="random", duration=30.0, noise=0.0, gaps=0, seed=0):
+    """Deterministic per-file specs for a corpus."""
+    rng = np.random.default_rng(seed)
+    specs = []
+    for i in range(count):
+        k = KINDS[int(rng.integers(len(KINDS)))] if kind == "random" else kind
+        spec = {"kind": k, "duration": duration, "seed": seed * 1000003 + i, "gain": 0.9}
+        if k == "tone":
+            spec["tones"] = [[float(rng.uniform(100, 4000)), 1.0]]
+        elif k == "chirp":
+            f0, f1 = sorted(rng.uniform(50, 7500, size=2))
+            spec["chirp"] = [float(f0), float(f1)]
+        elif k == "mix":
+            n = int(rng.integers(2, 6))
+            spec["tones"] = [[float(f), float(a)] for f, a in
+                             zip(rng.uniform(80, 6000, size=n), rng.uniform(0.1, 1.0, size=n))]
+        if k == "noise":
+            spec["noise"] = max(noise, 0.3)
+        elif noise:
+            spec["noise"] = noise
+        spec["gaps"] = random_gaps(rng, duration, gaps)
+        specs.append(spec)
+    return specs
+
+def _write_corpus_file(task):
+    path, spec, sample_rate, channels = task
+    t0 = time.perf_counter()
+    write_stream(path, iter_pcm_blocks(spec, sample_rate, channels), sample_rate, channels)
+    return {
+        "file": os.path.basename(path),
+        "bytes": os.path.getsize(path),
+        "duration_ms": int(spec["duration"] * 1000),
+        "sr_hz": sample_rate,
+        "channels": channels,
+        "spec": spec,
+        "write_ms": round((time.perf_counter() - t0) * 1000, 1),
+    }
+
+def generate_corpus(output_dir, specs, sample_rate=16000, channels=1, workers=None):
+    """Write every spec as a WAV across a process pool; returns the manifest dict."""
+    os.makedirs(output_dir, exist_ok=True)
+    width = max(4, len(str(len(specs) - 1)))
+    tasks = [(os.path.join(output_dir, f"synth_{i:0{width}d}_{s['kind']}.wav"), s, sample_rate, channels)
+             for i, s in enumerate(specs)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        files = list(pool.map(_write_corpus_file, tasks))
+    manifest = {
+        "version": 1,
+        "sr_hz": sample_rate,
+        "channels": channels,
+        "count": len(files),
+        "total_duration_ms": sum(f["duration_ms"] for f in files),
+        "total_bytes": sum(f["bytes"] for f in files),
+        "files": files,
+    }
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def main_corpus(argv):
+    ap = argparse.ArgumentParser(description="Generate a synthetic WAV corpus for Whisper load testing")
+    ap.add_argument("--corpus", required=True, help="Output directory")
+    ap.add_argument("--count", type=int, default=10, help="Number of files")
+    ap.add_argument("--duration", type=float, default=30.0, help="Seconds per file")
+    ap.add_argument("--sample-rate", type=int, default=16000, help="Sample rate in Hz")
+    ap.add_argument("--channels", type=int, default=1, help="Channel count")
+    ap.add_argument("--kind", choices=KINDS + ("random",), default="random", help="Signal type")
+    ap.add_argument("--noise", type=float, default=0.0, help="White noise amplitude added to every file")
+    ap.add_argument("--gaps", type=int, default=0, help="Silence gaps per file (0.3-2 s each)")
+    ap.add_argument("--seed", type=int, default=0, help="Corpus seed")
+    ap.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    args = ap.parse_args(argv)
+
+    specs = corpus_specs(args.count, args.kind, args.duration, args.noise, args.gaps, args.seed)
+    t0 = time.time()
+    manifest = generate_corpus(args.corpus, specs, args.sample_rate, args.channels, args.workers)
+    elapsed = time.time() - t0
+    hours = manifest["total_duration_ms"] / 3.6e6
+    print(f"Generated {manifest['count']} files, {hours:.2f} h of audio, "
+          f"{manifest['total_bytes'] / 2**20:.1f} MiB in {elapsed:.2f}s")
+    print(f"Manifest: {os.path.join(args.corpus, MANIFEST_NAME)}")
+
+def main_single(argv):
+    ap = argparse.ArgumentParser(description="Generate a sine tone WAV, streamed block by block")
+    ap.add_argument("output", help="Output .wav path")
+    ap.add_argument("--duration", type=float, default=1.0, help="Seconds (hours-long tracks are fine)")
+    ap.add_argument("--frequency", type=float, default=440.0, help="Tone frequency in Hz")
+    ap.add_argument("--sample-rate", type=int, default=16000, help="Sample rate in Hz")
+    ap.add_argument("--channels", type=int, default=1, help="Channel count")
+    ap.add_argument("--block-frames", type=int, default=BLOCK_FRAMES, help="Frames synthesized per block")
+    args = ap.parse_args(argv)
+
+    t0 = time.time()
+    generate_tone(args.output, args.duration, args.sample_rate, args.frequency, args.channels, args.block_frames)
+    size = os.path.getsize(args.output)
+    print(f"Generated {args.duration:g}s {args.sample_rate / 1000:g}kHz tone: {args.output} "
+          f"({size / 2**20:.1f} MiB{', RF64' if size > RIFF_LIMIT else ''}) in {time.time() - t0:.2f}s")
 
 if __name__ == "__main__":
+    if "--corpus" in sys.argv[1:]:
+        main_corpus(sys.argv[1:])
+        sys.exit(0)
+    if len(sys.argv) > 2:
+        main_single(sys.argv[1:])
+        sys.exit(0)
     if len(sys.argv) != 2:
-        print("Usage: python3 gen_wav.py <output.wav>")
+        print("Usage: python3 gen_wav.py <output.wav> [--duration S] [--frequency HZ] [--channels N]")
+        print("       python3 gen_wav.py --corpus <dir> [--count N] [--duration S] [--kind random] ...")
         sys.exit(1)
-    
+
     output_path = sys.argv[1]
     generate_tone(output_path)
     print(f"Generated 1s 16kHz tone: {output_path}")
@@ -0,0 +1,5 @@
+"""
+Mira host-side tooling.
+Python counterparts of the on-device com.mira.clip / com.mira.whisper modules,
+used to build, inspect and benchmark app artifacts on workstations and servers.
+"""
@@ -0,0 +1,3 @@
+"""
+Host-side CLIP retrieval tooling (mirrors com.mira.clip).
+"""
@@ -0,0 +1,280 @@
+"""
+Content-Addressed Embedding Cache
+Frame embeddings keyed by (media sha256, timestamp ms, model sha256), so a
+re-ingest only runs the image encoder on frames it has not seen with the
+same model. Renamed or moved videos still hit; a re-exported model
+(different SHA256, as printed by export_clip_torchscript.py) misses.
+
+  <dir>/meta.json        {"version", "dim", "generation"}
+  <dir>/vectors.<g>.f32  append-only float32 rows, read through a memmap
+  <dir>/index.<g>.bin    append-only log of (key, slot, tick) records; the
+                         last record for a key wins, later ticks mark use
+
+Vectors are flushed before their index records, so a crash leaves at most
+some unreferenced rows. When the blob grows past max_bytes, close() keeps
+the most recently used entries (down to LOW_WATER of the cap) and writes
+them as a new generation; meta.json is replaced atomically last, so readers
+always see a consistent pair of files.
+
+Usage:
+    cd tools && python3 -m mira.clip.embed_cache <cache_dir> [--max-gb 4] [--compact]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+VERSION = 1
+KEY_BYTES = 16
+INDEX_DTYPE = np.dtype([("key", f"V{KEY_BYTES}"), ("slot", "<i8"), ("tick", "<i8")])
+LOW_WATER = 0.8
+HASH_CHUNK = 1 << 20
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cache_key(media_sha, ts_ms, model_sha):
+    """16-byte key of one frame embedding."""
+    return hashlib.sha256(f"{media_sha}:{int(ts_ms)}:{model_sha}".encode()).digest()[:KEY_BYTES]
+
+
+class EmbeddingCache:
+    """Append-only memmapped vector blob + (key -> slot) index with LRU eviction."""
+
+    def __init__(self, root, dim=None, max_bytes=None, readonly=False):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.readonly = readonly
+        self.hits = self.misses = 0
+        meta_path = self.root / "meta.json"
+        if meta_path.exists():
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("version") != VERSION:
+                raise ValueError(f"{meta_path}: unsupported cache version {meta.get('version')}")
+            if dim is not None and meta["dim"] != dim:
+                raise ValueError(f"{meta_path}: cache dim {meta['dim']} != {dim}")
+            self.dim, self.generation = meta["dim"], meta["generation"]
+        elif readonly or dim is None:
+            raise FileNotFoundError(f"No embedding cache at {self.root}")
+        else:
+            self.dim, self.generation = dim, 0
+            self.root.mkdir(parents=True, exist_ok=True)
+            self._write_meta()
+        self.row_bytes = self.dim * 4
+        self._load()
+        self._touched = {}
+        self.vec_fh = self.idx_fh = None
+        if not readonly:
+            self.vec_fh = open(self.vectors_path, "ab")
+            self.idx_fh = open(self.index_path, "ab")
+
+    @property
+    def vectors_path(self):
+        return self.root / f"vectors.{self.generation}.f32"
+
+    @property
+    def index_path(self):
+        return self.root / f"index.{self.generation}.bin"
+
+    def _write_meta(self):
+        tmp = self.root / "meta.json.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": VERSION, "dim": self.dim, "generation": self.generation}, f)
+        os.replace(tmp, self.root / "meta.json")
+
+    def _load(self):
+        """Replays the index log; entries pointing past the last complete row are dropped."""
+        size = self.vectors_path.stat().st_size if self.vectors_path.exists() else 0
+        self.rows = size // self.row_bytes
+        if not self.readonly and size != self.rows * self.row_bytes:
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(self.rows * self.row_bytes)
+        log = np.zeros(0, dtype=INDEX_DTYPE)
+        if self.index_path.exists():
+            n = self.index_path.stat().st_size // INDEX_DTYPE.itemsize
+            if not self.readonly and self.index_path.stat().st_size != n * INDEX_DTYPE.itemsize:
+                with open(self.index_path, "r+b") as f:
+                    f.truncate(n * INDEX_DTYPE.itemsize)  # torn last record
+            log = np.fromfile(self.index_path, dtype=INDEX_DTYPE, count=n)
+        self.log_records = len(log)
+        self.index = {}
+        for key, slot, tick in zip(log["key"].tolist(), log["slot"].tolist(), log["tick"].tolist()):
+            if slot < self.rows:
+                self.index[key] = (slot, tick)
+        self._map()
+
+    def _map(self):
+        self.vectors = (np.memmap(self.vectors_path, dtype="<f4", mode="r", shape=(self.rows, self.dim))
+                        if self.rows else np.zeros((0, self.dim), dtype=np.float32))
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    @property
+    def nbytes(self):
+        return self.rows * self.row_bytes
+
+    def get(self, key):
+        """Cached vector (a copy) or None; a hit refreshes the key's LRU tick."""
+        entry = self.index.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._touched[key] = entry[0]
+        return np.array(self.vectors[entry[0]])
+
+    def touch(self, keys):
+        """Marks keys used (e.g. hits served by a read-only copy in another process)."""
+        for key in keys:
+            entry = self.index.get(key)
+            if entry is not None:
+                self._touched[key] = entry[0]
+
+    def put_many(self, keys, vectors):
+        if self.readonly:
+            raise ValueError("Cache opened read-only")
+        vectors = np.ascontiguousarray(vectors, dtype="<f4")
+        if vectors.ndim != 2 or vectors.shape[1] != self.dim or len(vectors) != len(keys):
+            raise ValueError(f"Expected ({len(keys)}, {self.dim}) vectors, got {vectors.shape}")
+        first = {}
+        for i, key in enumerate(keys):
+            if key not in self.index:
+                first.setdefault(key, i)
+        fresh = list(first.values())
+        if not fresh:
+            return
+        tick = time.time_ns()
+        rec = np.zeros(len(fresh), dtype=INDEX_DTYPE)
+        rec["key"] = [keys[i] for i in fresh]
+        rec["slot"] = np.arange(self.rows, self.rows + len(fresh))
+        rec["tick"] = tick
+        self.vec_fh.write(vectors[fresh].tobytes())
+        self.vec_fh.flush()
+        self.idx_fh.write(rec.tobytes())
+        self.idx_fh.flush()
+        for key, slot in zip(rec["key"].tolist(), rec["slot"].tolist()):
+            self.index[key] = (slot, tick)
+        self.rows += len(fresh)
+        self.log_records += len(fresh)
+        self._map()
+
+    def _flush_touches(self):
+        if not self._touched:
+            return
+        tick = time.time_ns()
+        rec = np.zeros(len(self._touched), dtype=INDEX_DTYPE)
+        rec["key"] = list(self._touched)
+        rec["slot"] = list(self._touched.values())
+        rec["tick"] = tick
+        self.idx_fh.write(rec.tobytes())
+        self.idx_fh.flush()
+        for key, slot in self._touched.items():
+            self.index[key] = (slot, tick)
+        self.log_records += len(rec)
+        self._touched = {}
+
+    def compact(self, max_bytes=None):
+        """Rewrites live entries (most recently used first, within max_bytes) as a new generation."""
+        if self.readonly:
+            raise ValueError("Cache opened read-only")
+        self._flush_touches()
+        entries = sorted(self.index.items(), key=lambda kv: kv[1][1], reverse=True)
+        if max_bytes is not None:
+            entries = entries[:max(0, int(max_bytes) // self.row_bytes)]
+        entries.sort(key=lambda kv: kv[1][0])  # sequential reads from the old blob
+        old_vectors, old_index = self.vectors_path, self.index_path
+        self.vec_fh.close()
+        self.idx_fh.close()
+        self.generation += 1
+        rec = np.zeros(len(entries), dtype=INDEX_DTYPE)
+        with open(self.vectors_path, "wb") as f:
+            for start in range(0, len(entries), 65536):
+                part = entries[start:start + 65536]
+                f.write(np.ascontiguousarray(self.vectors[[slot for _, (slot, _) in part]], dtype="<f4").tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        if entries:
+            rec["key"] = [key for key, _ in entries]
+            rec["slot"] = np.arange(len(entries))
+            rec["tick"] = [tick for _, (_, tick) in entries]
+        with open(self.index_path, "wb") as f:
+            f.write(rec.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self._write_meta()
+        self.vectors = None
+        for old in (old_vectors, old_index):
+            old.unlink(missing_ok=True)
+        evicted = len(self.index) - len(entries)
+        self._load()
+        self.vec_fh = open(self.vectors_path, "ab")
+        self.idx_fh = open(self.index_path, "ab")
+        return evicted
+
+    def close(self):
+        """Persists LRU ticks and evicts down to LOW_WATER * max_bytes if over the cap; returns evicted count."""
+        if self.readonly or self.vec_fh is None:
+            return 0
+        evicted = 0
+        self._flush_touches()
+        if self.max_bytes is not None and self.nbytes > self.max_bytes:
+            evicted = self.compact(self.max_bytes * LOW_WATER)
+        elif self.log_records > 4 * max(len(self.index), 1024):
+            self.compact()  # mostly touch records: shrink the log
+        for fh in (self.vec_fh, self.idx_fh):
+            fh.flush()
+            os.fsync(fh.fileno())
+            fh.close()
+        self.vec_fh = None
+        return evicted
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Inspect or compact a content-addressed embedding cache")
+    ap.add_argument("cache", help="Cache directory")
+    ap.add_argument("--max-gb", type=float, default=None, help="Evict least recently used entries down to this size")
+    ap.add_argument("--compact", action="store_true", help="Rewrite live entries into a new generation")
+    args = ap.parse_args()
+
+    try:
+        cache = EmbeddingCache(args.cache)
+    except (OSError, ValueError) as e:
+        print(f"❌ Error opening cache: {e}")
+        sys.exit(1)
+    print(f"📁 {args.cache}: {len(cache):,} entries, dim {cache.dim}, {cache.nbytes / 2**20:,.1f} MiB, "
+          f"generation {cache.generation}, {cache.log_records:,} index records")
+    evicted = 0
+    if args.max_gb is not None:
+        evicted = cache.compact(args.max_gb * 2**30)
+    elif args.compact:
+        cache.compact()
+    cache.close()
+    if args.max_gb is not None or args.compact:
+        print(f"✅ Compacted: {len(cache):,} entries kept, {evicted:,} evicted, {cache.nbytes / 2**20:,.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
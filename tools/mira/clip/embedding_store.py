@@ -0,0 +1,416 @@
+"""
+Embedding Store
+Host-side embedding stores, in two layouts:
+
+  .emb  self-describing store (FORMAT_VERSION 1), the default for new stores:
+
+        0   magic "MIRAEMB\\0"
+        8   u16 version, u16 dtype (0 float32, 1 float16, 2 int8), u32 dim
+        16  u64 count        rows committed; written last on every append
+        24  u64 data_offset  start of the vector block, a multiple of 64
+        32  32-byte model sha256 (zeros if unknown)
+        64  int8 only: float32 scale[dim], offset[dim]
+        data_offset ... count rows of dim values, little-endian, contiguous
+
+        int8 rows are unsigned codes c with x ~= offset + scale * c per
+        dimension (see quantize.py); float input is quantized on append
+
+  .f32  legacy headerless float32 rows (EmbeddingStore.writeVector extended
+        to many rows); dim has to be known by the reader
+
+Both keep a parallel ids sidecar, one JSON object per row:
+
+  <name>.ids.jsonl  {"id", "video", "frame", "ts_ms", "source"} for frames
+  <name>.ids.idx    .emb only: u64 end offset of each row's line, so id i is
+                    one seek away and a torn tail is trimmed without a scan
+
+An .emb append writes vectors, then ids, then offsets, and only then bumps
+count in the header; rows past count are ignored by readers and trimmed on
+the next open, so appends are O(1) and an interrupted ingest resumes
+cleanly. Legacy stores are repaired by trimming both files to the rows they
+agree on.
+
+open_vectors maps either layout zero-copy with np.memmap. convert_legacy
+turns a legacy .f32 store, or a directory of per-video <id>.f32 vectors
+(+ <id>.json Meta), into an .emb store.
+
+Usage:
+    cd tools && python3 -m mira.clip.embedding_store out/clip_vit_b32/embeddings.emb
+    cd tools && python3 -m mira.clip.embedding_store out/embeddings.emb --from old/embeddings.f32 --dim 512 \
+        [--model ../mobile_models/clip_image_encoder.ptl | --model-sha HEX]
+    cd tools && python3 -m mira.clip.embedding_store out/videos.emb --from out/videos/clip_vit_b32_mean_v1/
+"""
+
+import argparse
+import json
+import os
+import struct
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+MAGIC = b"MIRAEMB\x00"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sHHIQQ32s")
+COUNT_OFFSET = 16
+ALIGN = 64
+DTYPES = {"float32": (0, "<f4"), "float16": (1, "<f2"), "int8": (2, "u1")}
+DTYPE_NAMES = {code: name for name, (code, _) in DTYPES.items()}
+STORE_SUFFIX = ".emb"
+LEGACY_SUFFIX = ".f32"
+IDS_SUFFIX = ".ids.jsonl"
+OFFSETS_SUFFIX = ".ids.idx"
+CONVERT_CHUNK_ROWS = 65536
+
+
+def ids_path(store_path):
+    p = Path(store_path)
+    return p.with_name(p.stem + IDS_SUFFIX)
+
+
+def offsets_path(store_path):
+    p = Path(store_path)
+    return p.with_name(p.stem + OFFSETS_SUFFIX)
+
+
+def align(n, to=ALIGN):
+    return (n + to - 1) // to * to
+
+
+@dataclass
+class StoreHeader:
+    """The fixed 64-byte header of an .emb store."""
+    dim: int
+    dtype: str = "float32"
+    count: int = 0
+    data_offset: int = align(HEADER.size)
+    model_sha: str = ""
+    version: int = FORMAT_VERSION
+
+    @property
+    def np_dtype(self):
+        return np.dtype(DTYPES[self.dtype][1])
+
+    @property
+    def row_bytes(self):
+        return self.dim * self.np_dtype.itemsize
+
+    def pack(self):
+        sha = bytes.fromhex(self.model_sha) if self.model_sha else b""
+        if len(sha) not in (0, 32):
+            raise ValueError(f"model sha must be 64 hex digits, got {self.model_sha!r}")
+        return HEADER.pack(MAGIC, self.version, DTYPES[self.dtype][0], self.dim, self.count,
+                           self.data_offset, sha.ljust(32, b"\x00"))
+
+    @classmethod
+    def unpack(cls, raw, path="store"):
+        magic, version, dtype, dim, count, data_offset, sha = HEADER.unpack(raw)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not an {STORE_SUFFIX} store")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported store version {version}")
+        if dtype not in DTYPE_NAMES:
+            raise ValueError(f"{path}: unknown dtype code {dtype}")
+        if data_offset % ALIGN or data_offset < HEADER.size:
+            raise ValueError(f"{path}: bad data offset {data_offset}")
+        return cls(dim, DTYPE_NAMES[dtype], count, data_offset, sha.hex() if any(sha) else "", version)
+
+
+def quantize_int8(x, quant):
+    """float rows -> uint8 codes under (scale, offset)."""
+    scale, offset = quant
+    codes = (np.asarray(x, dtype=np.float32) - offset) / scale
+    return np.clip(np.rint(codes), 0, 255).astype(np.uint8)
+
+
+def dequantize(rows, quant=None):
+    """float32 rows of any store dtype (quant = (scale, offset) for int8)."""
+    rows = np.asarray(rows, dtype=np.float32)
+    return rows if quant is None else rows * quant[0] + quant[1]
+
+
+def read_header(path):
+    """StoreHeader of an .emb store, or None for a legacy headerless file."""
+    with open(path, "rb") as f:
+        raw = f.read(HEADER.size)
+    if len(raw) < HEADER.size or not raw.startswith(MAGIC):
+        return None
+    return StoreHeader.unpack(raw, path)
+
+
+def open_vectors(path, dim=None):
+    """Memory-map a store as a read-only (N, dim) matrix; dim is required only for legacy files."""
+    header = read_header(path)
+    if header is not None:
+        if dim is not None and dim != header.dim:
+            raise ValueError(f"{path}: store dim is {header.dim}, not {dim}")
+        size = os.path.getsize(path)
+        if size < header.data_offset + header.count * header.row_bytes:
+            raise ValueError(f"{path}: truncated ({size} bytes for {header.count} rows)")
+        if header.count == 0:
+            return np.zeros((0, header.dim), dtype=header.np_dtype)
+        return np.memmap(path, dtype=header.np_dtype, mode="r", offset=header.data_offset,
+                         shape=(header.count, header.dim))
+    if not dim:
+        raise ValueError(f"{path} is a headerless legacy store; pass its dim")
+    itemsize = np.dtype("<f4").itemsize
+    size = os.path.getsize(path)
+    if size % (itemsize * dim) != 0:
+        raise ValueError(f"File size {size} is not a multiple of dim*4 ({dim * itemsize})")
+    n = size // (itemsize * dim)
+    if n == 0:
+        return np.zeros((0, dim), dtype="<f4")
+    return np.memmap(path, dtype="<f4", mode="r", shape=(n, dim))
+
+
+def read_quant(path, header=None):
+    """(scale, offset) float32 arrays of an int8 store, else None."""
+    header = header or read_header(path)
+    if header is None or header.dtype != "int8":
+        return None
+    params = np.fromfile(path, dtype="<f4", count=2 * header.dim, offset=HEADER.size)
+    if params.size != 2 * header.dim:
+        raise ValueError(f"{path}: truncated quantization parameters")
+    return params[:header.dim], params[header.dim:]
+
+
+def read_id_records(store_path):
+    """Row records of a store's ids sidecar ([] if it does not exist); uncommitted rows are left out."""
+    path = ids_path(store_path)
+    if not path.exists():
+        return []
+    limit = None
+    if Path(store_path).exists():
+        header = read_header(store_path)
+        limit = header.count if header is not None else None
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.endswith("\n") or (limit is not None and len(records) == limit):
+                break  # torn last line from an interrupted write
+            records.append(json.loads(line))
+    return records
+
+
+def read_id(store_path, row):
+    """Record of one row of an .emb store, located through the offsets table."""
+    offsets = np.memmap(offsets_path(store_path), dtype="<u8", mode="r")
+    start = int(offsets[row - 1]) if row else 0
+    with open(ids_path(store_path), "rb") as f:
+        f.seek(start)
+        return json.loads(f.read(int(offsets[row]) - start))
+
+
+class AppendStore:
+    """Appends (vectors, id records) batches to a store and its ids sidecar.
+
+    Paths ending in .f32 use the legacy headerless layout; anything else is an
+    .emb store, created with dim/dtype/model_sha when it does not exist yet
+    (int8 stores also need quant = (scale, offset)).
+    """
+
+    def __init__(self, path, dim=None, fsync=False, model_sha=None, dtype="float32", quant=None):
+        self.path = Path(path)
+        self.fsync = fsync
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        exists = self.path.exists() and self.path.stat().st_size > 0
+        self.header = read_header(self.path) if exists else None
+        self.legacy = self.header is None and (exists or self.path.suffix == LEGACY_SUFFIX)
+        if self.header is not None:
+            if dim is not None and dim != self.header.dim:
+                raise ValueError(f"{self.path}: store dim is {self.header.dim}, not {dim}")
+            if model_sha and self.header.model_sha and model_sha != self.header.model_sha:
+                raise ValueError(f"{self.path}: store was written with model {self.header.model_sha[:12]}, "
+                                 f"not {model_sha[:12]}")
+        elif not self.legacy:
+            if dim is None:
+                raise ValueError(f"{self.path}: dim is required to create a store")
+            if dtype not in DTYPES:
+                raise ValueError(f"Unknown dtype {dtype!r} (expected one of {', '.join(DTYPES)})")
+            self.header = StoreHeader(dim, dtype, model_sha=model_sha or "")
+            params = b""
+            if dtype == "int8":
+                if quant is None:
+                    raise ValueError(f"{self.path}: int8 stores need quantization parameters")
+                params = np.concatenate([np.asarray(q, dtype="<f4").reshape(dim) for q in quant]).tobytes()
+                self.header.data_offset = align(HEADER.size + len(params))
+            with open(self.path, "wb") as f:
+                f.write((self.header.pack() + params).ljust(self.header.data_offset, b"\x00"))
+        elif dim is None:
+            raise ValueError(f"{self.path}: dim is required for a legacy store")
+        self.dim = self.header.dim if self.header else dim
+        self.quant = read_quant(self.path, self.header) if self.header else None
+        self.count = self._repair()
+        self.vec_fh = open(self.path, "ab")
+        self.ids_fh = open(ids_path(self.path), "ab")
+        self.ids_end = self.ids_fh.tell()
+        self.idx_fh = open(offsets_path(self.path), "ab") if self.header else None
+        # Separate handle: pwrite on an O_APPEND descriptor would append instead.
+        self.hdr_fh = open(self.path, "r+b") if self.header else None
+
+    def _repair(self):
+        """Trim the files to the committed rows; returns that row count."""
+        if self.header is None:
+            return self._repair_legacy()
+        rows = self.header.count
+        with open(self.path, "r+b") as f:
+            f.truncate(self.header.data_offset + rows * self.header.row_bytes)
+        offsets = offsets_path(self.path)
+        table = np.fromfile(offsets, dtype="<u8") if offsets.exists() else np.zeros(0, dtype="<u8")
+        if len(table) < rows:
+            raise ValueError(f"{self.path}: ids offsets table has {len(table)} rows, header says {rows}")
+        with open(offsets, "ab") as f:
+            f.truncate(rows * 8)
+        with open(ids_path(self.path), "ab") as f:
+            f.truncate(int(table[rows - 1]) if rows else 0)
+        return rows
+
+    def _repair_legacy(self):
+        row_bytes = self.dim * 4
+        size = self.path.stat().st_size if self.path.exists() else 0
+        ids = ids_path(self.path)
+        # Without a sidecar every complete row counts as committed; only the record count of an
+        # existing sidecar may cut rows off.
+        rows = min(size // row_bytes, len(read_id_records(self.path))) if ids.exists() else size // row_bytes
+        if size != rows * row_bytes:
+            with open(self.path, "r+b" if self.path.exists() else "wb") as f:
+                f.truncate(rows * row_bytes)
+        if not ids.exists() and rows:
+            # Row-numbered ids for the existing rows keep later appends aligned with the sidecar.
+            with open(ids, "wb") as f:
+                for start in range(0, rows, CONVERT_CHUNK_ROWS):
+                    f.write("".join(json.dumps({"id": str(i)}) + "\n"
+                                    for i in range(start, min(start + CONVERT_CHUNK_ROWS, rows))).encode("utf-8"))
+        elif ids.exists():
+            with open(ids, "r+b") as f:
+                keep = 0
+                for _ in range(rows):
+                    keep += len(f.readline())
+                f.truncate(keep)
+        return rows
+
+    def append(self, vectors, records):
+        vectors = np.asarray(vectors)
+        if vectors.ndim != 2 or vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected (n, {self.dim}) vectors, got {vectors.shape}")
+        if len(records) != len(vectors):
+            raise ValueError(f"{len(vectors)} vectors but {len(records)} id records")
+        dtype = self.header.np_dtype if self.header else np.dtype("<f4")
+        if self.quant is not None:
+            vectors = quantize_int8(vectors, self.quant)
+        lines = [(json.dumps(r, ensure_ascii=False) + "\n").encode("utf-8") for r in records]
+        self.vec_fh.write(np.ascontiguousarray(vectors, dtype=dtype).tobytes())
+        self.vec_fh.flush()
+        self.ids_fh.write(b"".join(lines))
+        self.ids_fh.flush()
+        handles = [self.vec_fh, self.ids_fh]
+        if self.idx_fh is not None:
+            ends = self.ids_end + np.cumsum([len(line) for line in lines], dtype=np.uint64)
+            self.idx_fh.write(ends.astype("<u8").tobytes())
+            self.idx_fh.flush()
+            handles.append(self.idx_fh)
+        if self.fsync:
+            for fh in handles:
+                os.fsync(fh.fileno())
+        self.ids_end += sum(len(line) for line in lines)
+        self.count += len(vectors)
+        if self.header is not None:
+            # Commit point: readers only see rows once count covers them.
+            self.header.count = self.count
+            os.pwrite(self.hdr_fh.fileno(), struct.pack("<Q", self.count), COUNT_OFFSET)
+            if self.fsync:
+                os.fsync(self.hdr_fh.fileno())
+
+    def close(self):
+        for fh in (self.vec_fh, self.ids_fh, self.idx_fh, self.hdr_fh):
+            if fh is not None and not fh.closed:
+                fh.flush()
+                if self.fsync:
+                    os.fsync(fh.fileno())
+                fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _legacy_dir_items(src):
+    """(id, vector, Meta dict) for every per-video <id>.f32 under src, in path order."""
+    for path in sorted(Path(src).rglob("*" + LEGACY_SUFFIX)):
+        meta_path = path.with_suffix(".json")
+        meta = {}
+        if meta_path.exists():
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        yield str(path.relative_to(src).with_suffix("")), np.fromfile(path, dtype="<f4"), meta
+
+
+def convert_legacy(src, dst, dim=None, model_sha=None, chunk_rows=CONVERT_CHUNK_ROWS):
+    """Writes a legacy .f32 store (needs dim) or a directory of per-video vectors into a new .emb store."""
+    src, dst = Path(src), Path(dst)
+    if dst.exists():
+        raise FileExistsError(f"{dst} already exists")
+    if src.is_dir():
+        items = list(_legacy_dir_items(src))
+        if not items:
+            raise ValueError(f"No {LEGACY_SUFFIX} files under {src}")
+        dims = {len(vec) for _, vec, _ in items}
+        if len(dims) != 1 or (dim and dims != {dim}):
+            raise ValueError(f"{src}: vector sizes {sorted(dims)} do not match a single dim")
+        with AppendStore(dst, dims.pop(), model_sha=model_sha) as out:
+            for start in range(0, len(items), chunk_rows):
+                part = items[start:start + chunk_rows]
+                out.append(np.stack([vec for _, vec, _ in part]),
+                           [{"id": vid, **{k: v for k, v in meta.items() if k != "id"}} for vid, _, meta in part])
+            return out.count
+    vectors = open_vectors(src, dim)
+    records = read_id_records(src)
+    if records and len(records) < len(vectors):
+        raise ValueError(f"{src}: {len(vectors)} rows but only {len(records)} id records")
+    with AppendStore(dst, vectors.shape[1], model_sha=model_sha) as out:
+        for start in range(0, len(vectors), chunk_rows):
+            stop = min(start + chunk_rows, len(vectors))
+            out.append(vectors[start:stop], records[start:stop] if records else
+                       [{"id": f"{src.stem}#{i}"} for i in range(start, stop)])
+        return out.count
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Inspect an .emb embedding store or convert legacy .f32 files into one")
+    ap.add_argument("store", help=f"{STORE_SUFFIX} store (or legacy {LEGACY_SUFFIX} with --dim)")
+    ap.add_argument("--from", dest="src", default=None, help="Legacy .f32 store or directory of per-video .f32 files to convert")
+    ap.add_argument("--dim", type=int, default=None, help="Dimension of a legacy .f32 store")
+    ap.add_argument("--model", default=None, help="Model file whose SHA256 is recorded in the header")
+    ap.add_argument("--model-sha", default=None, help="Model SHA256 (hex) recorded in the header")
+    args = ap.parse_args()
+
+    try:
+        if args.src:
+            model_sha = args.model_sha
+            if args.model:
+                from .embed_cache import file_sha256
+                model_sha = file_sha256(args.model)
+            rows = convert_legacy(args.src, args.store, args.dim, model_sha)
+            print(f"✅ Converted {rows:,} rows from {args.src}")
+        header = read_header(args.store)
+        vectors = open_vectors(args.store, args.dim)
+    except (OSError, ValueError) as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+
+    if header is None:
+        print(f"📁 {args.store}: legacy headerless float32, {len(vectors):,} rows x {vectors.shape[1]}")
+    else:
+        print(f"📁 {args.store}: {STORE_SUFFIX} v{header.version}, {header.count:,} rows x {header.dim} {header.dtype}, "
+              f"data at {header.data_offset}")
+        print(f"  model sha256: {header.model_sha or 'unknown'}")
+    records = read_id_records(args.store)
+    print(f"  ids: {len(records):,} records" + (f", first {records[0].get('id')!r}" if records else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""
+Faiss Segment Compaction
+Packs many small segments of a FaissManifest variant into large shards
+with bounded memory, then republishes the manifest atomically.
+
+This is the host-side implementation of what FaissCompactionWorker leaves
+as a TODO. Segments are concatenated in ts order (not a k-way merge by id),
+one open segment at a time, in fixed-size chunks:
+
+  * IVF segments that share the first segment's trained quantizer (coarse
+    centroids and PQ codebooks, as produced by ivfpq_train) are moved with
+    IndexIVF.merge_from, which copies codes and ids between inverted lists
+    without decoding.
+  * IVF segments trained separately, and Flat / IDMap / HNSW segments, are
+    reconstructed chunk by chunk and re-added (re-encoded) to the shard.
+
+Memory is bounded by one output shard plus one chunk. Shards go through
+.staging + fsync + rename (publish_segment), the manifest is replaced via
+temp file + fsync + rename, and only then are the old segment files removed.
+If compaction fails, shards it already published are deleted again.
+
+Usage:
+    cd tools && python3 -m mira.clip.faiss_compact <variant_dir|MANIFEST.json> \
+        [--target-n 512] [--min-segments 16] [--shard-n 262144] [--queries 200]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from . import faiss_manifest as fm
+from .faiss_search import ShardedSearch, import_faiss, labels_are_ids, read_index_mmap
+
+DEFAULT_SHARD_N = 262144
+DEFAULT_CHUNK_ROWS = 16384
+
+
+def segment_kind(index):
+    """'ivf' when codes can be merged directly, otherwise 'vectors'."""
+    faiss = import_faiss()
+    return "ivf" if faiss.try_extract_index_ivf(index) is not None else "vectors"
+
+
+def empty_like(index):
+    """A new, empty index of the same type and training state."""
+    faiss = import_faiss()
+    out = faiss.clone_index(index)
+    out.reset()
+    return out
+
+
+def _ivf_shape(ivf):
+    return type(ivf), ivf.d, ivf.nlist, ivf.code_size, ivf.metric_type
+
+
+def same_quantizer(a, b):
+    """True when two IVF indexes share coarse centroids and codebooks, so merge_from is valid."""
+    faiss = import_faiss()
+    ia, ib = faiss.extract_index_ivf(a), faiss.extract_index_ivf(b)
+    if _ivf_shape(ia) != _ivf_shape(ib):
+        return False
+    if not np.array_equal(ia.quantizer.reconstruct_n(0, ia.nlist), ib.quantizer.reconstruct_n(0, ib.nlist)):
+        return False
+    pa, pb = getattr(ia, "pq", None), getattr(ib, "pq", None)
+    return pa is None or np.array_equal(faiss.vector_to_array(pa.centroids), faiss.vector_to_array(pb.centroids))
+
+
+def iter_chunks(index, ids, chunk_rows):
+    """Yield (vectors, ids) chunks reconstructed from a segment (IVF rows are looked up by id)."""
+    faiss = import_faiss()
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+        for start in range(0, len(ids), chunk_rows):
+            chunk = np.ascontiguousarray(ids[start:start + chunk_rows], dtype=np.int64)
+            yield index.reconstruct_batch(chunk), chunk
+        return
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        ids = faiss.vector_to_array(index.id_map)
+        index = faiss.downcast_index(index.index)
+    for start in range(0, index.ntotal, chunk_rows):
+        n = min(chunk_rows, index.ntotal - start)
+        yield index.reconstruct_n(start, n), ids[start:start + n]
+
+
+class ShardWriter:
+    """Accumulates rows into one output shard and publishes it when full."""
+
+    def __init__(self, variant_dir, template, shard_n):
+        self.variant_dir = variant_dir
+        self.template = template
+        self.shard_n = shard_n
+        self.published = []
+        self._reset()
+
+    def _reset(self):
+        self.index = empty_like(self.template)
+        self.ids = []
+        self.count = 0
+
+    def _native_ids(self):
+        return labels_are_ids(self.index)
+
+    def add_vectors(self, vecs, ids):
+        while len(ids):
+            room = self.shard_n - self.count
+            take = min(room, len(ids))
+            v, i = np.ascontiguousarray(vecs[:take]), ids[:take]
+            if self._native_ids():
+                self.index.add_with_ids(v, i)
+            else:
+                self.index.add(v)
+            self.ids.append(np.asarray(i, dtype=np.int64))
+            self.count += take
+            vecs, ids = vecs[take:], ids[take:]
+            if self.count >= self.shard_n:
+                self.flush()
+
+    def merge_ivf(self, index, ids):
+        """Move all codes of an IVF segment into the shard (no re-encoding)."""
+        faiss = import_faiss()
+        n = index.ntotal
+        if self.count and self.count + n > self.shard_n:
+            self.flush()
+        faiss.extract_index_ivf(self.index).merge_from(faiss.extract_index_ivf(index), 0)
+        self.ids.append(ids)
+        self.count += n
+        if self.count >= self.shard_n:
+            self.flush()
+
+    def flush(self):
+        if self.count == 0:
+            return
+        faiss = import_faiss()
+        ids = np.concatenate(self.ids)
+        index = self.index
+        meta = fm.publish_segment(self.variant_dir, lambda p: faiss.write_index(index, p),
+                                  ids, int(time.time() * 1000))
+        self.published.append(meta)
+        self._reset()
+
+
+def select_segments(mf, target_n):
+    """Segments smaller than target_n are compaction candidates."""
+    return [s for s in mf.segments if s.count < target_n]
+
+
+def compact(variant_dir, target_n=512, min_segments=16, shard_n=DEFAULT_SHARD_N,
+            chunk_rows=DEFAULT_CHUNK_ROWS, force=False):
+    """
+    Compact small segments of one variant. Returns (old_metas, new_metas);
+    both are empty when there is nothing to do.
+    """
+    variant_dir = fm.resolve_variant_dir(variant_dir)
+    mf = fm.load_manifest(variant_dir)
+    small = select_segments(mf, target_n)
+    if len(small) < 2 or (len(small) < min_segments and not force):
+        return [], []
+
+    seg_dir = fm.segments_dir(variant_dir)
+    small.sort(key=lambda s: (s.ts, s.file))
+    writer = None
+    faiss = import_faiss()
+    try:
+        for meta in small:
+            index = read_index_mmap(seg_dir / meta.file)
+            if segment_kind(index) == "ivf":
+                # merge_from drains the source lists and the by-id fallback adds a direct map,
+                # so both need a writable copy.
+                index = faiss.read_index(str(seg_dir / meta.file))
+            ids = fm.read_ids(seg_dir / meta.ids)
+            if writer is None:
+                writer = ShardWriter(variant_dir, index, shard_n)
+            if (segment_kind(index) == "ivf" and segment_kind(writer.index) == "ivf"
+                    and same_quantizer(writer.index, index)):
+                writer.merge_ivf(index, ids)
+            else:
+                for vecs, chunk_ids in iter_chunks(index, ids, chunk_rows):
+                    writer.add_vectors(vecs, chunk_ids)
+            del index
+        writer.flush()
+
+        moved = sum(s.count for s in writer.published)
+        expected = sum(s.count for s in small)
+        if moved != expected:
+            raise RuntimeError(f"Compaction wrote {moved} rows but inputs hold {expected}; manifest left unchanged")
+
+        old = {s.file for s in small}
+        mf.segments = [s for s in mf.segments if s.file not in old] + writer.published
+        fm.save_manifest(fm.manifest_path(variant_dir), mf)
+    except BaseException:
+        # Nothing references the new shards until the manifest is saved; don't leave them behind.
+        for meta in writer.published if writer else []:
+            for name in (meta.file, meta.ids):
+                try:
+                    os.remove(seg_dir / name)
+                except FileNotFoundError:
+                    pass
+        raise
+
+    for meta in small:
+        for name in (meta.file, meta.ids):
+            try:
+                os.remove(seg_dir / name)
+            except FileNotFoundError:
+                pass
+    fm.fsync_dir(seg_dir)
+    return small, writer.published
+
+
+def measure_latency(variant_dir, queries, k=10):
+    """Open the variant and time single-query searches; returns (p50_ms, p95_ms, open_ms)."""
+    t0 = time.perf_counter()
+    engine = ShardedSearch(variant_dir)
+    open_ms = (time.perf_counter() - t0) * 1000
+    times = []
+    for q in queries:
+        t0 = time.perf_counter()
+        engine.search(q[None, :], k)
+        times.append((time.perf_counter() - t0) * 1000)
+    return float(np.percentile(times, 50)), float(np.percentile(times, 95)), open_ms
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Compact small FaissManifest segments into large shards")
+    ap.add_argument("manifest", help="Variant directory or its MANIFEST.json")
+    ap.add_argument("--target-n", type=int, default=512, help="Segments below this size are merged (segmentTargetN)")
+    ap.add_argument("--min-segments", type=int, default=16, help="Only compact at this many candidates (compactionMinSegments)")
+    ap.add_argument("--shard-n", type=int, default=DEFAULT_SHARD_N, help="Rows per output shard")
+    ap.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="Rows per streaming chunk")
+    ap.add_argument("--queries", type=int, default=200, help="Random queries for the latency report (0 to skip)")
+    ap.add_argument("--force", action="store_true", help="Compact even below --min-segments")
+    args = ap.parse_args()
+
+    variant_dir = fm.resolve_variant_dir(args.manifest)
+    try:
+        mf = fm.load_manifest(variant_dir)
+    except (OSError, ValueError) as e:
+        print(f"❌ Error loading manifest: {e}")
+        sys.exit(1)
+
+    queries = None
+    if args.queries > 0 and mf.segments:
+        queries = np.random.default_rng(0).standard_normal((args.queries, mf.dim)).astype(np.float32)
+        p50, p95, open_ms = measure_latency(variant_dir, queries)
+        print(f"⏱️  Before: {len(mf.segments)} segments, open {open_ms:.1f}ms, query p50 {p50:.2f}ms p95 {p95:.2f}ms")
+
+    try:
+        old, new = compact(variant_dir, args.target_n, args.min_segments, args.shard_n, args.chunk_rows, args.force)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"❌ Compaction failed, manifest left unchanged: {e}")
+        sys.exit(1)
+    if not old:
+        print(f"✅ Nothing to compact ({len(select_segments(mf, args.target_n))} small segments, "
+              f"threshold {args.min_segments})")
+        return
+    print(f"🔧 Merged {len(old)} segments ({sum(s.count for s in old)} vectors) into {len(new)} shards")
+
+    if queries is not None:
+        mf = fm.load_manifest(variant_dir)
+        p50, p95, open_ms = measure_latency(variant_dir, queries)
+        print(f"⏱️  After:  {len(mf.segments)} segments, open {open_ms:.1f}ms, query p50 {p50:.2f}ms p95 {p95:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
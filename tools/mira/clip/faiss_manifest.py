@@ -0,0 +1,211 @@
+"""
+Faiss Manifest
+Host-side model of the sharded index layout written under MiraClip/out/faiss.
+
+Mirrors FaissManifest / SegmentMeta / FaissPaths on device:
+
+    <root>/<variant>/MANIFEST.json
+    <root>/<variant>/segments/seg-<ts>-<count>.faiss
+    <root>/<variant>/segments/seg-<ts>-<count>.ids.json
+    <root>/<variant>/.staging/...
+
+Ids files hold one JSON string of comma-separated signed 64-bit ids
+(FaissSegmentBuildWorker.LongArraySerializer).
+"""
+
+import json
+import mmap
+import os
+from dataclasses import asdict, dataclass, field, fields
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+MANIFEST_NAME = "MANIFEST.json"
+SEGMENTS_DIR = "segments"
+STAGING_DIR = ".staging"
+
+# FaissDesignConfig defaults, keyed the way updateManifest() writes `params`.
+DEFAULT_PARAMS = {
+    "nlist": 4096, "nprobe": 16,
+    "pqM": 64, "pqBits": 8,
+    "hnswM": 32, "efC": 200, "efS": 64,
+}
+
+
+@dataclass
+class SegmentMeta:
+    file: str
+    ids: str
+    count: int
+    ts: int
+
+
+@dataclass
+class FaissManifest:
+    schemaVersion: int
+    dim: int
+    metric: str
+    indexType: str
+    variant: str
+    params: Dict[str, int]
+    segments: List[SegmentMeta] = field(default_factory=list)
+    trained: bool = False
+    trainInfo: str = ""
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build from decoded JSON, ignoring unknown keys like the device decoder."""
+        known = {f.name for f in fields(cls)}
+        kwargs = {k: v for k, v in data.items() if k in known}
+        kwargs["segments"] = [SegmentMeta(**{k: s[k] for k in ("file", "ids", "count", "ts")})
+                              for s in data.get("segments", [])]
+        return cls(**kwargs)
+
+    def to_dict(self):
+        return asdict(self)
+
+    @property
+    def total_count(self):
+        return sum(s.count for s in self.segments)
+
+
+def variant_root(root, variant):
+    return Path(root) / variant
+
+
+def manifest_path(variant_dir):
+    return Path(variant_dir) / MANIFEST_NAME
+
+
+def segments_dir(variant_dir):
+    return Path(variant_dir) / SEGMENTS_DIR
+
+
+def staging_dir(variant_dir):
+    return Path(variant_dir) / STAGING_DIR
+
+
+def seg_file_names(ts, count):
+    """Segment index and ids file names, as FaissPaths.segFiles builds them."""
+    return f"seg-{ts}-{count}.faiss", f"seg-{ts}-{count}.ids.json"
+
+
+def resolve_variant_dir(path):
+    """Accept either a variant directory or its MANIFEST.json."""
+    path = Path(path)
+    return path.parent if path.name == MANIFEST_NAME or path.is_file() else path
+
+
+def load_manifest(path):
+    """Load MANIFEST.json from a variant directory or a direct file path."""
+    mf_path = manifest_path(path) if Path(path).is_dir() else Path(path)
+    with open(mf_path, "r", encoding="utf-8") as f:
+        return FaissManifest.from_dict(json.load(f))
+
+
+def fsync_dir(path):
+    """Flush a directory entry so renames inside it survive a crash."""
+    try:
+        fd = os.open(str(path), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_atomic(path, data):
+    """Write bytes to path via temp file + fsync + rename."""
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    fsync_dir(path.parent)
+
+
+def save_manifest(path, mf):
+    """Atomically publish a manifest (pretty-printed like the device encoder)."""
+    mf_path = manifest_path(path) if Path(path).is_dir() else Path(path)
+    write_atomic(mf_path, json.dumps(mf.to_dict(), indent=4).encode("utf-8"))
+
+
+def read_ids(path):
+    """Memory-map an ids.json file and parse it into an int64 array."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return np.zeros(0, dtype=np.int64)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            body = mm[:].strip()
+    if body.startswith(b'"'):
+        body = body[1:-1]
+    if not body.strip():
+        return np.zeros(0, dtype=np.int64)
+    return np.array(body.split(b","), dtype=np.int64)
+
+
+def encode_ids(ids):
+    """Serialize ids the way LongArraySerializer does."""
+    return json.dumps(",".join(str(int(i)) for i in ids)).encode("utf-8")
+
+
+def fsync_file(path):
+    with open(path, "rb+") as f:
+        os.fsync(f.fileno())
+
+
+def publish_segment(variant_dir, write_index, ids, ts):
+    """
+    Stage a segment under .staging, fsync it, then rename it into segments/.
+
+    `write_index(path)` writes the index file; the ids file is written here.
+    Returns the SegmentMeta to record in the manifest. `ts` is bumped if a
+    segment with the same name already exists.
+    """
+    stage = staging_dir(variant_dir)
+    seg_dir = segments_dir(variant_dir)
+    stage.mkdir(parents=True, exist_ok=True)
+    seg_dir.mkdir(parents=True, exist_ok=True)
+    count = len(ids)
+    idx_name, ids_name = seg_file_names(ts, count)
+    while (seg_dir / idx_name).exists():
+        ts += 1
+        idx_name, ids_name = seg_file_names(ts, count)
+
+    tmp_idx = stage / (idx_name + ".tmp")
+    tmp_ids = stage / (ids_name + ".tmp")
+    write_index(str(tmp_idx))
+    fsync_file(tmp_idx)
+    with open(tmp_ids, "wb") as f:
+        f.write(encode_ids(ids))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_idx, seg_dir / idx_name)
+    os.replace(tmp_ids, seg_dir / ids_name)
+    fsync_dir(seg_dir)
+    return SegmentMeta(idx_name, ids_name, count, ts)
+
+
+def hash64(s, salt=0x7F4A7C15):
+    """
+    Port of FaissSegmentBuildWorker.hash64: FNV-style over UTF-8 bytes with
+    sign-extended bytes and wrapping signed 64-bit arithmetic.
+    """
+    mask = (1 << 64) - 1
+    h = salt & mask
+    for b in s.encode("utf-8"):
+        c = b if b < 0x80 else (b - 0x100) & mask
+        h = ((h ^ c) * 0x100000001B3) & mask
+    return h - (1 << 64) if h >= (1 << 63) else h
+
+
+def row_ids(video_id, count, salt=0x7F4A7C15):
+    """Stable ids for rows of one embedding file, as the device assigns them."""
+    return np.array([hash64(f"{video_id}#{row}", salt) for row in range(count)], dtype=np.int64)
@@ -0,0 +1,176 @@
+"""
+Faiss Sharded Search
+Host-side counterpart of FaissShardedSearch: opens every segment listed in a
+FaissManifest, searches them in parallel on a thread pool and merges the
+per-segment top-k with a heap.
+
+Usage:
+    cd tools && python3 -m mira.clip.faiss_search <variant_dir|MANIFEST.json> query.json [--k 10]
+
+Requires faiss (pip install faiss-cpu).
+"""
+
+import argparse
+import heapq
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from . import faiss_manifest as fm
+from .search import DEFAULT_K, format_results, load_queries, normalize_rows
+
+# Score faiss writes into unfilled inner-product result slots (-FLT_MAX).
+PAD_SCORE = -np.finfo(np.float32).max
+
+
+def import_faiss():
+    """Import faiss or fail with an install hint."""
+    try:
+        import faiss
+    except ImportError:
+        raise ImportError("faiss not found. Install it with: pip install faiss-cpu")
+    return faiss
+
+
+def read_index_mmap(path):
+    """Open a .faiss file memory-mapped where the index type allows it."""
+    faiss = import_faiss()
+    try:
+        return faiss.read_index(str(path), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        return faiss.read_index(str(path))
+
+
+def labels_are_ids(index):
+    """True when search() already returns external ids (IVF or IDMap indexes)."""
+    faiss = import_faiss()
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return True
+    return faiss.try_extract_index_ivf(index) is not None
+
+
+def apply_runtime_params(index, index_type, nprobe=None, ef_search=None):
+    """Set nprobe / efSearch the way FaissShardedSearch.applyRuntimeParams does."""
+    faiss = import_faiss()
+    if index_type == "IVF_PQ" and nprobe is not None:
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            ivf.nprobe = nprobe
+    if index_type == "HNSW_IP" and ef_search is not None:
+        base = faiss.downcast_index(index.index) if hasattr(index, "index") else index
+        if hasattr(base, "hnsw"):
+            base.hnsw.efSearch = ef_search
+
+
+class Segment:
+    """One opened segment: the faiss index plus its row-ordered ids."""
+
+    def __init__(self, meta, index, ids):
+        self.meta = meta
+        self.index = index
+        self.ids = ids
+        self.native_ids = labels_are_ids(index)
+
+    def search(self, queries, k):
+        k = min(k, self.index.ntotal)
+        if k == 0:
+            return np.zeros((len(queries), 0), np.float32), np.zeros((len(queries), 0), np.int64)
+        scores, labels = self.index.search(queries, k)
+        # faiss pads missing hits with -FLT_MAX; make that -inf so padding never depends on the label,
+        # which for native-id indexes may legitimately be -1.
+        pad = scores <= PAD_SCORE
+        if not self.native_ids:
+            pad |= labels < 0
+            labels = np.where(pad, -1, self.ids[np.where(pad, 0, labels)])
+        scores = np.where(pad, -np.inf, scores).astype(np.float32)
+        return scores, labels
+
+
+class ShardedSearch:
+    """Search every segment of one manifest variant and merge results."""
+
+    def __init__(self, path, threads=None, nprobe=None, ef_search=None):
+        self.root = fm.resolve_variant_dir(path)
+        self.manifest = fm.load_manifest(self.root)
+        params = self.manifest.params
+        nprobe = nprobe if nprobe is not None else params.get("nprobe", fm.DEFAULT_PARAMS["nprobe"])
+        ef_search = ef_search if ef_search is not None else params.get("efS", fm.DEFAULT_PARAMS["efS"])
+        self.threads = threads or min(32, os.cpu_count() or 1)
+        self.segments = []
+        seg_dir = fm.segments_dir(self.root)
+        with ThreadPoolExecutor(self.threads) as pool:
+            loaded = pool.map(lambda s: self._open(seg_dir, s), self.manifest.segments)
+            for seg in loaded:
+                apply_runtime_params(seg.index, self.manifest.indexType, nprobe, ef_search)
+                self.segments.append(seg)
+
+    @staticmethod
+    def _open(seg_dir, meta):
+        return Segment(meta, read_index_mmap(seg_dir / meta.file), fm.read_ids(seg_dir / meta.ids))
+
+    def search(self, queries, k=DEFAULT_K):
+        """
+        Return (ids, scores) of shape (Q, k), best first.
+
+        Ids are signed 64-bit hashes, so unfilled slots are marked by a -inf
+        score (faiss itself pads with label -1).
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if self.manifest.metric == "ip":
+            queries = normalize_rows(queries)
+        queries = np.ascontiguousarray(queries)
+        with ThreadPoolExecutor(self.threads) as pool:
+            parts = list(pool.map(lambda s: s.search(queries, k), self.segments))
+
+        out_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        out_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for qi in range(len(queries)):
+            heap = []
+            for scores, labels in parts:
+                for label, score in zip(labels[qi], scores[qi]):
+                    if not np.isfinite(score):
+                        continue
+                    if len(heap) < k:
+                        heapq.heappush(heap, (score, label))
+                    elif score > heap[0][0]:
+                        heapq.heapreplace(heap, (score, label))
+            best = sorted(heap, reverse=True)
+            for j, (score, label) in enumerate(best):
+                out_ids[qi, j] = label
+                out_scores[qi, j] = score
+        return out_ids, out_scores
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Search a FaissManifest variant on the host")
+    ap.add_argument("manifest", help="Variant directory or its MANIFEST.json")
+    ap.add_argument("query", help="Query JSON (vector, list of vectors, or {'vector': ...})")
+    ap.add_argument("--k", type=int, default=DEFAULT_K)
+    ap.add_argument("--threads", type=int, default=None, help="Segment search threads (default: all cores)")
+    ap.add_argument("--nprobe", type=int, default=None, help="Override manifest nprobe (IVF_PQ)")
+    ap.add_argument("--ef-search", type=int, default=None, help="Override manifest efS (HNSW_IP)")
+    args = ap.parse_args()
+
+    try:
+        engine = ShardedSearch(args.manifest, args.threads, args.nprobe, args.ef_search)
+    except (OSError, ValueError, ImportError) as e:
+        print(f"❌ Error opening manifest: {e}")
+        sys.exit(1)
+    mf = engine.manifest
+    print(f"🔍 {mf.variant}: {mf.indexType} dim={mf.dim}, "
+          f"{len(engine.segments)} segments, {mf.total_count} vectors")
+
+    queries, _ = load_queries(args.query)
+    if queries.shape[1] != mf.dim:
+        print(f"❌ Query dimension {queries.shape[1]} doesn't match manifest dimension {mf.dim}")
+        sys.exit(1)
+    ids, scores = engine.search(queries, args.k)
+    for row_ids, row_scores in zip(ids, scores):
+        keep = np.isfinite(row_scores)
+        print(format_results(row_ids[keep], row_scores[keep]))
+
+
+if __name__ == "__main__":
+    main()
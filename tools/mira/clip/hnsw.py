@@ -0,0 +1,370 @@
+"""
+HNSW Graph Index
+Pure-NumPy HNSW for inner-product search over embedding stores, the host-side
+counterpart of FaissIndexType.HNSW_IP: builds, inspects and serves graphs
+without faiss, honoring hnswM, efConstruction and efSearch.
+
+Layout (the same shape faiss uses): node i owns a fixed run of slots in one
+flat int32 `neighbors` array starting at offsets[i], 2*M slots for layer 0
+and M for each layer up to levels[i]; unused slots hold -1. There are no
+per-node Python objects, and search scores a node's whole neighbor list
+with one matmul.
+
+File (<name>.hnsw), every array 64-byte aligned so it maps zero-copy:
+
+  0    magic "MIRAHNSW", u16 version, u16 metric (0 = inner product)
+  12   u32 dim, u32 M, u32 efConstruction, u32 efSearch
+  28   u64 n, i64 entry point, i32 max level (rest of the 64 bytes zero)
+  64   int8 levels[n]
+       int64 offsets[n + 1]
+       int32 neighbors[offsets[n]]
+
+The vectors are not copied: a graph is searched together with the store it
+was built from (row i of the store is node i), which may also be a float16
+or int8 copy of it.
+
+Usage:
+    cd tools && python3 -m mira.clip.hnsw out/embeddings.emb --build out/embeddings.hnsw [--m 32] [--ef-construction 200]
+    cd tools && python3 -m mira.clip.hnsw out/embeddings.emb --graph out/embeddings.hnsw --query query.json [--k 10] [--ef-search 64]
+    cd tools && python3 -m mira.clip.hnsw out/embeddings.emb --graph out/embeddings.hnsw --bench [--n-queries 200] [--stats]
+"""
+
+import argparse
+import heapq
+import math
+import struct
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from . import faiss_manifest as fm
+from .embedding_store import align, dequantize, read_header, read_quant
+from .search import format_results, load_queries, normalize_rows, open_store, search
+
+MAGIC = b"MIRAHNSW"
+FORMAT_VERSION = 1
+METRIC_IP = 0
+HEADER = struct.Struct("<8sHHIIIIQqi")
+HEADER_SIZE = 64
+DEFAULT_M = fm.DEFAULT_PARAMS["hnswM"]
+DEFAULT_EF_CONSTRUCTION = fm.DEFAULT_PARAMS["efC"]
+DEFAULT_EF_SEARCH = fm.DEFAULT_PARAMS["efS"]
+MAX_LEVEL = 127
+STATS_BLOCK = 65536  # nodes per layer-0 gather in graph_stats
+
+
+def random_levels(n, m, seed=0):
+    """Node levels drawn with mL = 1 / ln(M), as in the HNSW paper and faiss."""
+    rng = np.random.default_rng(seed)
+    u = 1.0 - rng.random(n)  # (0, 1]
+    return np.minimum(np.floor(-np.log(u) / math.log(m)), MAX_LEVEL).astype(np.int8)
+
+
+class HnswGraph:
+    """HNSW adjacency in flat arrays; `vectors` are the store rows (node i = row i)."""
+
+    def __init__(self, vectors, m, levels, offsets, neighbors, entry, max_level,
+                 ef_construction=DEFAULT_EF_CONSTRUCTION, ef_search=DEFAULT_EF_SEARCH, quant=None):
+        self.vectors = vectors
+        self.m = m
+        self.levels = levels
+        self.offsets = offsets
+        self.neighbors = neighbors
+        self.entry = entry
+        self.max_level = max_level
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.quant = quant
+        self.visited = np.zeros(len(levels), dtype=np.uint32)
+        self.stamp = 0
+
+    def __len__(self):
+        return len(self.levels)
+
+    @property
+    def dim(self):
+        return self.vectors.shape[1]
+
+    def slots(self, level):
+        return 2 * self.m if level == 0 else self.m
+
+    def row(self, node, level):
+        """The (writable when building) slot array of node at level."""
+        start = self.offsets[node] + (0 if level == 0 else 2 * self.m + (level - 1) * self.m)
+        return self.neighbors[start:start + self.slots(level)]
+
+    def neighbors_of(self, node, level):
+        r = self.row(node, level)
+        return r[r >= 0]
+
+    def _prepare(self, q):
+        """(query, bias) such that score = vectors[ids] @ query + bias (int8 stores score asymmetrically)."""
+        q = np.asarray(q, dtype=np.float32)
+        if self.quant is None:
+            return q, 0.0
+        scale, offset = self.quant
+        return q * scale, float(q @ offset)
+
+    def _scores(self, ids, q):
+        return np.asarray(self.vectors[ids] @ q, dtype=np.float32)
+
+    def _next_stamp(self):
+        self.stamp += 1
+        if self.stamp == np.iinfo(np.uint32).max:
+            self.visited[:] = 0
+            self.stamp = 1
+        return self.stamp
+
+    def greedy(self, q, ep, ep_score, level):
+        """Hill-climb to the best-scoring node at one layer (ef = 1)."""
+        while True:
+            nb = self.neighbors_of(ep, level)
+            if not nb.size:
+                return ep, ep_score
+            sc = self._scores(nb, q)
+            j = int(np.argmax(sc))
+            if sc[j] <= ep_score:
+                return ep, ep_score
+            ep, ep_score = int(nb[j]), float(sc[j])
+
+    def search_layer(self, q, entry_ids, entry_scores, ef, level):
+        """Best-first beam search at one layer; returns (ids, scores), best first, at most ef."""
+        stamp = self._next_stamp()
+        visited = self.visited
+        visited[entry_ids] = stamp
+        cand = [(-s, i) for s, i in zip(entry_scores, entry_ids)]
+        heapq.heapify(cand)
+        res = heapq.nlargest(ef, zip(entry_scores, entry_ids))
+        heapq.heapify(res)
+        worst = res[0][0] if len(res) >= ef else -math.inf
+        while cand:
+            neg, c = heapq.heappop(cand)
+            if -neg < worst:
+                break
+            nb = self.neighbors_of(c, level)
+            nb = nb[visited[nb] != stamp]
+            if not nb.size:
+                continue
+            visited[nb] = stamp
+            sc = self._scores(nb, q)
+            if len(res) >= ef:
+                keep = sc > worst
+                nb, sc = nb[keep], sc[keep]
+            for s, n in zip(sc.tolist(), nb.tolist()):
+                if len(res) < ef:
+                    heapq.heappush(res, (s, n))
+                elif s > res[0][0]:
+                    heapq.heapreplace(res, (s, n))
+                else:
+                    continue
+                heapq.heappush(cand, (-s, n))
+            if len(res) >= ef:
+                worst = res[0][0]
+        res.sort(reverse=True)
+        return [n for _, n in res], [s for s, _ in res]
+
+    def select_neighbors(self, ids, scores, max_n):
+        """HNSW heuristic: keep a candidate only if it is closer to the base than to every kept one."""
+        if len(ids) <= 1:
+            return list(ids)
+        ids = np.asarray(ids)
+        scores = np.asarray(scores, dtype=np.float32)
+        order = np.argsort(-scores, kind="stable")
+        ids, scores = ids[order], scores[order]
+        v = np.asarray(self.vectors[ids], dtype=np.float32)
+        gram = v @ v.T
+        best = np.full(len(ids), -np.inf, dtype=np.float32)  # max similarity to any kept candidate
+        kept = []
+        for j in range(len(ids)):
+            if best[j] < scores[j]:
+                kept.append(int(ids[j]))
+                if len(kept) == max_n:
+                    break
+                np.maximum(best, gram[j], out=best)
+        return kept
+
+    def link(self, src, dst, level):
+        """Adds src -> dst, shrinking src's list with the heuristic when it is full."""
+        r = self.row(src, level)
+        free = np.flatnonzero(r < 0)
+        if free.size:
+            r[free[0]] = dst
+            return
+        cand = np.append(r, dst)
+        v = np.asarray(self.vectors[src], dtype=np.float32)
+        kept = self.select_neighbors(cand, self._scores(cand, v), len(r))
+        r[:] = -1
+        r[:len(kept)] = kept
+
+    def insert(self, node):
+        q = np.asarray(self.vectors[node], dtype=np.float32)
+        level = int(self.levels[node])
+        if self.entry < 0:
+            self.entry, self.max_level = node, level
+            return
+        ep = self.entry
+        ep_score = float(self._scores(np.array([ep]), q)[0])
+        for lv in range(self.max_level, level, -1):
+            ep, ep_score = self.greedy(q, ep, ep_score, lv)
+        ids, scores = [ep], [ep_score]
+        for lv in range(min(level, self.max_level), -1, -1):
+            ids, scores = self.search_layer(q, ids, scores, self.ef_construction, lv)
+            chosen = self.select_neighbors(ids, scores, self.slots(lv))
+            r = self.row(node, lv)
+            r[:len(chosen)] = chosen
+            for n in chosen:
+                self.link(n, node, lv)
+        if level > self.max_level:
+            self.entry, self.max_level = node, level
+
+    def search(self, queries, k=10, ef_search=None):
+        """(ids, scores), both (Q, k), best first; -1 / -inf pad when fewer than k are reachable."""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if queries.shape[1] != self.dim:
+            raise ValueError(f"Query dimension {queries.shape[1]} doesn't match graph dimension {self.dim}")
+        ef = max(ef_search or self.ef_search, k)
+        out_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        out_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        if self.entry < 0:
+            return out_ids, out_scores
+        for qi, raw in enumerate(queries):
+            q, bias = self._prepare(raw)
+            ep = self.entry
+            ep_score = float(self._scores(np.array([ep]), q)[0])
+            for lv in range(self.max_level, 0, -1):
+                ep, ep_score = self.greedy(q, ep, ep_score, lv)
+            ids, scores = self.search_layer(q, [ep], [ep_score], ef, 0)
+            out_ids[qi, :min(k, len(ids))] = ids[:k]
+            out_scores[qi, :min(k, len(ids))] = np.asarray(scores[:k]) + bias
+        return out_ids, out_scores
+
+    def save(self, path):
+        head = HEADER.pack(MAGIC, FORMAT_VERSION, METRIC_IP, self.dim, self.m, self.ef_construction,
+                           self.ef_search, len(self), self.entry, self.max_level)
+        with open(path, "wb") as f:
+            f.write(head.ljust(HEADER_SIZE, b"\x00"))
+            for arr in (self.levels.astype("i1"), self.offsets.astype("<i8"), self.neighbors.astype("<i4")):
+                f.write(b"\x00" * (align(f.tell()) - f.tell()))
+                f.write(np.ascontiguousarray(arr).tobytes())
+
+    @classmethod
+    def load(cls, path, vectors, quant=None, ef_search=None):
+        """Maps a .hnsw file; the arrays stay on disk until touched."""
+        with open(path, "rb") as f:
+            raw = f.read(HEADER.size)
+        if len(raw) < HEADER.size or not raw.startswith(MAGIC):
+            raise ValueError(f"{path}: not an HNSW graph file")
+        _, version, metric, dim, m, efc, efs, n, entry, max_level = HEADER.unpack(raw)
+        if version != FORMAT_VERSION or metric != METRIC_IP:
+            raise ValueError(f"{path}: unsupported graph version {version} / metric {metric}")
+        if vectors.shape[1] != dim or len(vectors) < n:
+            raise ValueError(f"{path}: graph is {n} x {dim}, store is {vectors.shape[0]} x {vectors.shape[1]}")
+        levels = np.memmap(path, dtype="i1", mode="r", offset=HEADER_SIZE, shape=(n,)) if n else np.zeros(0, "i1")
+        off_at = align(HEADER_SIZE + n)
+        offsets = np.memmap(path, dtype="<i8", mode="r", offset=off_at, shape=(n + 1,))
+        total = int(offsets[-1])
+        nb_at = align(off_at + 8 * (n + 1))
+        neighbors = (np.memmap(path, dtype="<i4", mode="r", offset=nb_at, shape=(total,)) if total
+                     else np.zeros(0, "<i4"))
+        return cls(vectors[:n], m, levels, offsets, neighbors, entry, max_level, efc, ef_search or efs, quant)
+
+
+def build(vectors, m=DEFAULT_M, ef_construction=DEFAULT_EF_CONSTRUCTION, ef_search=DEFAULT_EF_SEARCH, seed=0,
+          progress=None):
+    """Builds a graph over float vectors (normalized for inner product), inserting rows in order."""
+    n = len(vectors)
+    levels = random_levels(n, m, seed)
+    sizes = 2 * m + levels.astype(np.int64) * m
+    offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+    neighbors = np.full(int(offsets[-1]), -1, dtype=np.int32)
+    graph = HnswGraph(vectors, m, levels, offsets, neighbors, -1, -1, ef_construction, ef_search)
+    for node in range(n):
+        graph.insert(node)
+        if progress and (node + 1) % progress == 0:
+            print(f"  {node + 1:,}/{n:,} nodes")
+    return graph
+
+
+def graph_stats(graph):
+    """Node count per level and mean out-degree at layer 0, streamed over STATS_BLOCK nodes at a time."""
+    counts = np.bincount(np.asarray(graph.levels, dtype=np.int64), minlength=graph.max_level + 1)
+    slots = np.arange(2 * graph.m)
+    edges = 0
+    for start in range(0, len(graph), STATS_BLOCK):
+        starts = np.asarray(graph.offsets[start:min(start + STATS_BLOCK, len(graph))])
+        edges += int((graph.neighbors[starts[:, None] + slots] >= 0).sum())
+    return counts.tolist(), edges / len(graph) if len(graph) else 0.0
+
+
+def load_store(path, dim=None):
+    """(vectors, quant) for searching; int8 rows are scored asymmetrically like search.search."""
+    store = open_store(path, dim)
+    return store, read_quant(path) if read_header(path) else None
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build / search a pure-NumPy HNSW graph over an embedding store")
+    ap.add_argument("store", help=".emb store (or legacy .f32 with --dim); rows must be L2-normalized")
+    ap.add_argument("--dim", type=int, default=None, help="Dimension of a legacy .f32 store")
+    ap.add_argument("--build", default=None, metavar="GRAPH", help="Build a graph and write it here")
+    ap.add_argument("--graph", default=None, help="Existing .hnsw graph to search")
+    ap.add_argument("--m", type=int, default=DEFAULT_M, help="hnswM (layer 0 keeps 2*M neighbors)")
+    ap.add_argument("--ef-construction", type=int, default=DEFAULT_EF_CONSTRUCTION, help="efConstruction")
+    ap.add_argument("--ef-search", type=int, default=None, help=f"efSearch (default: the graph's, {DEFAULT_EF_SEARCH} when building)")
+    ap.add_argument("--seed", type=int, default=0, help="Level assignment seed")
+    ap.add_argument("--query", default=None, help="Query vector(s) JSON")
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--stats", action="store_true", help="Nodes per level and mean layer-0 degree (reads the whole graph)")
+    ap.add_argument("--bench", action="store_true", help="Recall@k against exact search and queries/s")
+    ap.add_argument("--n-queries", type=int, default=200, help="Noisy store rows used as --bench queries")
+    args = ap.parse_args()
+
+    if not args.build and not args.graph:
+        ap.error("one of --build or --graph is required")
+    try:
+        store, quant = load_store(args.store, args.dim)
+        if args.build:
+            vectors = dequantize(store, quant) if quant is not None or store.dtype != np.float32 else store
+            print(f"🔧 Building HNSW over {len(store):,} x {store.shape[1]} (M={args.m}, "
+                  f"efConstruction={args.ef_construction})")
+            t0 = time.time()
+            graph = build(vectors, args.m, args.ef_construction, args.ef_search or DEFAULT_EF_SEARCH, args.seed,
+                          progress=max(len(store) // 10, 1000))
+            elapsed = time.time() - t0
+            graph.save(args.build)
+            print(f"💾 {args.build} ({Path(args.build).stat().st_size / 2**20:,.1f} MiB) in {elapsed:.1f}s "
+                  f"({len(store) / max(elapsed, 1e-9):,.0f} inserts/s)")
+        graph = HnswGraph.load(args.build or args.graph, store, quant, args.ef_search)
+    except (OSError, ValueError) as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+
+    print(f"📊 {len(graph):,} nodes, M={graph.m}, efConstruction={graph.ef_construction}, efSearch={graph.ef_search}, "
+          f"entry {graph.entry} at level {graph.max_level}")
+    if args.stats or args.build:
+        per_level, degree = graph_stats(graph)
+        print(f"  nodes per level {per_level}; mean layer-0 degree {degree:.1f}")
+
+    if args.query:
+        q, _ = load_queries(args.query)
+        ids, scores = graph.search(normalize_rows(q), args.k)
+        for row_ids, row_scores in zip(ids, scores):
+            print(format_results(row_ids, row_scores))
+
+    if args.bench:
+        rng = np.random.default_rng(0)
+        rows = rng.choice(len(store), size=min(args.n_queries, len(store)), replace=False)
+        base = dequantize(store[np.sort(rows)], quant)
+        queries = normalize_rows(base + rng.standard_normal(base.shape, dtype=np.float32) * 0.05 * np.abs(base).mean())
+        truth, _ = search(store, queries, args.k, quant=quant)
+        t0 = time.perf_counter()
+        ids, _ = graph.search(queries, args.k)
+        qps = len(queries) / (time.perf_counter() - t0)
+        recall = np.mean([len(np.intersect1d(a, b)) / args.k for a, b in zip(ids, truth)])
+        print(f"🎯 recall@{args.k} {recall:.4f} at efSearch={graph.ef_search}, {qps:,.0f} queries/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+"""
+Video Ingest Pipeline
+Turns a directory of videos into an append-only embedding store using
+the exported clip_image_encoder.ptl, the host-side counterpart of
+VideoIngestService.
+
+Stages, connected by bounded queues so every stage stays busy and none can
+run ahead of the others without limit:
+
+  1. decode + preprocess  worker processes (one video per task). Frames are
+                          taken at TimestampPolicies.uniform / tsnJitter
+                          stamps, resized to 224x224 and CLIP-normalized as
+                          ClipPreprocess does, one vectorized op per video
+  2. inference            main process. Frames from consecutive videos are
+                          packed into fixed-size batches for the encoder
+  3. write                writer thread appending whole videos to the store
+                          (embedding_store.AppendStore) with an ids sidecar
+
+Videos already present in the ids sidecar are skipped, so an interrupted run
+can simply be restarted. With --cache, frame embeddings are also looked up by
+(video sha256, timestamp, model sha256) in an embed_cache.EmbeddingCache:
+cached frames are not decoded or encoded, so rebuilding a store (or ingesting
+copies of already seen videos) only pays for new content.
+
+Decoding uses PyAV when installed and falls back to OpenCV.
+
+Usage:
+    cd tools && python3 -m mira.clip.ingest <videos_dir> --model ../mobile_models/clip_image_encoder.ptl \
+        --out out/clip_vit_b32/embeddings.emb [--frames 32] [--policy uniform|tsn_jitter] \
+        [--batch-size 8] [--workers N] [--cache out/frame_cache --cache-max-gb 4]
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import queue
+import sys
+import threading
+import time
+import zipfile
+from pathlib import Path
+
+import numpy as np
+
+from .embed_cache import EmbeddingCache, cache_key, file_sha256
+from .embedding_store import AppendStore, read_id_records
+from .timestamps import POLICIES
+
+VIDEO_SUFFIXES = (".mp4", ".mov", ".mkv", ".webm", ".avi", ".m4v")
+IMAGE_SIZE = 224
+CLIP_MEAN = np.array([0.48145466, 0.4578275, 0.40821073], dtype=np.float32)
+CLIP_STD = np.array([0.26862954, 0.26130258, 0.27577711], dtype=np.float32)
+DEFAULT_FRAMES = 32
+DEFAULT_BATCH_SIZE = 8
+# Sequential decoding is cheaper than a seek when the next stamp is this close.
+SEEK_GAP_MS = 2000
+
+
+def import_decoder():
+    """('av', module) or ('cv2', module); raises ImportError with a pip hint."""
+    try:
+        import av
+        return "av", av
+    except ImportError:
+        pass
+    try:
+        import cv2
+        return "cv2", cv2
+    except ImportError:
+        raise ImportError("Video decoding needs PyAV or OpenCV; install one with "
+                          "'pip install av' or 'pip install opencv-python-headless'")
+
+
+def unique_stamps(stamps):
+    """Policy stamps without repeats: clips shorter than n ms (or with no duration) map several to one ms."""
+    return list(dict.fromkeys(int(ts) for ts in stamps))
+
+
+def _frames_av(av, path, policy, n, skip=None):
+    with av.open(str(path)) as container:
+        stream = container.streams.video[0]
+        stream.thread_type = "AUTO"
+        if stream.duration is not None:
+            duration_ms = int(stream.duration * stream.time_base * 1000)
+        else:
+            duration_ms = int((container.duration or 0) / 1000)
+        stamps = unique_stamps(POLICIES[policy](duration_ms, n))
+        kept, frames, decoder, current = [], [], None, None
+        for ts in stamps:
+            if skip is not None and skip(ts):
+                continue
+            if decoder is None or current is None or ts > current + SEEK_GAP_MS or ts < current:
+                container.seek(int(ts / 1000 / stream.time_base), stream=stream, backward=True)
+                decoder = container.decode(stream)
+            for frame in decoder:
+                current = float(frame.time or 0) * 1000
+                if current + 0.5 * 1000 / float(stream.average_rate or 30) >= ts:
+                    frames.append(frame.to_ndarray(format="rgb24"))
+                    kept.append(ts)
+                    break
+        return duration_ms, kept, frames
+
+
+def _frames_cv2(cv2, path, policy, n, skip=None):
+    cap = cv2.VideoCapture(str(path))
+    if not cap.isOpened():
+        raise ValueError(f"cannot open {path}")
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        duration_ms = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) / fps * 1000)
+        stamps = unique_stamps(POLICIES[policy](duration_ms, n))
+        kept, frames = [], []
+        for ts in stamps:
+            if skip is not None and skip(ts):
+                continue
+            cap.set(cv2.CAP_PROP_POS_MSEC, ts)
+            ok, bgr = cap.read()
+            if ok:
+                frames.append(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB))
+                kept.append(ts)
+        return duration_ms, kept, frames
+    finally:
+        cap.release()
+
+
+def decode_frames(path, policy="uniform", n=DEFAULT_FRAMES, skip=None):
+    """(duration_ms, stamps, [HxWx3 uint8 RGB]) for the policy's timestamps; stamps where skip(ts) is true are not decoded."""
+    kind, mod = import_decoder()
+    return (_frames_av if kind == "av" else _frames_cv2)(mod, path, policy, n, skip)
+
+
+def preprocess(frames, size=IMAGE_SIZE):
+    """RGB uint8 frames -> (n, 3, size, size) float32, stretched to size like ClipPreprocess."""
+    from PIL import Image
+    batch = np.stack([np.asarray(Image.fromarray(f).resize((size, size), Image.BILINEAR)) for f in frames])
+    x = batch.astype(np.float32) * np.float32(1 / 255.0)
+    x -= CLIP_MEAN
+    x /= CLIP_STD
+    return np.ascontiguousarray(x.transpose(0, 3, 1, 2))
+
+
+def _decode_worker(task_q, result_q, policy, n, cache_dir=None, model_sha=None):
+    """Stage 1 process: decode + preprocess one video per task, skipping frames found in the cache."""
+    cache = EmbeddingCache(cache_dir, readonly=True) if cache_dir else None
+    for video_id, path in iter(task_q.get, None):
+        try:
+            media_sha, hits = None, {}
+            if cache is not None:
+                media_sha = file_sha256(path)
+
+                def skip_cached(ts):
+                    vec = cache.get(cache_key(media_sha, ts, model_sha))
+                    if vec is not None:
+                        hits[ts] = vec
+                    return vec is not None
+
+            duration_ms, stamps, frames = decode_frames(path, policy, n, skip_cached if cache else None)
+            if not frames and not hits:
+                raise ValueError("no frames decoded")
+            x = preprocess(frames) if frames else None
+            result_q.put((video_id, str(path), duration_ms, stamps, x, "", media_sha, hits))
+        except Exception as e:
+            result_q.put((video_id, str(path), 0, [], None, f"{type(e).__name__}: {e}", None, {}))
+    result_q.put(None)
+
+
+def load_encoder(path):
+    """Exported encoder: lite interpreter for .ptl bytecode archives, else torch.jit."""
+    import torch
+    with zipfile.ZipFile(path) as zf:
+        lite = any(name.endswith("bytecode.pkl") for name in zf.namelist())
+    if lite:
+        from torch.jit.mobile import _load_for_lite_interpreter
+        return _load_for_lite_interpreter(str(path))
+    return torch.jit.load(str(path), map_location="cpu")
+
+
+def find_videos(root):
+    """(video_id, path) pairs; the id is the path relative to root without suffix."""
+    root = Path(root)
+    if root.is_file():
+        return [(root.stem, root)]
+    videos = sorted(p for p in root.rglob("*") if p.suffix.lower() in VIDEO_SUFFIXES)
+    return [(str(p.relative_to(root).with_suffix("")), p) for p in videos]
+
+
+class StoreWriter(threading.Thread):
+    """Stage 3: buffers rows until a video is complete, then appends it."""
+
+    def __init__(self, out, model_sha=None, maxsize=16):
+        super().__init__(daemon=True)
+        self.out = out
+        self.model_sha = model_sha
+        self.q = queue.Queue(maxsize=maxsize)
+        self.store = None
+        self.pending = {}
+        self.videos = 0
+        self.error = None
+
+    def run(self):
+        try:
+            for vectors, rows in iter(self.q.get, None):
+                if self.store is None:
+                    self.store = AppendStore(self.out, vectors.shape[1], model_sha=self.model_sha)
+                for vec, row in zip(vectors, rows):
+                    buf = self.pending.setdefault(row["video"], ([], []))
+                    buf[0].append(vec)
+                    buf[1].append(row)
+                    if len(buf[1]) == row["n"]:
+                        del self.pending[row["video"]]
+                        # Cached and freshly encoded frames can arrive out of order.
+                        order = sorted(range(len(buf[1])), key=lambda i: buf[1][i]["frame"])
+                        buf = ([buf[0][i] for i in order], [buf[1][i] for i in order])
+                        self.store.append(np.stack(buf[0]), [
+                            {"id": f"{r['video']}#{r['frame']}", "video": r["video"],
+                             "frame": r["frame"], "ts_ms": r["ts_ms"], "source": r["source"]} for r in buf[1]])
+                        self.videos += 1
+        except Exception as e:
+            self.error = e
+            # Keep draining so the inference stage never blocks on a full queue.
+            for _ in iter(self.q.get, None):
+                pass
+        finally:
+            if self.store is not None:
+                self.store.close()
+
+
+def run_pipeline(videos_dir, model_path, out, frames=DEFAULT_FRAMES, policy="uniform",
+                 batch_size=DEFAULT_BATCH_SIZE, workers=None, prefetch=None, threads=None,
+                 cache_dir=None, cache_max_bytes=None):
+    """Ingest every new video under videos_dir; returns a stats dict."""
+    import torch
+
+    # Converted stores carry only "id" ("<video>#<frame>" or "<video>"), so fall back to its prefix.
+    done = {r.get("video") or str(r.get("id", "")).rsplit("#", 1)[0] for r in read_id_records(out)}
+    todo = [(vid, p) for vid, p in find_videos(videos_dir) if vid not in done]
+    stats = {"videos": len(todo), "skipped": len(done), "failed": [], "frames": 0, "batches": 0,
+             "decode_wait_s": 0.0, "infer_s": 0.0, "cached_frames": 0, "evicted": 0}
+    if not todo:
+        return stats
+
+    workers = workers or max(1, (os.cpu_count() or 2) - 1)
+    prefetch = prefetch or 2 * workers
+    if threads:
+        torch.set_num_threads(threads)
+    import_decoder()  # fail fast, before any process starts
+    encoder = load_encoder(model_path)
+    model_sha = file_sha256(model_path)
+    cache = None
+    if cache_dir:
+        dim = None
+        if not (Path(cache_dir) / "meta.json").exists():
+            with torch.no_grad():
+                dim = encoder(torch.zeros(1, 3, IMAGE_SIZE, IMAGE_SIZE)).shape[-1]
+        cache = EmbeddingCache(cache_dir, dim=dim, max_bytes=cache_max_bytes)
+
+    ctx = mp.get_context("spawn")
+    task_q, result_q = ctx.Queue(maxsize=prefetch), ctx.Queue(maxsize=prefetch)
+    procs = [ctx.Process(target=_decode_worker, args=(task_q, result_q, policy, frames, cache_dir, model_sha),
+                         daemon=True)
+             for _ in range(workers)]
+    for p in procs:
+        p.start()
+
+    def feed():
+        for item in todo:
+            task_q.put(item)
+        for _ in procs:
+            task_q.put(None)
+
+    threading.Thread(target=feed, daemon=True).start()
+    writer = StoreWriter(out, model_sha)
+    writer.start()
+
+    pending_x, pending_rows = [], []
+
+    def infer(n):
+        x = np.concatenate(pending_x)
+        rows = [r for chunk in pending_rows for r in chunk]
+        batch, rest = x[:n], x[n:]
+        t0 = time.perf_counter()
+        with torch.no_grad():
+            emb = encoder(torch.from_numpy(batch)).numpy()
+        stats["infer_s"] += time.perf_counter() - t0
+        stats["batches"] += 1
+        if cache is not None:
+            cache.put_many([r["key"] for r in rows[:n]], emb)
+        writer.q.put((emb, rows[:n]))
+        pending_x[:] = [rest] if len(rest) else []
+        pending_rows[:] = [rows[n:]] if len(rest) else []
+
+    finished = 0
+    try:
+        while finished < len(procs):
+            t0 = time.perf_counter()
+            item = result_q.get()
+            stats["decode_wait_s"] += time.perf_counter() - t0
+            if item is None:
+                finished += 1
+                continue
+            video_id, path, _, stamps, x, error, media_sha, hits = item
+            if error:
+                stats["failed"].append((path, error))
+                print(f"  ❌ {path}: {error}")
+                continue
+            frame_of = {ts: i for i, ts in enumerate(sorted(set(stamps) | set(hits)))}
+
+            def row(ts):
+                r = {"video": video_id, "frame": frame_of[ts], "ts_ms": int(ts), "n": len(frame_of), "source": path}
+                if cache is not None:
+                    r["key"] = cache_key(media_sha, ts, model_sha)
+                return r
+
+            if hits:
+                cached = [row(ts) for ts in hits]
+                cache.touch([r["key"] for r in cached])
+                writer.q.put((np.stack(list(hits.values())), cached))
+                stats["cached_frames"] += len(hits)
+            if x is not None:
+                pending_x.append(x)
+                pending_rows.append([row(ts) for ts in stamps])
+            stats["frames"] += len(frame_of)
+            while sum(len(c) for c in pending_x) >= batch_size:
+                infer(batch_size)
+            if writer.error:
+                raise writer.error
+        if pending_x:
+            infer(sum(len(c) for c in pending_x))
+    finally:
+        writer.q.put(None)
+        writer.join()
+        for p in procs:
+            p.join(timeout=5)
+        if cache is not None:
+            stats["evicted"] = cache.close()
+    if writer.error:
+        raise writer.error
+    stats["rows"] = writer.store.count if writer.store else len(read_id_records(out))
+    return stats
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Ingest videos into an .emb (or legacy .f32) embedding store with the exported image encoder")
+    ap.add_argument("videos", help="Video file or directory (searched recursively)")
+    ap.add_argument("--model", required=True, help="clip_image_encoder.ptl (or .pt)")
+    ap.add_argument("--out", required=True, help="Output .emb store (.f32 for the legacy headerless layout); ids sidecars are written next to it")
+    ap.add_argument("--frames", type=int, default=DEFAULT_FRAMES, help="Frames per video (frame_count)")
+    ap.add_argument("--policy", choices=sorted(POLICIES), default="uniform", help="TimestampPolicies variant")
+    ap.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Frames per encoder call")
+    ap.add_argument("--workers", type=int, default=None, help="Decode processes (default: cores - 1)")
+    ap.add_argument("--prefetch", type=int, default=None, help="Decoded videos buffered ahead of inference")
+    ap.add_argument("--threads", type=int, default=None, help="Torch threads for inference")
+    ap.add_argument("--cache", default=None, metavar="DIR", help="Content-addressed frame embedding cache (embed_cache)")
+    ap.add_argument("--cache-max-gb", type=float, default=None, help="Evict least recently used cache entries above this size")
+    args = ap.parse_args()
+
+    t0 = time.time()
+    try:
+        stats = run_pipeline(args.videos, args.model, args.out, args.frames, args.policy,
+                             args.batch_size, args.workers, args.prefetch, args.threads, args.cache,
+                             args.cache_max_gb * 2**30 if args.cache_max_gb else None)
+    except (ImportError, OSError, ValueError) as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+    elapsed = time.time() - t0
+    if not stats["videos"]:
+        print(f"✅ Nothing to ingest ({stats['skipped']} videos already in {args.out})")
+        return
+    print(f"🎉 {stats['videos'] - len(stats['failed'])}/{stats['videos']} videos, {stats['frames']} frames "
+          f"in {elapsed:.1f}s ({stats['frames'] / max(elapsed, 1e-9):.1f} frames/s); "
+          f"{stats['batches']} batches, inference {stats['infer_s']:.1f}s, "
+          f"waiting on decode {stats['decode_wait_s']:.1f}s")
+    if args.cache:
+        print(f"🔁 Cache: {stats['cached_frames']}/{stats['frames']} frames reused, {stats['evicted']} entries evicted")
+    print(f"💾 Store: {args.out} ({stats['rows']} rows)")
+    if stats["failed"]:
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
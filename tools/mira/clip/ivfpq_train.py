@@ -0,0 +1,332 @@
+"""
+IVF-PQ Trainer
+Offline host-side training of the IVF_PQ coarse quantizer and PQ codebooks,
+producing app-compatible segments and their FaissManifest.
+
+Training streams the input .f32 files and runs mini-batch k-means in NumPy,
+so memory stays bounded by the batch size. faiss is used only to serialize
+the trained template and the segments in the format FaissBridge.readIndex
+expects.
+
+Usage:
+    cd tools && python3 -m mira.clip.ivfpq_train out/faiss emb1.f32 emb2.f32 ... \
+        [--dim 512] [--nlist 4096] [--pq-m 64] [--pq-bits 8] [--variant base]
+
+Each input file becomes one segment (split at --segment-n rows); row ids
+are hash64("<file stem>#<row>") exactly as FaissSegmentBuildWorker assigns them.
+The trained template is host-only: FaissSegmentBuildWorker does not load
+it, so the manifest's `trained` flag is left as it was (false for a new
+manifest) and devices keep training their own segments.
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from . import faiss_manifest as fm
+from .faiss_search import import_faiss
+from .search import normalize_rows, open_store
+
+TEMPLATE_NAME = "trained.ivfpq.faiss"
+CODEBOOK_NAME = "trained.ivfpq.npz"
+# PQ distances are (rows, M, ksub); at pqM=64, ksub=256 a 1024-row block is 64 MiB.
+ENCODE_ROWS = 1024
+
+
+def iter_batches(paths, dim, batch_size, normalize=True):
+    """Stream float32 row batches across all input stores."""
+    for path in paths:
+        store = open_store(path, dim)
+        for start in range(0, store.shape[0], batch_size):
+            batch = np.asarray(store[start:start + batch_size], dtype=np.float32)
+            yield normalize_rows(batch) if normalize else batch
+
+
+def assign(x, centroids):
+    """Nearest centroid (L2) per row, via the ||c||^2 - 2 x.c expansion."""
+    d = (centroids * centroids).sum(axis=1) - 2.0 * (x @ centroids.T)
+    return d.argmin(axis=1), d
+
+
+class MiniBatchKMeans:
+    """
+    Sculley-style mini-batch k-means with per-centroid learning rates.
+
+    With spherical=True centroids are kept unit-norm, so nearest-L2 equals
+    max-inner-product and matches the IndexFlatIP coarse quantizer.
+    """
+
+    def __init__(self, k, dim, seed=0, spherical=False):
+        self.k = k
+        self.dim = dim
+        self.spherical = spherical
+        self.rng = np.random.default_rng(seed)
+        self.centroids = None
+        self.counts = np.zeros(k, dtype=np.float64)
+        self._pending = []
+
+    @property
+    def ready(self):
+        return self.centroids is not None
+
+    def _init(self, x):
+        # Seed from distinct rows of the first batches (k-means++ is too slow at nlist=4096).
+        idx = self.rng.choice(len(x), size=self.k, replace=len(x) < self.k)
+        self.centroids = x[idx].astype(np.float32, copy=True)
+        if len(x) < self.k:
+            self.centroids += self.rng.normal(0, 1e-4, self.centroids.shape).astype(np.float32)
+
+    def partial_fit(self, x):
+        """Update centroids with one batch; initialization waits for >= k rows."""
+        if not self.ready:
+            self._pending.append(x)
+            if sum(len(p) for p in self._pending) < self.k:
+                return
+            x = np.concatenate(self._pending)
+            self._pending = []
+            self._init(x)
+        labels, _ = assign(x, self.centroids)
+        n = np.bincount(labels, minlength=self.k).astype(np.float64)
+        sums = np.zeros_like(self.centroids, dtype=np.float64)
+        np.add.at(sums, labels, x)
+        hit = n > 0
+        self.counts[hit] += n[hit]
+        lr = (n[hit] / self.counts[hit])[:, None]
+        mean = sums[hit] / n[hit][:, None]
+        self.centroids[hit] = ((1.0 - lr) * self.centroids[hit] + lr * mean).astype(np.float32)
+        if self.spherical:
+            self.centroids = normalize_rows(self.centroids)
+
+    def finish(self):
+        """Flush rows buffered before initialization (tiny training sets)."""
+        if not self.ready and self._pending:
+            x = np.concatenate(self._pending)
+            self._pending = []
+            self._init(x)
+            self.partial_fit(x)
+        if not self.ready:
+            raise ValueError("No training vectors")
+        return self.centroids
+
+
+class ProductQuantizerTrainer:
+    """Mini-batch k-means for all M sub-quantizers at once, vectorized over M."""
+
+    def __init__(self, dim, m, bits, seed=0):
+        if dim % m != 0:
+            raise ValueError(f"dim {dim} is not divisible by pqM {m}")
+        self.m, self.ksub, self.dsub = m, 1 << bits, dim // m
+        self.rng = np.random.default_rng(seed)
+        self.centroids = None  # (M, ksub, dsub)
+        self.counts = np.zeros((m, self.ksub), dtype=np.float64)
+        self._pending = []
+
+    def encode(self, x):
+        """Return (B, M) sub-codes for residual rows, scored ENCODE_ROWS rows at a time."""
+        sub = x.reshape(len(x), self.m, self.dsub)
+        norms = (self.centroids * self.centroids).sum(axis=2)  # (M, ksub)
+        codes = np.empty((len(x), self.m), dtype=np.int64)
+        for start in range(0, len(x), ENCODE_ROWS):
+            d = np.einsum("bmd,mkd->bmk", sub[start:start + ENCODE_ROWS], self.centroids)
+            d *= -2.0
+            d += norms[None]
+            codes[start:start + ENCODE_ROWS] = d.argmin(axis=2)
+        return codes
+
+    def partial_fit(self, x):
+        if self.centroids is None:
+            self._pending.append(x)
+            if sum(len(p) for p in self._pending) < self.ksub:
+                return
+            x = np.concatenate(self._pending)
+            self._pending = []
+            idx = self.rng.choice(len(x), size=self.ksub, replace=False)
+            self.centroids = np.ascontiguousarray(
+                x[idx].reshape(self.ksub, self.m, self.dsub).transpose(1, 0, 2))
+        sub = x.reshape(len(x), self.m, self.dsub)
+        codes = self.encode(x)
+        flat = (codes + np.arange(self.m)[None, :] * self.ksub).ravel()
+        n = np.bincount(flat, minlength=self.m * self.ksub).astype(np.float64)
+        sums = np.zeros((self.m * self.ksub, self.dsub), dtype=np.float64)
+        np.add.at(sums, flat, sub.reshape(-1, self.dsub))
+        n = n.reshape(self.m, self.ksub)
+        sums = sums.reshape(self.m, self.ksub, self.dsub)
+        hit = n > 0
+        self.counts[hit] += n[hit]
+        lr = (n[hit] / self.counts[hit])[:, None]
+        mean = sums[hit] / n[hit][:, None]
+        self.centroids[hit] = ((1.0 - lr) * self.centroids[hit] + lr * mean).astype(np.float32)
+
+    def finish(self):
+        if self.centroids is None:
+            raise ValueError(f"PQ training needs at least {self.ksub} vectors")
+        return self.centroids
+
+
+def train_ivfpq(paths, dim, nlist, pq_m, pq_bits, batch_size=8192, epochs=2,
+                max_train=None, seed=0, normalize=True):
+    """
+    Train coarse centroids (nlist, dim) and PQ codebooks (M, ksub, dsub).
+
+    Coarse k-means runs for `epochs` passes; PQ is then trained on residuals
+    for the same number of passes. Returns (coarse, codebooks, stats).
+    """
+    def batches():
+        seen = 0
+        for batch in iter_batches(paths, dim, batch_size, normalize):
+            if max_train is not None:
+                if seen >= max_train:
+                    return
+                batch = batch[:max_train - seen]
+            seen += len(batch)
+            yield batch
+
+    t0 = time.time()
+    coarse = MiniBatchKMeans(nlist, dim, seed, spherical=normalize)
+    n_train = 0
+    for epoch in range(epochs):
+        for batch in batches():
+            coarse.partial_fit(batch)
+            if epoch == 0:
+                n_train += len(batch)
+    centroids = coarse.finish()
+    if n_train < nlist:
+        print(f"⚠️  Only {n_train} training vectors for nlist={nlist}")
+    t_coarse = time.time() - t0
+
+    pq = ProductQuantizerTrainer(dim, pq_m, pq_bits, seed)
+    for _ in range(epochs):
+        for batch in batches():
+            labels, _ = assign(batch, centroids)
+            pq.partial_fit(batch - centroids[labels])
+    codebooks = pq.finish()
+
+    # One more streaming pass to report quantization quality.
+    coarse_err = pq_err = 0.0
+    for batch in batches():
+        labels, _ = assign(batch, centroids)
+        resid = batch - centroids[labels]
+        coarse_err += float((resid * resid).sum())
+        codes = pq.encode(resid)
+        recon = codebooks[np.arange(pq_m)[None, :], codes].reshape(len(batch), dim)
+        diff = resid - recon
+        pq_err += float((diff * diff).sum())
+
+    stats = {
+        "method": "minibatch-kmeans",
+        "nTrain": n_train,
+        "epochs": epochs,
+        "batchSize": batch_size,
+        "seed": seed,
+        "coarseMse": coarse_err / max(n_train, 1),
+        "pqMse": pq_err / max(n_train, 1),
+        "trainSec": round(time.time() - t0, 3),
+        "coarseSec": round(t_coarse, 3),
+    }
+    return centroids, codebooks, stats
+
+
+def build_template(dim, centroids, codebooks, pq_bits, metric="ip"):
+    """Create an empty, trained faiss IndexIVFPQ from NumPy codebooks."""
+    faiss = import_faiss()
+    faiss_metric = faiss.METRIC_INNER_PRODUCT if metric == "ip" else faiss.METRIC_L2
+    nlist, m = len(centroids), codebooks.shape[0]
+    quantizer = faiss.IndexFlatIP(dim) if metric == "ip" else faiss.IndexFlatL2(dim)
+    quantizer.add(np.ascontiguousarray(centroids, dtype=np.float32))
+    index = faiss.IndexIVFPQ(quantizer, dim, nlist, m, pq_bits, faiss_metric)
+    faiss.copy_array_to_vector(np.ascontiguousarray(codebooks, dtype=np.float32).ravel(), index.pq.centroids)
+    index.is_trained = True
+    return index
+
+
+def build_segments(variant_dir, template_path, paths, dim, segment_n=None,
+                   salt=0x7F4A7C15, normalize=True, ts=None):
+    """Add every input file to a copy of the trained template; one segment per file (or per segment_n rows)."""
+    faiss = import_faiss()
+    ts = ts if ts is not None else int(time.time() * 1000)
+    metas = []
+    for path in paths:
+        store = open_store(path, dim)
+        ids = fm.row_ids(Path(path).stem, store.shape[0], salt)
+        step = segment_n or max(store.shape[0], 1)
+        for start in range(0, store.shape[0], step):
+            index = faiss.read_index(str(template_path))
+            x = np.asarray(store[start:start + step], dtype=np.float32)
+            x = normalize_rows(x) if normalize else x
+            seg_ids = ids[start:start + step]
+            index.add_with_ids(np.ascontiguousarray(x), seg_ids)
+            meta = fm.publish_segment(variant_dir, lambda p: faiss.write_index(index, p), seg_ids, ts)
+            metas.append(meta)
+            ts = meta.ts + 1
+    return metas
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Train IVF_PQ offline and build app-compatible segments")
+    ap.add_argument("root", help="Index root (the host copy of MiraClip/out/faiss)")
+    ap.add_argument("inputs", nargs="+", help=".f32 embedding files (row-major N x dim)")
+    ap.add_argument("--variant", default="base")
+    ap.add_argument("--dim", type=int, default=512)
+    ap.add_argument("--nlist", type=int, default=fm.DEFAULT_PARAMS["nlist"])
+    ap.add_argument("--nprobe", type=int, default=fm.DEFAULT_PARAMS["nprobe"])
+    ap.add_argument("--pq-m", type=int, default=fm.DEFAULT_PARAMS["pqM"])
+    ap.add_argument("--pq-bits", type=int, default=fm.DEFAULT_PARAMS["pqBits"])
+    ap.add_argument("--batch-size", type=int, default=8192)
+    ap.add_argument("--epochs", type=int, default=2)
+    ap.add_argument("--max-train", type=int, default=None, help="Cap on training rows per epoch")
+    ap.add_argument("--segment-n", type=int, default=None, help="Split inputs into segments of this many rows")
+    ap.add_argument("--salt", type=lambda s: int(s, 0), default=0x7F4A7C15, help="idHashSalt")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--train-only", action="store_true", help="Write the trained template and manifest, no segments")
+    args = ap.parse_args()
+
+    for p in args.inputs:
+        if not Path(p).exists():
+            print(f"❌ Embedding file not found: {p}")
+            sys.exit(1)
+
+    variant_dir = fm.variant_root(args.root, args.variant)
+    variant_dir.mkdir(parents=True, exist_ok=True)
+
+    print(f"🔄 Training IVF_PQ nlist={args.nlist} pqM={args.pq_m} pqBits={args.pq_bits} on {len(args.inputs)} files...")
+    centroids, codebooks, stats = train_ivfpq(
+        args.inputs, args.dim, args.nlist, args.pq_m, args.pq_bits,
+        batch_size=args.batch_size, epochs=args.epochs, max_train=args.max_train, seed=args.seed)
+    print(f"  ✅ Trained on {stats['nTrain']} vectors in {stats['trainSec']}s "
+          f"(coarse MSE {stats['coarseMse']:.6f}, PQ MSE {stats['pqMse']:.6f})")
+
+    faiss = import_faiss()
+    template = build_template(args.dim, centroids, codebooks, args.pq_bits)
+    template_path = variant_dir / TEMPLATE_NAME
+    fm.write_atomic(template_path, faiss.serialize_index(template).tobytes())
+    np.savez(variant_dir / CODEBOOK_NAME, coarse=centroids, pq=codebooks)
+    print(f"💾 Saved trained template to {template_path}")
+
+    mf_path = fm.manifest_path(variant_dir)
+    mf = fm.load_manifest(mf_path) if mf_path.exists() else None
+    if mf is not None and mf.segments and (mf.indexType != "IVF_PQ" or mf.dim != args.dim):
+        print(f"❌ Existing manifest is {mf.indexType} dim={mf.dim}; refusing to mix segments")
+        sys.exit(1)
+
+    segments = [] if args.train_only else build_segments(
+        variant_dir, template_path, args.inputs, args.dim, args.segment_n, args.salt)
+    params = dict(fm.DEFAULT_PARAMS, nlist=args.nlist, nprobe=args.nprobe, pqM=args.pq_m, pqBits=args.pq_bits)
+    train_info = json.dumps(dict(stats, template=TEMPLATE_NAME, codebooks=CODEBOOK_NAME))
+    if mf is None:
+        mf = fm.FaissManifest(1, args.dim, "ip", "IVF_PQ", args.variant, params)
+    mf.params = params
+    mf.segments = mf.segments + segments
+    # Not mf.trained: the device worker would skip training without a template to add to.
+    mf.trainInfo = train_info
+    fm.save_manifest(mf_path, mf)
+
+    print(f"✅ Published {len(segments)} segments ({sum(s.count for s in segments)} vectors)")
+    print(f"📁 Manifest: {mf_path}")
+
+
+if __name__ == "__main__":
+    main()
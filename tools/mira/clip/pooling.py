@@ -0,0 +1,275 @@
+"""
+Frame Embedding Pooling
+Turns a per-frame embedding store (ingest.py output: <name>.emb or legacy
+.f32, plus <name>.ids.jsonl) into video-level vectors, laid out the way IngestWorker
+writes them through EmbeddingStore:
+
+  <out>/<variant>/<id>.f32   one little-endian float32 vector (writeVector)
+  <out>/<variant>/<id>.json  Meta {id, source, dim, frame_count, variant}
+  <out>/<variant>.emb        all video vectors as one store (+ ids sidecars)
+
+Pooling methods (variant = <model>_<method>_v1, e.g. clip_vit_b32_mean_v1):
+
+  mean  mean of L2-normalized frames, renormalized (ClipEngines.encodeFrames)
+  attn  softmax(frame . mean / tau) weighted mean
+  max   element-wise max over frames
+  tseg  frames split into --segments equal temporal segments; the
+        normalized segment means are averaged, so every part of the video
+        counts equally however many frames it has
+
+The store is read in one sequential pass: chunks of whole videos are pulled
+from the memmap and every video in a chunk is pooled at once with segment
+reductions (np.add.reduceat / np.maximum.reduceat), so memory stays bounded
+by --chunk-rows however many frames the corpus has. All requested methods
+share the same pass.
+
+--verify recomputes the vectors and compares them with existing per-video
+.f32 files (e.g. pulled from a device) instead of writing anything.
+
+Usage:
+    cd tools && python3 -m mira.clip.pooling out/clip_vit_b32/embeddings.emb \
+        --out out/videos [--method mean,attn,max,tseg] [--model clip_vit_b32]
+    cd tools && python3 -m mira.clip.pooling out/clip_vit_b32/embeddings.emb \
+        --verify device_embeddings/ [--method mean]
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from .embedding_store import AppendStore, dequantize, ids_path, offsets_path, read_header, read_quant
+from .search import open_store
+
+METHODS = ("mean", "attn", "max", "tseg")
+DEFAULT_MODEL = "clip_vit_b32"
+DEFAULT_CHUNK_ROWS = 32768
+DEFAULT_TAU = 0.1
+DEFAULT_SEGMENTS = 4
+
+
+def variant_name(model, method, version=1):
+    return f"{model}_{method}_v{version}"
+
+
+def l2_normalize(x):
+    """Row-wise L2 normalization; zero rows stay zero (as normalizeEmbedding)."""
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return np.divide(x, norms, out=np.zeros_like(x), where=norms > 0)
+
+
+def iter_video_runs(store_path, limit=None):
+    """(video, source, first_row, frame_count) per video, streamed from the ids sidecar (first `limit` rows)."""
+    seen = set()
+    current, source, start, row = None, None, 0, 0
+    with open(ids_path(store_path), encoding="utf-8") as f:
+        for line in f:
+            if not line.endswith("\n") or row == limit:
+                break  # torn last line or uncommitted rows from an interrupted ingest
+            rec = json.loads(line)
+            video = rec["video"]
+            if video != current:
+                if current is not None:
+                    yield current, source, start, row - start
+                if video in seen:
+                    raise ValueError(f"{ids_path(store_path)}: rows of video {video!r} are not contiguous (row {row})")
+                seen.add(video)
+                current, source, start = video, rec.get("source", video), row
+            row += 1
+    if current is not None:
+        yield current, source, start, row - start
+
+
+def iter_chunks(runs, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Groups consecutive video runs into chunks of about chunk_rows rows (never splitting a video)."""
+    chunk, rows = [], 0
+    for run in runs:
+        chunk.append(run)
+        rows += run[3]
+        if rows >= chunk_rows:
+            yield chunk
+            chunk, rows = [], 0
+    if chunk:
+        yield chunk
+
+
+def pool(x, counts, method, tau=DEFAULT_TAU, segments=DEFAULT_SEGMENTS):
+    """Pools consecutive runs of rows of x (run lengths `counts`) into one normalized row each."""
+    counts = np.asarray(counts, dtype=np.int64)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    x = l2_normalize(np.asarray(x, dtype=np.float32))
+    if method == "max":
+        return l2_normalize(np.maximum.reduceat(x, starts, axis=0))
+
+    mean = l2_normalize(np.add.reduceat(x, starts, axis=0) / counts[:, None])
+    if method == "mean":
+        return mean
+
+    owner = np.repeat(np.arange(len(counts)), counts)
+    if method == "attn":
+        logits = np.einsum("ij,ij->i", x, mean[owner]) / tau
+        logits -= np.maximum.reduceat(logits, starts)[owner]
+        w = np.exp(logits)
+        w /= np.add.reduceat(w, starts)[owner]
+        return l2_normalize(np.add.reduceat(x * w[:, None], starts, axis=0))
+
+    if method == "tseg":
+        local = np.arange(len(x)) - starts[owner]
+        key = owner * segments + local * segments // counts[owner]
+        seg_starts = np.flatnonzero(np.diff(key, prepend=-1))
+        seg_counts = np.diff(np.append(seg_starts, len(x)))
+        seg_means = l2_normalize(np.add.reduceat(x, seg_starts, axis=0) / seg_counts[:, None])
+        seg_owner = key[seg_starts] // segments
+        video_starts = np.flatnonzero(np.diff(seg_owner, prepend=-1))
+        return l2_normalize(np.add.reduceat(seg_means, video_starts, axis=0))
+
+    raise ValueError(f"Unknown pooling method {method!r} (expected one of {', '.join(METHODS)})")
+
+
+def iter_pooled(store_path, dim, methods, chunk_rows=DEFAULT_CHUNK_ROWS, tau=DEFAULT_TAU, segments=DEFAULT_SEGMENTS):
+    """Yields (runs, {method: (V, dim) vectors}) for each chunk of whole videos, in store order."""
+    store = open_store(store_path, dim)
+    quant = read_quant(store_path) if read_header(store_path) else None
+    for chunk in iter_chunks(iter_video_runs(store_path, len(store)), chunk_rows):
+        first, last = chunk[0][2], chunk[-1][2] + chunk[-1][3]
+        if last > len(store):
+            raise ValueError(f"{store_path}: ids sidecar lists {last} rows but the store has {len(store)}")
+        x = dequantize(store[first:last], quant)
+        counts = [run[3] for run in chunk]
+        yield chunk, {m: pool(x, counts, m, tau, segments) for m in methods}
+
+
+def video_paths(root, video):
+    base = Path(root) / video
+    return base.with_name(base.name + ".f32"), base.with_name(base.name + ".json")
+
+
+def write_video(root, video, source, vec, frame_count, variant):
+    """EmbeddingStore.writeVector + writeMetadata for one video."""
+    vec_path, meta_path = video_paths(root, video)
+    vec_path.parent.mkdir(parents=True, exist_ok=True)
+    vec_path.write_bytes(np.ascontiguousarray(vec, dtype="<f4").tobytes())
+    meta = {"id": video, "source": source, "dim": int(vec.shape[0]), "frame_count": int(frame_count),
+            "variant": variant}
+    # Same layout as kotlinx.serialization's prettyPrint (4-space indent, no trailing newline).
+    meta_path.write_text(json.dumps(meta, indent=4, ensure_ascii=False), encoding="utf-8")
+
+
+def pool_store(store_path, dim, out_dir, methods, model=DEFAULT_MODEL, chunk_rows=DEFAULT_CHUNK_ROWS,
+               tau=DEFAULT_TAU, segments=DEFAULT_SEGMENTS):
+    """Pools every video of the store with each method; returns {"videos", "frames"}."""
+    out_dir = Path(out_dir)
+    dim = open_store(store_path, dim).shape[1]
+    header = read_header(store_path)
+    variants = {m: variant_name(model, m) for m in methods}
+    stores = {}
+    for m, variant in variants.items():
+        path = out_dir / f"{variant}.emb"
+        for old in (path, ids_path(path), offsets_path(path)):
+            if old.exists():
+                old.unlink()
+        stores[m] = AppendStore(path, dim, model_sha=header.model_sha if header else None)
+    stats = {"videos": 0, "frames": 0}
+    try:
+        for runs, pooled in iter_pooled(store_path, dim, methods, chunk_rows, tau, segments):
+            for m, vectors in pooled.items():
+                records = []
+                for (video, source, _, count), vec in zip(runs, vectors):
+                    write_video(out_dir / variants[m], video, source, vec, count, variants[m])
+                    records.append({"id": video, "video": video, "frame_count": count, "source": source})
+                stores[m].append(vectors, records)
+            stats["videos"] += len(runs)
+            stats["frames"] += sum(run[3] for run in runs)
+    finally:
+        for s in stores.values():
+            s.close()
+    return stats
+
+
+def verify_dir(store_path, dim, ref_dir, method="mean", chunk_rows=DEFAULT_CHUNK_ROWS, tau=DEFAULT_TAU,
+               segments=DEFAULT_SEGMENTS):
+    """Compares pooled vectors with <ref_dir>/<id>.f32; returns (checked, missing, min cosine, max abs diff, worst id)."""
+    checked, missing = 0, []
+    min_cos, max_diff, worst = 1.0, 0.0, None
+    for runs, pooled in iter_pooled(store_path, dim, [method], chunk_rows, tau, segments):
+        for (video, _, _, _), vec in zip(runs, pooled[method]):
+            ref_path, _ = video_paths(ref_dir, video)
+            if not ref_path.exists():
+                missing.append(video)
+                continue
+            ref = np.fromfile(ref_path, dtype="<f4")
+            if ref.shape != vec.shape:
+                raise ValueError(f"{ref_path}: dim {ref.shape[0]} != {vec.shape[0]}")
+            cos = float(vec @ l2_normalize(ref[None])[0])
+            diff = float(np.abs(vec - ref).max())
+            checked += 1
+            max_diff = max(max_diff, diff)
+            if cos < min_cos:
+                min_cos, worst = cos, video
+    return checked, missing, min_cos, max_diff, worst
+
+
+def parse_methods(text):
+    methods = [m.strip() for m in text.split(",") if m.strip()]
+    unknown = [m for m in methods if m not in METHODS]
+    if unknown or not methods:
+        raise argparse.ArgumentTypeError(f"methods must be a comma list of {', '.join(METHODS)}")
+    return methods
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Pool frame embeddings into video-level vectors + Meta JSON")
+    ap.add_argument("store", help="Frame store .emb or legacy .f32 (with its .ids.jsonl sidecar)")
+    ap.add_argument("--dim", type=int, default=None, help="Embedding dimension (legacy .f32 stores only)")
+    ap.add_argument("--out", default=None, help="Output directory (one subdirectory per variant)")
+    ap.add_argument("--method", type=parse_methods, default=["mean"], help=f"Comma list of {', '.join(METHODS)}")
+    ap.add_argument("--model", default=DEFAULT_MODEL, help="Variant prefix (variant = <model>_<method>_v1)")
+    ap.add_argument("--tau", type=float, default=DEFAULT_TAU, help="Softmax temperature for attn")
+    ap.add_argument("--segments", type=int, default=DEFAULT_SEGMENTS, help="Temporal segments for tseg")
+    ap.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="Frames read per chunk")
+    ap.add_argument("--verify", default=None, metavar="DIR", help="Compare with existing <id>.f32 files instead of writing")
+    ap.add_argument("--tolerance", type=float, default=1e-4, help="Max 1 - cosine accepted by --verify")
+    args = ap.parse_args()
+
+    if not args.out and not args.verify:
+        ap.error("one of --out or --verify is required")
+    if not ids_path(args.store).exists():
+        print(f"❌ Missing ids sidecar: {ids_path(args.store)}")
+        sys.exit(1)
+
+    t0 = time.time()
+    try:
+        if args.verify:
+            method = args.method[0]
+            checked, missing, min_cos, max_diff, worst = verify_dir(
+                args.store, args.dim, args.verify, method, args.chunk_rows, args.tau, args.segments)
+            print(f"🔍 {method}: {checked} videos checked, {len(missing)} without a reference vector")
+            for video in missing[:5]:
+                print(f"  ⚠️  missing {video}")
+            if not checked:
+                print("❌ Nothing to compare")
+                sys.exit(1)
+            print(f"  min cosine {min_cos:.6f} ({worst}), max |diff| {max_diff:.2e}")
+            if 1.0 - min_cos > args.tolerance:
+                print(f"❌ Pooled vectors differ beyond tolerance {args.tolerance:g}")
+                sys.exit(2)
+            print("✅ Pooled vectors match")
+            return
+        stats = pool_store(args.store, args.dim, args.out, args.method, args.model, args.chunk_rows,
+                           args.tau, args.segments)
+    except (OSError, ValueError) as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+
+    elapsed = time.time() - t0
+    print(f"✅ Pooled {stats['frames']:,} frames into {stats['videos']:,} videos in {elapsed:.1f}s "
+          f"({stats['frames'] / max(elapsed, 1e-9):,.0f} frames/s)")
+    for m in args.method:
+        print(f"  💾 {Path(args.out) / variant_name(args.model, m)}/")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Quantized Embedding Stores
+Writes float16 or int8 copies of an embedding store and benchmarks them
+against the float32 original.
+
+  float16  2 bytes per value, scored after widening each chunk to float32
+  int8     1 byte per value: per-dimension scale/offset fitted to the
+           store's min/max, rows stored as uint8 codes and scored
+           asymmetrically (float32 query against the codes, see search.py)
+
+The benchmark runs the same queries through search.search on every store
+and reports recall@k against the exact float32 top-k, bytes per vector and
+queries/s. Queries are --queries JSON vectors or, by default, store rows
+with a little Gaussian noise.
+
+Usage:
+    cd tools && python3 -m mira.clip.quantize out/embeddings.emb --dtype int8 [--out out/embeddings.int8.emb]
+    cd tools && python3 -m mira.clip.quantize out/embeddings.emb --bench [--n-queries 256] [--batch 16] [--k 10]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from .embedding_store import (AppendStore, dequantize, ids_path, offsets_path, read_header, read_id_records,
+                              read_quant)
+from .search import DEFAULT_CHUNK_ROWS, load_queries, normalize_rows, open_store, search
+
+QUANT_DTYPES = ("float16", "int8")
+DEFAULT_N_QUERIES = 256
+DEFAULT_BATCH = 16
+DEFAULT_K = 10
+QUERY_NOISE = 0.05
+
+
+def fit_int8(store, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Per-dimension (scale, offset) mapping each dimension's [min, max] onto 0..255, in one pass."""
+    lo = np.full(store.shape[1], np.inf, dtype=np.float32)
+    hi = np.full(store.shape[1], -np.inf, dtype=np.float32)
+    for start in range(0, len(store), chunk_rows):
+        chunk = np.asarray(store[start:start + chunk_rows], dtype=np.float32)
+        lo = np.minimum(lo, chunk.min(axis=0))
+        hi = np.maximum(hi, chunk.max(axis=0))
+    if not len(store):
+        lo[:], hi[:] = 0.0, 0.0
+    scale = (hi - lo) / 255.0
+    scale[scale == 0] = 1.0  # constant dimension: every code decodes to lo
+    return scale.astype(np.float32), lo.astype(np.float32)
+
+
+def quantize_store(src, dst, dtype, dim=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Writes a float16 / int8 .emb copy of src (ids and model sha included); returns the row count."""
+    if dtype not in QUANT_DTYPES:
+        raise ValueError(f"Unknown dtype {dtype!r} (expected one of {', '.join(QUANT_DTYPES)})")
+    store = open_store(src, dim)
+    header = read_header(src)
+    if header is not None and header.dtype != "float32":
+        raise ValueError(f"{src} is already {header.dtype}")
+    dst = Path(dst)
+    for old in (dst, ids_path(dst), offsets_path(dst)):
+        if old.exists():
+            old.unlink()
+    records = read_id_records(src)
+    quant = fit_int8(store, chunk_rows) if dtype == "int8" else None
+    with AppendStore(dst, store.shape[1], model_sha=header.model_sha if header else None, dtype=dtype,
+                     quant=quant) as out:
+        for start in range(0, len(store), chunk_rows):
+            stop = min(start + chunk_rows, len(store))
+            out.append(store[start:stop], records[start:stop] if records else
+                       [{"id": str(i)} for i in range(start, stop)])
+        return out.count
+
+
+def sample_queries(store, n, seed=0, noise=QUERY_NOISE):
+    """n normalized store rows with Gaussian noise (near-duplicate lookups)."""
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(len(store), size=min(n, len(store)), replace=False))
+    q = np.asarray(store[rows], dtype=np.float32)
+    q = q + rng.standard_normal(q.shape, dtype=np.float32) * noise * np.abs(q).mean()
+    return normalize_rows(q)
+
+
+def recall_at_k(ids, truth):
+    k = truth.shape[1]
+    return float(np.mean([len(set(a[:k]) & set(b)) / k for a, b in zip(ids, truth)]))
+
+
+def bench_store(path, queries, k, chunk_rows, dim=None, batch=DEFAULT_BATCH, repeat=3):
+    """(ids, best queries/s, bytes per vector) of search.search over one store, `batch` queries per call."""
+    store = open_store(path, dim)
+    quant = read_quant(path)
+    ids, best = None, float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        ids = np.concatenate([search(store, queries[i:i + batch], k, chunk_rows, quant)[0]
+                              for i in range(0, len(queries), batch)])
+        best = min(best, time.perf_counter() - t0)
+    return ids, len(queries) / best, store.shape[1] * store.dtype.itemsize
+
+
+def quant_error(src, path, dim=None, rows=4096):
+    """Max |x - dequantized x| over the first rows of a quantized copy."""
+    a = np.asarray(open_store(src, dim)[:rows], dtype=np.float32)
+    b = dequantize(open_store(path)[:rows], read_quant(path))
+    return float(np.abs(a - b).max()) if len(a) else 0.0
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Write float16/int8 copies of an embedding store and benchmark them")
+    ap.add_argument("store", help="float32 .emb (or legacy .f32 with --dim) store")
+    ap.add_argument("--dim", type=int, default=None, help="Dimension of a legacy .f32 store")
+    ap.add_argument("--dtype", choices=QUANT_DTYPES, default=None, help="Write one quantized copy")
+    ap.add_argument("--out", default=None, help="Output path (default: <store>.<dtype>.emb)")
+    ap.add_argument("--bench", action="store_true", help="Write both copies (if missing) and benchmark them")
+    ap.add_argument("--queries", default=None, help="Query vectors JSON (default: noisy store rows)")
+    ap.add_argument("--n-queries", type=int, default=DEFAULT_N_QUERIES, help="Sampled queries when --queries is omitted")
+    ap.add_argument("--batch", type=int, default=DEFAULT_BATCH, help="Queries per search call (small batches are bandwidth-bound)")
+    ap.add_argument("--k", type=int, default=DEFAULT_K, help="Recall@k cutoff")
+    ap.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="Rows scored per matmul")
+    args = ap.parse_args()
+
+    if not args.dtype and not args.bench:
+        ap.error("one of --dtype or --bench is required")
+    src = Path(args.store)
+
+    def out_path(dtype):
+        return Path(args.out) if args.out and not args.bench else src.with_name(f"{src.stem}.{dtype}.emb")
+
+    try:
+        for dtype in (QUANT_DTYPES if args.bench else [args.dtype]):
+            dst = out_path(dtype)
+            if args.bench and dst.exists():
+                continue
+            t0 = time.time()
+            rows = quantize_store(src, dst, dtype, args.dim, args.chunk_rows)
+            print(f"💾 {dst}: {rows:,} rows {dtype} in {time.time() - t0:.1f}s, "
+                  f"max |error| {quant_error(src, dst, args.dim):.2e}")
+        if not args.bench:
+            return
+
+        base = open_store(src, args.dim)
+        queries = normalize_rows(load_queries(args.queries)[0]) if args.queries else sample_queries(base, args.n_queries)
+        print(f"⏱️  {len(queries)} queries in batches of {args.batch}, k={args.k}, {len(base):,} rows x {base.shape[1]}")
+        truth, base_qps, base_bytes = bench_store(src, queries, args.k, args.chunk_rows, args.dim, args.batch)
+        print(f"  {'store':<8} {'bytes/vec':>10} {'recall@' + str(args.k):>10} {'queries/s':>12} {'speedup':>8}")
+        print(f"  {'float32':<8} {base_bytes:>10,} {1.0:>10.4f} {base_qps:>12,.1f} {1.0:>7.2f}x")
+        for dtype in QUANT_DTYPES:
+            ids, qps, nbytes = bench_store(out_path(dtype), queries, args.k, args.chunk_rows, batch=args.batch)
+            print(f"  {dtype:<8} {nbytes:>10,} {recall_at_k(ids, truth):>10.4f} {qps:>12,.1f} {qps / base_qps:>7.2f}x")
+    except (OSError, ValueError) as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+"""
+Embedding Query Server
+Long-lived local search service over an embedding store: the store is
+memory-mapped once and queries arrive over localhost HTTP or a Unix socket,
+so a lookup costs milliseconds instead of a process start plus store load.
+
+Concurrent requests are coalesced into micro-batches: the batcher takes the
+first waiting query, keeps collecting until --max-batch query rows are
+queued or --max-wait-ms has passed, and scores the whole batch with one
+search.search call (one matmul per store chunk) in a worker thread.
+
+Endpoints (JSON over HTTP/1.1, keep-alive):
+  POST /search   {"vector": [...]} or {"vectors": [[...], ...]}, optional "k"
+                 -> {"results": [[{"row", "score", "id"?}, ...], ...]}
+  GET  /stats    counters, QPS and latency / batch-size histograms
+  GET  /health   {"ok": true, "rows": N, "dim": D}
+
+Usage:
+    cd tools && python3 -m mira.clip.query_server out/embeddings.emb [--port 8765] [--max-batch 64] [--max-wait-ms 2]
+    cd tools && python3 -m mira.clip.query_server out/embeddings.emb --unix /tmp/mira-search.sock
+    curl -s localhost:8765/search -d @query.json
+    curl -s --unix-socket /tmp/mira-search.sock localhost/stats
+"""
+
+import argparse
+import asyncio
+import bisect
+import json
+import math
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from .embedding_store import ids_path, offsets_path, read_header, read_quant
+from .search import DEFAULT_CHUNK_ROWS, DEFAULT_K, normalize_rows, open_store, search
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_MAX_BATCH = 64
+DEFAULT_MAX_WAIT_MS = 2.0
+MAX_K = 1000
+MAX_BODY = 64 * 2**20
+QPS_WINDOW_S = 10.0
+# Upper bounds in milliseconds; the last bucket is open-ended.
+LATENCY_BUCKETS_MS = (0.25, 0.5, 1, 2, 5, 10, 20, 50, 100, 250, 500, 1000, 2500)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+           500: "Internal Server Error"}
+
+
+class Histogram:
+    """Fixed-bucket histogram with count/sum and percentiles interpolated between each bucket's observed min/max."""
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.lows = [math.inf] * (len(self.bounds) + 1)
+        self.highs = [-math.inf] * (len(self.bounds) + 1)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        i = bisect.bisect_left(self.bounds, value)
+        self.counts[i] += 1
+        self.lows[i] = min(self.lows[i], value)
+        self.highs[i] = max(self.highs[i], value)
+        self.total += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def percentile(self, p):
+        if not self.total:
+            return 0.0
+        rank = p / 100.0 * self.total
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c and seen + c >= rank:
+                lo, hi = self.lows[i], self.highs[i]
+                if c == 1:
+                    return hi
+                # Spread the bucket's samples evenly from its smallest to its largest.
+                return lo + (hi - lo) * max(rank - seen - 1, 0) / (c - 1)
+            seen += c
+        return self.max
+
+    def to_dict(self):
+        labels = [f"le_{b}" for b in self.bounds] + ["inf"]
+        return {
+            "count": self.total,
+            "mean": self.sum / self.total if self.total else 0.0,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max,
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class Stats:
+    """Request/query counters, a sliding-window QPS and the server's histograms."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.requests = 0
+        self.queries = 0
+        self.batches = 0
+        self.errors = 0
+        self.recent = deque()  # (monotonic time, queries) of recent batches
+        self.latency_ms = Histogram(LATENCY_BUCKETS_MS)  # request arrival -> response ready
+        self.queue_ms = Histogram(LATENCY_BUCKETS_MS)  # waiting for a batch to start
+        self.search_ms = Histogram(LATENCY_BUCKETS_MS)  # one batched search call
+        self.batch_size = Histogram(BATCH_BUCKETS)
+
+    def record_batch(self, n, search_ms):
+        now = time.monotonic()
+        self.batches += 1
+        self.queries += n
+        self.batch_size.add(n)
+        self.search_ms.add(search_ms)
+        self.recent.append((now, n))
+        while self.recent and now - self.recent[0][0] > QPS_WINDOW_S:
+            self.recent.popleft()
+
+    def to_dict(self):
+        uptime = time.time() - self.started
+        now = time.monotonic()
+        window = sum(n for t, n in self.recent if now - t <= QPS_WINDOW_S)
+        return {
+            "uptime_s": round(uptime, 3),
+            "requests": self.requests,
+            "queries": self.queries,
+            "batches": self.batches,
+            "errors": self.errors,
+            "qps_total": self.queries / uptime if uptime else 0.0,
+            f"qps_last_{int(QPS_WINDOW_S)}s": window / QPS_WINDOW_S,
+            "latency_ms": self.latency_ms.to_dict(),
+            "queue_ms": self.queue_ms.to_dict(),
+            "search_ms": self.search_ms.to_dict(),
+            "batch_size": self.batch_size.to_dict(),
+        }
+
+
+class IdLookup:
+    """Row -> id record through the store's offsets table, without loading the sidecar."""
+
+    def __init__(self, store_path):
+        self.offsets = None
+        self.fh = None
+        idx, ids = offsets_path(store_path), ids_path(store_path)
+        if idx.exists() and ids.exists() and idx.stat().st_size:
+            self.offsets = np.memmap(idx, dtype="<u8", mode="r")
+            self.fh = open(ids, "rb")
+
+    def get(self, row):
+        if self.offsets is None or row >= len(self.offsets):
+            return None
+        start = int(self.offsets[row - 1]) if row else 0
+        self.fh.seek(start)
+        return json.loads(self.fh.read(int(self.offsets[row]) - start))
+
+    def close(self):
+        if self.fh:
+            self.fh.close()
+
+
+class Batcher:
+    """Coalesces queued queries into micro-batches scored by one search call."""
+
+    def __init__(self, store, quant, max_batch, max_wait_ms, chunk_rows, stats):
+        self.store = store
+        self.quant = quant
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.chunk_rows = chunk_rows
+        self.stats = stats
+        self.queue = asyncio.Queue()
+        # One worker: batches run back to back and BLAS gets the cores.
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mira-search")
+
+    async def submit(self, queries, k):
+        """(ids, scores) for a (Q, dim) block of normalized queries."""
+        fut = asyncio.get_running_loop().create_future()
+        await self.queue.put((queries, k, fut, time.perf_counter()))
+        return await fut
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self.queue.get()]
+            rows = len(items[0][0])
+            deadline = loop.time() + self.max_wait
+            while rows < self.max_batch:
+                try:
+                    item = self.queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self.queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                items.append(item)
+                rows += len(item[0])
+            await self.score(items)
+
+    async def score(self, items):
+        start = time.perf_counter()
+        for _, _, _, queued in items:
+            self.stats.queue_ms.add((start - queued) * 1000)
+        batch = np.concatenate([q for q, _, _, _ in items])
+        k = max(k for _, k, _, _ in items)
+        try:
+            ids, scores = await asyncio.get_running_loop().run_in_executor(
+                self.executor, search, self.store, batch, k, self.chunk_rows, self.quant)
+        except Exception as e:  # hand the failure to every waiter instead of killing the batcher
+            for _, _, fut, _ in items:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        self.stats.record_batch(len(batch), (time.perf_counter() - start) * 1000)
+        at = 0
+        for q, qk, fut, _ in items:
+            if not fut.done():
+                fut.set_result((ids[at:at + len(q), :qk], scores[at:at + len(q), :qk]))
+            at += len(q)
+
+
+class QueryServer:
+    """HTTP front end: parses requests, feeds the batcher, serves stats."""
+
+    def __init__(self, store_path, dim=None, max_batch=DEFAULT_MAX_BATCH, max_wait_ms=DEFAULT_MAX_WAIT_MS,
+                 chunk_rows=DEFAULT_CHUNK_ROWS, default_k=DEFAULT_K):
+        self.store_path = Path(store_path)
+        self.store = open_store(store_path, dim)
+        self.quant = read_quant(store_path) if read_header(store_path) else None
+        self.ids = IdLookup(store_path)
+        self.default_k = default_k
+        self.stats = Stats()
+        self.batcher = Batcher(self.store, self.quant, max_batch, max_wait_ms, chunk_rows, self.stats)
+
+    def parse_queries(self, body):
+        data = json.loads(body or b"null")
+        k = self.default_k
+        if isinstance(data, dict):
+            k = int(data.get("k", k))
+            if "vectors" in data:
+                data = data["vectors"]
+            elif "vector" in data:
+                data = data["vector"]
+            else:
+                raise ValueError("Expected 'vector'/'vectors' key or array")
+        q = np.asarray(data, dtype=np.float32)
+        if q.size == 0:
+            raise ValueError("Query must be a vector or a non-empty list of vectors")
+        if q.ndim == 1:
+            q = q[None, :]
+        if q.ndim != 2 or not len(q):
+            raise ValueError(f"Query must be a vector or a non-empty list of vectors, got shape {q.shape}")
+        if q.shape[1] != self.store.shape[1]:
+            raise ValueError(f"Query dimension {q.shape[1]} doesn't match store dimension {self.store.shape[1]}")
+        if not 1 <= k <= MAX_K:
+            raise ValueError(f"k must be between 1 and {MAX_K}")
+        return normalize_rows(q), k
+
+    def hits(self, ids, scores):
+        out = []
+        for row_ids, row_scores in zip(ids.tolist(), scores.tolist()):
+            hits = []
+            for row, score in zip(row_ids, row_scores):
+                hit = {"row": row, "score": score}
+                record = self.ids.get(row)
+                if record is not None:
+                    hit["id"] = record.get("id")
+                hits.append(hit)
+            out.append(hits)
+        return out
+
+    async def route(self, method, path, body):
+        if path == "/search":
+            if method != "POST":
+                return 405, {"error": "use POST"}
+            try:
+                queries, k = self.parse_queries(body)
+            except (ValueError, TypeError) as e:
+                return 400, {"error": str(e)}
+            ids, scores = await self.batcher.submit(queries, k)
+            return 200, {"results": self.hits(ids, scores)}
+        if path == "/stats":
+            return 200, self.stats.to_dict()
+        if path == "/health":
+            return 200, {"ok": True, "rows": int(self.store.shape[0]), "dim": int(self.store.shape[1]),
+                         "store": str(self.store_path)}
+        return 404, {"error": f"no route {path}"}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                arrived = time.perf_counter()
+                try:
+                    method, target, version = line.decode("latin-1").split()
+                except ValueError:
+                    await self.respond(writer, 400, {"error": "malformed request line"}, False)
+                    break
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = h.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = (headers.get("connection", "").lower() != "close"
+                              if version == "HTTP/1.1" else headers.get("connection", "").lower() == "keep-alive")
+                length = int(headers.get("content-length", 0) or 0)
+                if length > MAX_BODY:
+                    await self.respond(writer, 413, {"error": "body too large"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                self.stats.requests += 1
+                try:
+                    status, payload = await self.route(method, target.split("?", 1)[0], body)
+                except Exception as e:
+                    status, payload = 500, {"error": str(e)}
+                if status != 200:
+                    self.stats.errors += 1
+                if target.startswith("/search") and status == 200:
+                    self.stats.latency_ms.add((time.perf_counter() - arrived) * 1000)
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload).encode()
+        writer.write(f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                     f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body)
+        await writer.drain()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, unix=None):
+        batcher = asyncio.create_task(self.batcher.run())
+        if unix:
+            if os.path.exists(unix):
+                os.unlink(unix)
+            server = await asyncio.start_unix_server(self.handle, path=unix)
+            where = f"unix:{unix}"
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+            where = f"http://{host}:{server.sockets[0].getsockname()[1]}"
+        print(f"🚀 Serving {self.store.shape[0]:,} x {self.store.shape[1]} from {self.store_path} on {where} "
+              f"(max batch {self.batcher.max_batch}, max wait {self.batcher.max_wait * 1000:g} ms)")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            self.batcher.executor.shutdown(wait=False)
+            self.ids.close()
+            if unix and os.path.exists(unix):
+                os.unlink(unix)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Local micro-batching query server over an embedding store")
+    ap.add_argument("store", help=".emb store (or legacy .f32 with --dim)")
+    ap.add_argument("--dim", type=int, default=None, help="Dimension of a legacy .f32 store")
+    ap.add_argument("--host", default=DEFAULT_HOST, help="Bind address (keep it local)")
+    ap.add_argument("--port", type=int, default=DEFAULT_PORT, help="TCP port (0 picks a free one)")
+    ap.add_argument("--unix", default=None, metavar="PATH", help="Serve on a Unix socket instead of TCP")
+    ap.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH, help="Query rows per micro-batch")
+    ap.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS,
+                    help="How long the first query of a batch waits for company")
+    ap.add_argument("--k", type=int, default=DEFAULT_K, help="Default k when a request omits it")
+    ap.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="Rows scored per matmul")
+    args = ap.parse_args()
+
+    if args.max_batch < 1 or args.max_wait_ms < 0:
+        ap.error("--max-batch must be >= 1 and --max-wait-ms >= 0")
+    try:
+        server = QueryServer(args.store, args.dim, args.max_batch, args.max_wait_ms, args.chunk_rows, args.k)
+    except (OSError, ValueError) as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        print("\n👋 Stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""
+Retrieval Benchmark
+Measures what the FaissDesignConfig knobs cost: builds FLAT_IP, IVF_PQ and
+HNSW_IP indexes over clustered synthetic embeddings and sweeps their
+build-time (nlist, pqM, hnswM, efConstruction) and search-time (nprobe,
+efSearch) parameters. IVF_PQ is also measured with a flat re-rank stage
+(`rerank` = faiss IndexRefineFlat k_factor: PQ shortlists rerank * k
+candidates, exact inner products order them), which costs the raw vectors
+in bytes but recovers the recall PQ alone loses.
+
+For every configuration it records build time, index bytes (serialized),
+p50/p99 single-query latency, batched queries/s and recall@k against exact
+inner-product ground truth (search.search over the raw vectors). Results
+are written as JSON together with two Pareto fronts, recall vs p99 latency
+and recall vs bytes per vector, which are what a config choice trades.
+
+The data are unit vectors drawn around `clusters` random centres with
+Zipf-like cluster sizes, roughly how CLIP embeddings of a video library
+bunch up; queries come from the same distribution but are not in the base.
+The default spread lets clusters overlap, so a query's true neighbours span
+several IVF lists and nprobe has something to find; with tight clusters
+(low spread) the neighbours sit in one list and differ by less than the PQ
+error, which makes every nprobe look the same.
+
+Like mira.whisper.bench, a run can be saved as a baseline and later runs
+checked against it: a recall drop beyond --recall-tolerance, or latency
+beyond --tolerance, on any baseline configuration exits with status 3.
+
+Usage:
+    cd tools && python3 -m mira.clip.retrieval_bench --n 100000 --dim 512 --out bench.json
+    cd tools && python3 -m mira.clip.retrieval_bench --nlist 256,1024 --pq-m 32,64 --nprobe 4,16,64 --rerank 0,8 \
+        --hnsw-m 16,32 --ef-construction 100,200 --ef-search 16,64,128
+    cd tools && python3 -m mira.clip.retrieval_bench --baseline mira/clip/baselines/retrieval_bench.json
+
+Requires faiss (pip install faiss-cpu).
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+
+from . import faiss_manifest as fm
+from .faiss_search import apply_runtime_params, import_faiss
+from .search import normalize_rows, search
+
+DEFAULT_N = 100000
+DEFAULT_DIM = 512
+DEFAULT_CLUSTERS = 1000
+DEFAULT_QUERIES = 1000
+DEFAULT_LATENCY_QUERIES = 200
+DEFAULT_K = 10
+DEFAULT_SPREAD = 1.0
+INDEX_TYPES = ("FLAT_IP", "IVF_PQ", "HNSW_IP")
+DEFAULT_RERANK = [0, 8]
+RUNTIME_PARAMS = ("nprobe", "efS", "rerank")
+# faiss wants at least this many training points per IVF list.
+MIN_POINTS_PER_LIST = 39
+
+
+def clustered_embeddings(n, dim, clusters=DEFAULT_CLUSTERS, spread=DEFAULT_SPREAD, seed=0, chunk_rows=65536):
+    """(n, dim) unit vectors around random centres; cluster sizes follow 1/rank."""
+    rng = np.random.default_rng(seed)
+    centres = normalize_rows(rng.standard_normal((clusters, dim), dtype=np.float32))
+    weights = 1.0 / np.arange(1, clusters + 1)
+    weights /= weights.sum()
+    out = np.empty((n, dim), dtype=np.float32)
+    noise = spread / np.sqrt(dim)
+    for start in range(0, n, chunk_rows):
+        m = min(chunk_rows, n - start)
+        owner = rng.choice(clusters, size=m, p=weights)
+        out[start:start + m] = normalize_rows(centres[owner] + noise * rng.standard_normal((m, dim), dtype=np.float32))
+    return out
+
+
+def ground_truth(base, queries, k):
+    return search(base, queries, k)[0]
+
+
+def recall_at_k(labels, truth):
+    k = truth.shape[1]
+    return float(np.mean([len(np.intersect1d(a[:k], b)) / k for a, b in zip(labels, truth)]))
+
+
+def build_index(index_type, base, params):
+    """Builds one index; returns (index, build seconds)."""
+    faiss = import_faiss()
+    dim = base.shape[1]
+    t0 = time.perf_counter()
+    if index_type == "FLAT_IP":
+        index = faiss.IndexFlatIP(dim)
+    elif index_type == "IVF_PQ":
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, params["nlist"], params["pqM"], params["pqBits"],
+                                 faiss.METRIC_INNER_PRODUCT)
+        index.train(base)
+    elif index_type == "HNSW_IP":
+        index = faiss.IndexHNSWFlat(dim, params["hnswM"], faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = params["efC"]
+    else:
+        raise ValueError(f"Unknown index type {index_type!r}")
+    index.add(base)
+    return index, time.perf_counter() - t0
+
+
+def index_bytes(index):
+    return int(import_faiss().serialize_index(index).nbytes)
+
+
+def measure(index, queries, k, latency_queries):
+    """(labels for all queries, batched queries/s, p50 ms, p99 ms of single-query searches)."""
+    t0 = time.perf_counter()
+    _, labels = index.search(queries, k)
+    qps = len(queries) / (time.perf_counter() - t0)
+    times = []
+    for q in queries[:latency_queries]:
+        t0 = time.perf_counter()
+        index.search(q[None, :], k)
+        times.append((time.perf_counter() - t0) * 1000)
+    return labels, qps, float(np.percentile(times, 50)), float(np.percentile(times, 99))
+
+
+def config_key(index_type, params):
+    return index_type + "".join(f" {k}={v}" for k, v in sorted(params.items()))
+
+
+def sweep_configs(args, n):
+    """(index_type, build params, [runtime params]) for every requested build."""
+    configs = []
+    if "FLAT_IP" in args.types:
+        configs.append(("FLAT_IP", {}, [{}]))
+    if "IVF_PQ" in args.types:
+        for nlist in args.nlist:
+            if nlist * MIN_POINTS_PER_LIST > n:
+                print(f"⚠️  Skipping nlist={nlist}: needs {nlist * MIN_POINTS_PER_LIST:,} training vectors")
+                continue
+            for m in args.pq_m:
+                if args.dim % m:
+                    print(f"⚠️  Skipping pqM={m}: dim {args.dim} is not divisible by it")
+                    continue
+                configs.append(("IVF_PQ", {"nlist": nlist, "pqM": m, "pqBits": args.pq_bits},
+                                [{"nprobe": p, **({"rerank": r} if r else {})}
+                                 for r in args.rerank for p in args.nprobe if p <= nlist]))
+    if "HNSW_IP" in args.types:
+        for m in args.hnsw_m:
+            for efc in args.ef_construction:
+                configs.append(("HNSW_IP", {"hnswM": m, "efC": efc}, [{"efS": ef} for ef in args.ef_search]))
+    return configs
+
+
+def configs_from_results(results):
+    """The sweep that produced `results` (e.g. a baseline), grouped back into builds."""
+    builds = {}
+    for r in results:
+        build = {k: v for k, v in r["params"].items() if k not in RUNTIME_PARAMS}
+        runtime = {k: v for k, v in r["params"].items() if k in RUNTIME_PARAMS}
+        builds.setdefault(config_key(r["indexType"], build), (r["indexType"], build, []))[2].append(runtime)
+    return list(builds.values())
+
+
+def with_rerank(index, base, k_factor):
+    """Wraps a built index in a flat re-rank stage over the raw vectors."""
+    faiss = import_faiss()
+    refine = faiss.IndexRefineFlat(index, faiss.swig_ptr(np.ascontiguousarray(base)))
+    refine.k_factor = k_factor
+    return refine
+
+
+def run_sweep(base, queries, truth, configs, k, latency_queries):
+    results = []
+    for index_type, build_params, runtime in configs:
+        index, build_s = build_index(index_type, base, build_params)
+        nbytes = index_bytes(index)
+        refine = None
+        for rt in runtime:
+            # nprobe / efSearch go to the built index, which a re-rank wrapper searches through.
+            apply_runtime_params(index, index_type, rt.get("nprobe"), rt.get("efS"))
+            searched, nbytes_rt = index, nbytes
+            if rt.get("rerank"):
+                if refine is None:
+                    refine = with_rerank(index, base, rt["rerank"])
+                    refine_bytes = index_bytes(refine)
+                refine.k_factor = rt["rerank"]
+                searched, nbytes_rt = refine, refine_bytes
+            labels, qps, p50, p99 = measure(searched, queries, k, latency_queries)
+            params = {**build_params, **rt}
+            row = {"key": config_key(index_type, params), "indexType": index_type, "params": params,
+                   "build_s": round(build_s, 3), "bytes": nbytes_rt,
+                   "bytes_per_vector": round(nbytes_rt / len(base), 1),
+                   "p50_ms": round(p50, 4), "p99_ms": round(p99, 4), "qps": round(qps, 1),
+                   f"recall@{k}": round(recall_at_k(labels, truth), 4)}
+            results.append(row)
+            print(f"  {row['key']:<50} build {build_s:7.2f}s  {row['bytes_per_vector']:>8.1f} B/vec  "
+                  f"p50 {p50:8.3f}ms  p99 {p99:8.3f}ms  recall@{k} {row[f'recall@{k}']:.4f}")
+        del index, refine
+    return results
+
+
+def pareto(results, cost, recall):
+    """Keys of results not dominated on (higher recall, lower cost), cheapest first."""
+    front, best = [], -1.0
+    for r in sorted(results, key=lambda r: (r[cost], -r[recall])):
+        if r[recall] > best:
+            front.append(r["key"])
+            best = r[recall]
+    return front
+
+
+def check_regressions(results, baseline, k, tolerance, recall_tolerance):
+    """(key, metric, baseline, current) for every baseline config that got worse."""
+    recall = f"recall@{k}"
+    current = {r["key"]: r for r in results}
+    found = []
+    for base in baseline.get("results", []):
+        cur = current.get(base["key"])
+        if cur is None:
+            continue
+        if base.get(recall) is not None and cur[recall] < base[recall] - recall_tolerance:
+            found.append((base["key"], recall, base[recall], cur[recall]))
+        if tolerance is not None:
+            for metric in ("p50_ms", "p99_ms"):
+                if cur[metric] > base[metric] * (1 + tolerance):
+                    found.append((base["key"], metric, base[metric], cur[metric]))
+    return found
+
+
+def int_list(text):
+    return [int(v) for v in text.split(",") if v.strip()]
+
+
+def main():
+    faiss_defaults = fm.DEFAULT_PARAMS
+    ap = argparse.ArgumentParser(description="Sweep FLAT_IP / IVF_PQ / HNSW_IP parameters into recall/latency Pareto curves")
+    ap.add_argument("--n", type=int, default=DEFAULT_N, help="Base vectors")
+    ap.add_argument("--dim", type=int, default=DEFAULT_DIM, help="Embedding dimension (FaissDesignConfig.dim)")
+    ap.add_argument("--clusters", type=int, default=DEFAULT_CLUSTERS, help="Synthetic clusters")
+    ap.add_argument("--spread", type=float, default=DEFAULT_SPREAD, help="Noise around cluster centres (higher = clusters overlap more)")
+    ap.add_argument("--queries", type=int, default=DEFAULT_QUERIES, help="Queries for recall and queries/s")
+    ap.add_argument("--latency-queries", type=int, default=DEFAULT_LATENCY_QUERIES, help="Single-query searches timed for p50/p99")
+    ap.add_argument("--k", type=int, default=DEFAULT_K, help="Recall@k cutoff")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--types", type=lambda s: s.split(","), default=list(INDEX_TYPES), help="Comma list of index types")
+    ap.add_argument("--nlist", type=int_list, default=[256, 1024, faiss_defaults["nlist"]])
+    ap.add_argument("--pq-m", type=int_list, default=[32, faiss_defaults["pqM"]])
+    ap.add_argument("--pq-bits", type=int, default=faiss_defaults["pqBits"])
+    ap.add_argument("--nprobe", type=int_list, default=[4, faiss_defaults["nprobe"], 64])
+    ap.add_argument("--rerank", type=int_list, default=DEFAULT_RERANK,
+                    help="IVF_PQ flat re-rank k_factors (0 = PQ scores only)")
+    ap.add_argument("--hnsw-m", type=int_list, default=[16, faiss_defaults["hnswM"]])
+    ap.add_argument("--ef-construction", type=int_list, default=[100, faiss_defaults["efC"]])
+    ap.add_argument("--ef-search", type=int_list, default=[16, faiss_defaults["efS"], 128])
+    ap.add_argument("--threads", type=int, default=1, help="faiss OpenMP threads (1 keeps latency comparable)")
+    ap.add_argument("--out", default=None, help="Write the full results JSON here")
+    ap.add_argument("--save-baseline", default=None, help="Write this run as a baseline JSON")
+    ap.add_argument("--baseline", default=None, help="Baseline JSON to check against")
+    ap.add_argument("--tolerance", type=float, default=None, help="Allowed relative latency increase (latency is not checked if omitted)")
+    ap.add_argument("--recall-tolerance", type=float, default=0.01, help="Allowed absolute recall drop")
+    args = ap.parse_args()
+
+    unknown = [t for t in args.types if t not in INDEX_TYPES]
+    if unknown:
+        ap.error(f"unknown index types {unknown} (expected {', '.join(INDEX_TYPES)})")
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        # Re-run exactly the baseline's data set and configurations so recall is comparable.
+        for key in ("n", "dim", "clusters", "spread", "queries", "k", "seed"):
+            setattr(args, key, baseline["config"][key])
+    try:
+        faiss = import_faiss()
+    except ImportError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    faiss.omp_set_num_threads(args.threads)
+
+    t0 = time.time()
+    data = clustered_embeddings(args.n + args.queries, args.dim, args.clusters, args.spread, args.seed)
+    base, queries = data[:args.n], data[args.n:]
+    truth = ground_truth(base, queries, args.k)
+    print(f"📊 {args.n:,} x {args.dim} base, {args.queries} queries, {args.clusters} clusters "
+          f"(data + ground truth {time.time() - t0:.1f}s)")
+
+    configs = configs_from_results(baseline["results"]) if baseline else sweep_configs(args, args.n)
+    results = run_sweep(base, queries, truth, configs, args.k, args.latency_queries)
+
+    recall = f"recall@{args.k}"
+    report = {
+        "config": {"n": args.n, "dim": args.dim, "clusters": args.clusters, "spread": args.spread,
+                   "queries": args.queries, "latency_queries": args.latency_queries, "k": args.k,
+                   "seed": args.seed, "threads": args.threads, "faiss": faiss.__version__,
+                   "numpy": np.__version__, "machine": platform.machine(), "python": platform.python_version()},
+        "results": results,
+        "pareto": {"recall_vs_p99_ms": pareto(results, "p99_ms", recall),
+                   "recall_vs_bytes_per_vector": pareto(results, "bytes_per_vector", recall)},
+    }
+    print(f"\n🎯 Pareto front, {recall} vs p99 latency:")
+    by_key = {r["key"]: r for r in results}
+    for key in report["pareto"]["recall_vs_p99_ms"]:
+        print(f"  {key:<50} {recall} {by_key[key][recall]:.4f}  p99 {by_key[key]['p99_ms']:.3f}ms")
+    print(f"🎯 Pareto front, {recall} vs bytes/vector:")
+    for key in report["pareto"]["recall_vs_bytes_per_vector"]:
+        print(f"  {key:<50} {recall} {by_key[key][recall]:.4f}  {by_key[key]['bytes_per_vector']:.1f} B/vec")
+
+    for path in (args.out, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+                f.write("\n")
+            print(f"💾 {path}")
+
+    if baseline:
+        regressions = check_regressions(results, baseline, args.k, args.tolerance, args.recall_tolerance)
+        for key, metric, old, new in regressions:
+            print(f"  ❌ {key}: {metric} {old} -> {new}")
+        if regressions:
+            print(f"❌ {len(regressions)} regression(s) against {args.baseline}")
+            sys.exit(3)
+        print(f"✅ No regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
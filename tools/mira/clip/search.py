@@ -0,0 +1,128 @@
+"""
+Embedding Store Search
+Memory-mapped, chunked top-k inner-product search over .f32 embedding stores.
+
+A store is either a self-describing .emb file or a legacy headerless
+little-endian float32 file holding N rows of `dim` values (the layout written
+by EmbeddingStore.writeVector); see embedding_store. The file is mapped as an
+(N, dim) matrix and scored chunk by chunk with BLAS matmuls, so memory stays
+bounded by `chunk_rows` regardless of store size.
+
+float16 chunks are widened to float32 for the matmul. int8 stores are scored
+asymmetrically: with x = offset + scale * c per dimension,
+q . x = (q * scale) . c + q . offset, so the uint8 codes c go straight into
+the matmul and the rows are never dequantized.
+"""
+
+import json
+
+import numpy as np
+
+from .embedding_store import open_vectors
+
+DEFAULT_K = 10
+DEFAULT_CHUNK_ROWS = 65536
+# float16 / int8 rows are widened this many at a time into one reused buffer
+# that stays cache-resident, instead of materializing a float32 copy per chunk.
+WIDEN_ROWS = 4096
+
+
+def open_store(path, dim=None):
+    """Memory-map a store as a read-only (N, dim) matrix; dim may be omitted for .emb stores."""
+    return open_vectors(path, dim)
+
+
+def normalize_rows(x):
+    """L2-normalize each row; zero rows are left untouched."""
+    x = np.atleast_2d(np.asarray(x, dtype=np.float32))
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+def topk(scores, k):
+    """Return (indices, values) of the k largest entries per row, sorted descending."""
+    scores = np.atleast_2d(scores)
+    k = min(k, scores.shape[1])
+    if k == 0:
+        empty = np.zeros((scores.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(scores.dtype)
+    if k < scores.shape[1]:
+        idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        idx = np.broadcast_to(np.arange(scores.shape[1]), scores.shape).copy()
+    vals = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-vals, axis=1, kind='stable')
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(vals, order, axis=1)
+
+
+def merge_topk(ids_a, vals_a, ids_b, vals_b, k):
+    """Merge two per-query top-k candidate lists into one."""
+    ids = np.concatenate([ids_a, ids_b], axis=1)
+    vals = np.concatenate([vals_a, vals_b], axis=1)
+    sel, best = topk(vals, k)
+    return np.take_along_axis(ids, sel, axis=1), best
+
+
+def search(store, queries, k=DEFAULT_K, chunk_rows=DEFAULT_CHUNK_ROWS, quant=None):
+    """
+    Score queries against every store row by inner product.
+
+    `quant` is the (scale, offset) pair of an int8 store (embedding_store.read_quant).
+    Returns (ids, scores), both shaped (Q, min(k, N)), best first.
+    """
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    if queries.shape[1] != store.shape[1]:
+        raise ValueError(f"Query dimension {queries.shape[1]} doesn't match store dimension {store.shape[1]}")
+    nq, n = queries.shape[0], store.shape[0]
+    bias = 0.0
+    if quant is not None:
+        scale, offset = quant
+        bias = (queries @ offset)[:, None]
+        queries = queries * scale
+    best_ids = np.zeros((nq, 0), dtype=np.int64)
+    best_vals = np.zeros((nq, 0), dtype=np.float32)
+    buf = np.empty((min(WIDEN_ROWS, n), store.shape[1]), dtype=np.float32) if store.dtype != np.float32 else None
+    for start in range(0, n, chunk_rows):
+        chunk = store[start:start + chunk_rows]
+        if buf is None:
+            scores = queries @ np.asarray(chunk, dtype=np.float32).T
+        else:
+            scores = np.empty((nq, len(chunk)), dtype=np.float32)
+            for s in range(0, len(chunk), WIDEN_ROWS):
+                block = buf[:len(chunk[s:s + WIDEN_ROWS])]
+                np.copyto(block, chunk[s:s + WIDEN_ROWS], casting='unsafe')
+                scores[:, s:s + len(block)] = queries @ block.T
+        idx, vals = topk(scores, k)
+        best_ids, best_vals = merge_topk(best_ids, best_vals, idx + start, vals, k)
+    # The q . offset term is the same for every row, so it does not change the ranking.
+    return best_ids, best_vals + bias
+
+
+def load_queries(path):
+    """
+    Load one or many query vectors from JSON.
+
+    Accepts a flat array, an array of arrays, {"vector": [...]} or
+    {"vectors": [[...], ...]}. Returns (matrix, is_batch).
+    """
+    with open(path, 'r') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        if 'vectors' in data:
+            data = data['vectors']
+        elif 'vector' in data:
+            data = data['vector']
+        else:
+            raise ValueError("Invalid query format. Expected 'vector'/'vectors' key or array.")
+    arr = np.asarray(data, dtype=np.float32)
+    if arr.ndim == 1:
+        return arr[None, :], False
+    if arr.ndim == 2:
+        return arr, True
+    raise ValueError(f"Query must be a vector or a list of vectors, got shape {arr.shape}")
+
+
+def format_results(ids, scores):
+    """Render one query's hits as the legacy [(row, score), ...] list."""
+    return [(int(i), float(s)) for i, s in zip(ids, scores)]
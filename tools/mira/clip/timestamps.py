@@ -0,0 +1,72 @@
+"""
+Timestamp Policies
+Frame timestamps in milliseconds, bit-for-bit identical to
+com.mira.clip.sampler.TimestampPolicies on device.
+
+tsn_jitter reproduces java.util.Random(42).nextDouble() exactly, and
+Kotlin's roundToLong (Math.round, i.e. floor(x + 0.5)), so host-side
+embeddings are computed at the same frames the app samples.
+"""
+
+import math
+
+JAVA_MULTIPLIER = 0x5DEECE66D
+JAVA_ADDEND = 0xB
+JAVA_MASK = (1 << 48) - 1
+DEFAULT_SEED = 42
+
+
+class JavaRandom:
+    """The java.util.Random 48-bit LCG (only what TimestampPolicies needs)."""
+
+    def __init__(self, seed=DEFAULT_SEED):
+        self.seed = (seed ^ JAVA_MULTIPLIER) & JAVA_MASK
+
+    def next_bits(self, bits):
+        self.seed = (self.seed * JAVA_MULTIPLIER + JAVA_ADDEND) & JAVA_MASK
+        return self.seed >> (48 - bits)
+
+    def next_double(self):
+        return ((self.next_bits(26) << 27) + self.next_bits(27)) * (1.0 / (1 << 53))
+
+
+def round_to_long(x):
+    """Kotlin Double.roundToLong(): ties round towards positive infinity."""
+    return math.floor(x + 0.5)
+
+
+def _monotonic(stamps, duration_ms):
+    for i in range(1, len(stamps)):
+        if stamps[i] <= stamps[i - 1]:
+            stamps[i] = min(stamps[i - 1] + 1, duration_ms)
+    return stamps
+
+
+def uniform(duration_ms, n):
+    """TimestampPolicies.uniform: n stamps from 0 to duration_ms inclusive."""
+    if n < 2:
+        raise ValueError("n>=2")
+    if duration_ms <= 0:
+        return [0] * n
+    denom = float(n - 1)
+    stamps = [min(max(round_to_long((i / denom) * float(duration_ms)), 0), duration_ms) for i in range(n)]
+    return _monotonic(stamps, duration_ms)
+
+
+def tsn_jitter(duration_ms, n, rng=None):
+    """TimestampPolicies.tsnJitter: one random stamp per equal segment (Random(42) by default)."""
+    if n < 2:
+        raise ValueError("n>=2")
+    if duration_ms <= 0:
+        return [0] * n
+    rng = rng or JavaRandom(DEFAULT_SEED)
+    seg = float(duration_ms) / n
+    stamps = []
+    for i in range(n):
+        start, end = i * seg, (i + 1) * seg
+        t = start + rng.next_double() * (end - start)
+        stamps.append(min(max(round_to_long(t), 0), duration_ms))
+    return _monotonic(stamps, duration_ms)
+
+
+POLICIES = {"uniform": uniform, "tsn_jitter": tsn_jitter}
@@ -0,0 +1,282 @@
+"""
+CLIP BPE Tokenizer
+Host-side tokenizer built only from the artifacts that
+tools/export_clip_torchscript.py writes for ClipBPETokenizer:
+vocab.json, merges.txt and tokenizer_config.json.
+
+Matches the CLIPTokenizerFast pipeline that AutoTokenizer returns:
+  * normalize: NFC, collapse whitespace, lowercase
+  * pre-tokenize: special tokens, contractions, letter runs, single digits,
+    punctuation runs, then bytes mapped to printable unicode
+  * BPE: the lowest-ranked adjacent pair is merged first (rank = line in
+    merges.txt), with "</w>" marking the end of a word
+
+Results of the word-level BPE are kept in an LRU cache, so repeated words
+(the common case for prompt vocabularies) skip the merge loop. encode_many
+returns an (N, context_length) int64 array: SOT, tokens, EOT, then padding
+(EOT unless tokenizer_config.json sets pad_id). Over-long inputs are
+truncated with EOT kept in the last position.
+
+Usage:
+    cd tools && python3 -m mira.clip.tokenizer "a photo of a dog" [--tok-dir .]
+    cd tools && python3 -m mira.clip.tokenizer --parity prompts.txt --hf openai/clip-vit-base-patch32
+    cd tools && python3 -m mira.clip.tokenizer --bench prompts.txt --hf openai/clip-vit-base-patch32
+"""
+
+import argparse
+import json
+import sys
+import time
+import unicodedata
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import regex as re
+    WORD_PATTERN = r"""'s|'t|'re|'ve|'m|'ll|'d|[\p{L}]+|[\p{N}]|[^\s\p{L}\p{N}]+"""
+except ImportError:
+    import re
+    # Without the regex package, \p{L} / \p{N} are approximated with re's classes.
+    WORD_PATTERN = r"""'s|'t|'re|'ve|'m|'ll|'d|[^\W\d_]+|\d|[^\s\w]+|_+"""
+
+DEFAULT_TOK_DIR = Path(__file__).resolve().parents[2]
+DEFAULT_CONTEXT_LENGTH = 77
+DEFAULT_CACHE_SIZE = 65536
+SOT_TOKEN = "<|startoftext|>"
+EOT_TOKEN = "<|endoftext|>"
+END_OF_WORD = "</w>"
+
+
+def bytes_to_unicode():
+    """GPT-2 / CLIP byte -> printable unicode table."""
+    bs = list(range(ord("!"), ord("~") + 1)) + list(range(ord("¡"), ord("¬") + 1)) + list(range(ord("®"), ord("ÿ") + 1))
+    cs = bs[:]
+    n = 0
+    for b in range(256):
+        if b not in bs:
+            bs.append(b)
+            cs.append(256 + n)
+            n += 1
+    return dict(zip(bs, map(chr, cs)))
+
+
+def load_merges(path):
+    """Merge pairs in rank order; '#version' headers and blank lines are skipped."""
+    merges = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line or line.startswith("#version"):
+                continue
+            parts = line.split(" ")
+            if len(parts) != 2:
+                raise ValueError(f"{path}: malformed merge line {line!r}")
+            merges.append((parts[0], parts[1]))
+    return merges
+
+
+class ClipTokenizer:
+    """BPE tokenizer over exported vocab.json / merges.txt / tokenizer_config.json."""
+
+    def __init__(self, vocab, merges, context_length=DEFAULT_CONTEXT_LENGTH, sot_id=None, eot_id=None,
+                 pad_id=None, cache_size=DEFAULT_CACHE_SIZE):
+        self.encoder = vocab
+        self.decoder = {v: k for k, v in vocab.items()}
+        self.ranks = {pair: i for i, pair in enumerate(merges)}
+        self.context_length = context_length
+        self.sot_id = vocab.get(SOT_TOKEN, 49406) if sot_id is None else sot_id
+        self.eot_id = vocab.get(EOT_TOKEN, 49407) if eot_id is None else eot_id
+        self.pad_id = self.eot_id if pad_id is None else pad_id
+        self.byte_encoder = bytes_to_unicode()
+        self.byte_decoder = {v: k for k, v in self.byte_encoder.items()}
+        specials = {SOT_TOKEN: self.sot_id, EOT_TOKEN: self.eot_id}
+        self.specials = specials
+        self.pattern = re.compile("|".join(map(re.escape, specials)) + "|" + WORD_PATTERN, re.IGNORECASE)
+        self._bpe_cached = lru_cache(maxsize=cache_size)(self._word_ids)
+
+    @classmethod
+    def from_dir(cls, tok_dir=DEFAULT_TOK_DIR, **kwargs):
+        """Load the three artifacts written by export_clip_torchscript.py."""
+        tok_dir = Path(tok_dir)
+        with open(tok_dir / "vocab.json", encoding="utf-8") as f:
+            vocab = json.load(f)
+        merges = load_merges(tok_dir / "merges.txt")
+        config = {}
+        if (tok_dir / "tokenizer_config.json").exists():
+            with open(tok_dir / "tokenizer_config.json", encoding="utf-8") as f:
+                config = json.load(f)
+        for key in ("context_length", "sot_id", "eot_id", "pad_id"):
+            if key in config and key not in kwargs:
+                kwargs[key] = config[key]
+        if kwargs.get("context_length", 0) > 10000:
+            # HF reports a huge model_max_length for some checkpoints; CLIP is 77.
+            kwargs["context_length"] = DEFAULT_CONTEXT_LENGTH
+        return cls(vocab, merges, **kwargs)
+
+    @staticmethod
+    def normalize(text):
+        return " ".join(unicodedata.normalize("NFC", text).split()).lower()
+
+    def bpe(self, token):
+        """Apply rank-ordered merges to one byte-mapped word; returns its symbols."""
+        word = list(token[:-1]) + [token[-1] + END_OF_WORD]
+        ranks = self.ranks
+        while len(word) > 1:
+            best, best_rank = None, None
+            for pair in zip(word, word[1:]):
+                r = ranks.get(pair)
+                if r is not None and (best_rank is None or r < best_rank):
+                    best, best_rank = pair, r
+            if best is None:
+                break
+            first, second = best
+            merged, i, n = [], 0, len(word)
+            while i < n:
+                if i < n - 1 and word[i] == first and word[i + 1] == second:
+                    merged.append(first + second)
+                    i += 2
+                else:
+                    merged.append(word[i])
+                    i += 1
+            word = merged
+        return word
+
+    def _word_ids(self, token):
+        unk = self.eot_id
+        return tuple(self.encoder.get(sym, unk) for sym in self.bpe(token))
+
+    def tokenize(self, text):
+        """Token ids of `text` without SOT/EOT or padding."""
+        ids = []
+        byte_encoder = self.byte_encoder
+        for piece in self.pattern.findall(self.normalize(text)):
+            special = self.specials.get(piece)
+            if special is not None:
+                ids.append(special)
+                continue
+            ids.extend(self._bpe_cached("".join(byte_encoder[b] for b in piece.encode("utf-8"))))
+        return ids
+
+    def encode(self, text, context_length=None):
+        """SOT + tokens + EOT, truncated to context_length (unpadded)."""
+        n = context_length or self.context_length
+        ids = [self.sot_id] + self.tokenize(text)[:n - 2] + [self.eot_id]
+        return ids
+
+    def encode_many(self, texts, context_length=None):
+        """(N, context_length) int64 matrix, padded with pad_id."""
+        n = context_length or self.context_length
+        out = np.full((len(texts), n), self.pad_id, dtype=np.int64)
+        for i, text in enumerate(texts):
+            ids = self.encode(text, n)
+            out[i, :len(ids)] = ids
+        return out
+
+    def decode(self, ids):
+        specials = {self.sot_id, self.eot_id, self.pad_id}
+        text = "".join(self.decoder.get(int(i), "") for i in ids if int(i) not in specials)
+        words = (bytes(self.byte_decoder[c] for c in w if c in self.byte_decoder) for w in text.split(END_OF_WORD))
+        return b" ".join(words).decode("utf-8", errors="replace").strip()
+
+    def cache_info(self):
+        return self._bpe_cached.cache_info()
+
+
+def load_hf(name):
+    """AutoTokenizer reference; raises ImportError with a pip hint if transformers is missing."""
+    try:
+        from transformers import AutoTokenizer
+    except ImportError:
+        raise ImportError("Parity/benchmark against AutoTokenizer needs transformers; "
+                          "install it with 'pip install transformers'")
+    return AutoTokenizer.from_pretrained(name)
+
+
+def hf_encode_many(hf, texts, context_length, pad_id):
+    """Reference ids with the same SOT/EOT/padding/truncation rules as encode_many."""
+    out = np.full((len(texts), context_length), pad_id, dtype=np.int64)
+    for i, ids in enumerate(hf(list(texts), add_special_tokens=True)["input_ids"]):
+        if len(ids) > context_length:
+            ids = ids[:context_length - 1] + [hf.eos_token_id]
+        out[i, :len(ids)] = ids
+    return out
+
+
+def read_prompts(path):
+    with open(path, encoding="utf-8") as f:
+        return [line.rstrip("\n") for line in f if line.strip()]
+
+
+def parity(tok, hf, texts):
+    """Rows whose ids differ from the reference: list of (index, ours, reference)."""
+    ours = tok.encode_many(texts)
+    ref = hf_encode_many(hf, texts, tok.context_length, tok.pad_id)
+    bad = np.flatnonzero((ours != ref).any(axis=1))
+    return [(int(i), ours[i], ref[i]) for i in bad]
+
+
+def benchmark(fn, texts, repeat=3):
+    """Best-of-N texts/s for fn(texts)."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(texts)
+        best = min(best, time.perf_counter() - t0)
+    return len(texts) / best
+
+
+def main():
+    ap = argparse.ArgumentParser(description="CLIP BPE tokenizer over exported vocab.json / merges.txt")
+    ap.add_argument("text", nargs="*", help="Text(s) to encode")
+    ap.add_argument("--tok-dir", default=str(DEFAULT_TOK_DIR), help="Directory with vocab.json, merges.txt, tokenizer_config.json")
+    ap.add_argument("--parity", default=None, metavar="PROMPTS", help="Check ids against --hf for every line of this file")
+    ap.add_argument("--bench", default=None, metavar="PROMPTS", help="Benchmark encode_many (and --hf) on this file")
+    ap.add_argument("--hf", default=None, help="AutoTokenizer name or path for --parity / --bench")
+    ap.add_argument("--repeat", type=int, default=3, help="Benchmark repetitions (best is reported)")
+    args = ap.parse_args()
+
+    try:
+        tok = ClipTokenizer.from_dir(args.tok_dir)
+    except (OSError, ValueError) as e:
+        print(f"❌ Error loading tokenizer: {e}")
+        sys.exit(1)
+
+    for text in args.text:
+        ids = tok.encode(text)
+        print(f"🔤 {text!r} -> {ids} ({len(ids)} tokens)")
+
+    hf = None
+    if args.parity or (args.bench and args.hf):
+        try:
+            hf = load_hf(args.hf or args.tok_dir)
+        except (ImportError, OSError) as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+
+    if args.parity:
+        texts = read_prompts(args.parity)
+        mismatches = parity(tok, hf, texts)
+        for i, ours, ref in mismatches[:10]:
+            print(f"  ❌ {texts[i]!r}\n     ours {ours[ours != tok.pad_id].tolist()}\n     ref  {ref[ref != tok.pad_id].tolist()}")
+        if mismatches:
+            print(f"❌ {len(mismatches)}/{len(texts)} prompts differ")
+            sys.exit(2)
+        print(f"✅ Parity OK: {len(texts)} prompts byte-identical")
+
+    if args.bench:
+        texts = read_prompts(args.bench)
+        cold = ClipTokenizer.from_dir(args.tok_dir, cache_size=0)
+        print(f"⏱️  {len(texts)} prompts, best of {args.repeat}")
+        print(f"  encode_many (LRU cache)   {benchmark(tok.encode_many, texts, args.repeat):>12,.0f} texts/s")
+        print(f"  encode_many (no cache)    {benchmark(cold.encode_many, texts, args.repeat):>12,.0f} texts/s")
+        if hf is not None:
+            rate = benchmark(lambda t: hf_encode_many(hf, t, tok.context_length, tok.pad_id), texts, args.repeat)
+            print(f"  AutoTokenizer             {rate:>12,.0f} texts/s")
+        info = tok.cache_info()
+        print(f"  cache: {info.hits} hits, {info.misses} misses, {info.currsize} words")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+"""
+Host-side Whisper tooling (mirrors com.mira.whisper).
+"""
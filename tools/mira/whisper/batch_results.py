@@ -0,0 +1,311 @@
+"""
+Batch Results Exporter
+Streams Whisper sidecars (or existing batch CSVs) into the
+batch_results_local.csv format and builds per-file and per-job rollups in
+the same pass.
+
+CSV columns: Job ID, File, Start Time, End Time, Text, Confidence, Duration,
+RTF, Language. Confidence is written as "61%" and Duration is the segment
+length, as in the existing files.
+
+CSV rows are written as each sidecar (or block of an input CSV) is parsed and
+are never held as Python objects for the whole batch. The rollups keep only per-file counters:
+
+  * per file: segments, audio seconds, RTF, mean confidence
+  * per job:  files, segments, total audio, mean/p95 RTF (one value per
+              file, not per duplicated row), confidence histogram by decile
+
+The typed binary variant (.npz) stores one structured array of segments with
+job/file/language as integer codes into string tables, and the text as UTF-8
+bytes plus offsets. It reloads in milliseconds with load_binary().
+
+Usage:
+    cd tools && python3 -m mira.whisper.batch_results <sidecar_dir|sidecar.json|batch.csv>... \
+        [--csv batch_results.csv] [--npz batch_results.npz] [--rollup rollup.json] [--job-id ID]
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+
+from .sidecar_index import detect_schema, effective_rtf, find_sidecars
+
+CSV_HEADER = ["Job ID", "File", "Start Time", "End Time", "Text", "Confidence", "Duration", "RTF", "Language"]
+CONFIDENCE_BINS = 10
+CSV_CHUNK_ROWS = 8192
+SEGMENT_DTYPE = np.dtype([
+    ("job", "<i4"), ("file", "<i4"), ("lang", "<i2"),
+    ("start", "<f4"), ("end", "<f4"), ("confidence", "<f4"), ("rtf", "<f4"),
+])
+
+
+def segment_confidence(seg):
+    """Confidence in [0, 1]: explicit field, else exp(avg_logprob); None if unknown."""
+    for key in ("confidence", "p", "prob"):
+        if isinstance(seg.get(key), (int, float)):
+            value = float(seg[key])
+            return value / 100.0 if value > 1.0 else value
+    if isinstance(seg.get("avg_logprob"), (int, float)):
+        return math.exp(min(0.0, float(seg["avg_logprob"])))
+    return None
+
+
+def sidecar_rows(path, default_job=""):
+    """
+    Segment rows (job, file, start_s, end_s, text, confidence, rtf, lang) of
+    one sidecar; returns [] for sidecars without segments.
+    """
+    with open(path, 'rb') as f:
+        data = json.load(f)
+    schema = detect_schema(data)
+    if schema == "v1":
+        job, audio = data["job"], data["audio"]
+        job_id = str(data.get("job_id") or default_job or Path(path).resolve().parent.name)
+        name = os.path.basename(str(audio["uri"]))
+        rtf, lang = effective_rtf({"rtf": job.get("rtf"), "infer_ms": job.get("infer_ms", -1),
+                                   "audio_ms": audio.get("duration_ms", 0)}), job.get("lang", "")
+        segs = [(s["t0_ms"] / 1000.0, s["t1_ms"] / 1000.0, s) for s in data["segments"]]
+    elif schema == "transcript":
+        job_id = str(data.get("job_id") or default_job or Path(path).resolve().parent.name)
+        name = str(data.get("video_file") or os.path.basename(path))
+        rtf, lang = data.get("rtf"), data.get("language", "")
+        segs = [(float(s["start"]), float(s["end"]), s) for s in data["segments"]]
+    else:
+        return []
+    return [(job_id, name, t0, t1, str(s.get("text", "")).strip(), segment_confidence(s), rtf, lang)
+            for t0, t1, s in segs]
+
+
+def _sidecar_task(args):
+    path, default_job = args
+    try:
+        return path, sidecar_rows(path, default_job), ""
+    except (OSError, ValueError, TypeError, KeyError) as e:
+        return path, [], str(e)
+
+
+def csv_rows(path):
+    """Stream rows back out of an existing batch results CSV."""
+    with open(path, newline='') as f:
+        for r in csv.DictReader(f):
+            conf = r.get("Confidence", "").strip().rstrip("%")
+            rtf = r.get("RTF", "").strip()
+            yield (r["Job ID"], r["File"], float(r["Start Time"]), float(r["End Time"]), r.get("Text", ""),
+                   float(conf) / 100.0 if conf else None, float(rtf) if rtf else None, r.get("Language", ""))
+
+
+def format_row(row):
+    job, name, t0, t1, text, conf, rtf, lang = row
+    return [job, name, f"{t0:.1f}", f"{t1:.1f}", text,
+            "" if conf is None else f"{round(conf * 100)}%", f"{t1 - t0:.1f}",
+            "" if rtf is None else f"{rtf:g}", lang]
+
+
+class Rollup:
+    """One-pass per-file and per-job aggregates."""
+
+    def __init__(self):
+        self.files = {}
+
+    def add(self, row):
+        job, name, t0, t1, _, conf, rtf, _ = row
+        f = self.files.get((job, name))
+        if f is None:
+            f = self.files[(job, name)] = {"segments": 0, "audio_s": 0.0, "rtf": None,
+                                           "conf_sum": 0.0, "conf_n": 0,
+                                           "conf_hist": [0] * CONFIDENCE_BINS}
+        f["segments"] += 1
+        f["audio_s"] = max(f["audio_s"], t1)
+        if rtf is not None:
+            f["rtf"] = rtf
+        if conf is not None:
+            f["conf_sum"] += conf
+            f["conf_n"] += 1
+            f["conf_hist"][min(int(conf * CONFIDENCE_BINS), CONFIDENCE_BINS - 1)] += 1
+
+    def per_file(self):
+        out = []
+        for (job, name), f in sorted(self.files.items()):
+            out.append({"job_id": job, "file": name, "segments": f["segments"],
+                        "audio_s": round(f["audio_s"], 3), "rtf": f["rtf"],
+                        "confidence_mean": round(f["conf_sum"] / f["conf_n"], 4) if f["conf_n"] else None})
+        return out
+
+    def per_job(self):
+        jobs = {}
+        for (job, _), f in self.files.items():
+            jobs.setdefault(job, []).append(f)
+        out = []
+        for job, fs in sorted(jobs.items()):
+            rtfs = np.array([f["rtf"] for f in fs if f["rtf"] is not None], dtype=np.float64)
+            conf_n = sum(f["conf_n"] for f in fs)
+            hist = np.sum([f["conf_hist"] for f in fs], axis=0).astype(int).tolist()
+            out.append({
+                "job_id": job, "files": len(fs), "segments": sum(f["segments"] for f in fs),
+                "audio_s": round(sum(f["audio_s"] for f in fs), 3),
+                "rtf_mean": round(float(rtfs.mean()), 4) if len(rtfs) else None,
+                "rtf_p95": round(float(np.percentile(rtfs, 95)), 4) if len(rtfs) else None,
+                "confidence_mean": round(sum(f["conf_sum"] for f in fs) / conf_n, 4) if conf_n else None,
+                "confidence_hist": {f"{i * 100 // CONFIDENCE_BINS}-{(i + 1) * 100 // CONFIDENCE_BINS}%": n
+                                    for i, n in enumerate(hist)},
+            })
+        return out
+
+
+class BinaryWriter:
+    """Accumulates segments as typed arrays and writes the compact .npz variant."""
+
+    def __init__(self):
+        self.tables = {"job": {}, "file": {}, "lang": {}}
+        self.blocks = []
+        self.text = []
+        self.text_len = []
+
+    def _code(self, table, value):
+        codes = self.tables[table]
+        return codes.setdefault(value, len(codes))
+
+    def add(self, rows):
+        if not rows:
+            return
+        block = np.empty(len(rows), dtype=SEGMENT_DTYPE)
+        for i, (job, name, t0, t1, text, conf, rtf, lang) in enumerate(rows):
+            block[i] = (self._code("job", job), self._code("file", name), self._code("lang", lang),
+                        t0, t1, np.nan if conf is None else conf, np.nan if rtf is None else rtf)
+            encoded = text.encode("utf-8")
+            self.text.append(encoded)
+            self.text_len.append(len(encoded))
+        self.blocks.append(block)
+
+    def save(self, path):
+        segments = np.concatenate(self.blocks) if self.blocks else np.empty(0, dtype=SEGMENT_DTYPE)
+        offsets = np.zeros(len(self.text_len) + 1, dtype=np.int64)
+        np.cumsum(self.text_len, out=offsets[1:])
+        np.savez(path, segments=segments,
+                 jobs=np.array(list(self.tables["job"]), dtype=str),
+                 files=np.array(list(self.tables["file"]), dtype=str),
+                 langs=np.array(list(self.tables["lang"]), dtype=str),
+                 text_bytes=np.frombuffer(b"".join(self.text), dtype=np.uint8),
+                 text_offsets=offsets)
+
+
+def load_binary(path):
+    """Load the .npz variant; returns a dict with a text(i) helper."""
+    z = np.load(path)
+    out = {k: z[k] for k in z.files}
+    raw, offsets = out["text_bytes"].tobytes(), out["text_offsets"]
+    out["text"] = lambda i: raw[offsets[i]:offsets[i + 1]].decode("utf-8")
+    return out
+
+
+def iter_inputs(inputs, default_job="", workers=None):
+    """
+    Yield (source, rows, error, first) for sidecars (parsed in a process pool)
+    and CSVs, which arrive in CSV_CHUNK_ROWS blocks; first marks a source's first block.
+    """
+    sidecars = []
+    for p in inputs:
+        if p.endswith(".csv"):
+            rows, first = csv_rows(p), True
+            while True:
+                chunk = list(islice(rows, CSV_CHUNK_ROWS))
+                if not chunk:
+                    break
+                yield p, chunk, "", first
+                first = False
+        else:
+            sidecars.extend(find_sidecars(p))
+    if sidecars:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for source, rows, error in pool.map(_sidecar_task, ((s, default_job) for s in sidecars), chunksize=32):
+                yield source, rows, error, True
+
+
+def export(inputs, csv_path=None, npz_path=None, default_job="", workers=None, append=False):
+    """One pass over the inputs: stream the CSV, accumulate rollups and the binary variant."""
+    rollup, binary = Rollup(), BinaryWriter() if npz_path else None
+    stats = {"sources": 0, "rows": 0, "errors": []}
+    out = writer = None
+    if csv_path:
+        new_file = not (append and os.path.exists(csv_path) and os.path.getsize(csv_path) > 0)
+        out = open(csv_path, 'a' if append else 'w', newline='')
+        writer = csv.writer(out)
+        if new_file:
+            writer.writerow(CSV_HEADER)
+    try:
+        for source, rows, error, first in iter_inputs(inputs, default_job, workers):
+            if error:
+                stats["errors"].append((source, error))
+                continue
+            if not rows:
+                continue
+            stats["sources"] += first
+            stats["rows"] += len(rows)
+            if writer:
+                writer.writerows(format_row(r) for r in rows)
+            for r in rows:
+                rollup.add(r)
+            if binary:
+                binary.add(rows)
+    finally:
+        if out:
+            out.close()
+    if binary:
+        binary.save(npz_path)
+    return rollup, stats
+
+
+def _fmt(value, spec):
+    return "-" if value is None else format(value, spec)
+
+
+def print_rollup(jobs):
+    print(f"  {'job':<28} | {'files':>5} | {'segments':>8} | {'audio s':>9} | {'RTF mean':>8} | "
+          f"{'RTF p95':>7} | {'conf':>5}")
+    for j in jobs:
+        conf = None if j["confidence_mean"] is None else j["confidence_mean"] * 100
+        print(f"  {j['job_id'][:28]:<28} | {j['files']:>5} | {j['segments']:>8} | {j['audio_s']:>9.1f} | "
+              f"{_fmt(j['rtf_mean'], '.3f'):>8} | {_fmt(j['rtf_p95'], '.3f'):>7} | {_fmt(conf, '.0f'):>4}%")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Export sidecars to batch results CSV with per-file/per-job rollups")
+    ap.add_argument("inputs", nargs="+", help="Sidecar directories/files or existing batch results CSVs")
+    ap.add_argument("--csv", default=None, help="Batch results CSV to write")
+    ap.add_argument("--append", action="store_true", help="Append to --csv instead of replacing it")
+    ap.add_argument("--npz", default=None, help="Also write the typed binary variant")
+    ap.add_argument("--rollup", default=None, help="Write per-file and per-job rollups as JSON")
+    ap.add_argument("--job-id", default="", help="Job ID for sidecars that do not carry one")
+    ap.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    args = ap.parse_args()
+
+    rollup, stats = export(args.inputs, args.csv, args.npz, args.job_id, args.workers, args.append)
+    if not stats["rows"]:
+        print("❌ No segments found")
+        sys.exit(1)
+    print(f"📊 {stats['rows']} segments from {stats['sources']} sources")
+    jobs = rollup.per_job()
+    print_rollup(jobs)
+    if args.rollup:
+        with open(args.rollup, 'w') as f:
+            json.dump({"jobs": jobs, "files": rollup.per_file()}, f, indent=2)
+        print(f"💾 Rollup: {args.rollup}")
+    for path in (args.csv, args.npz):
+        if path:
+            print(f"💾 Wrote: {path}")
+    for source, error in stats["errors"]:
+        print(f"  ❌ {source}: {error}")
+    if stats["errors"]:
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""
+Whisper RTF / Throughput Benchmark
+Drives a locally built whisper.cpp CLI over a WAV corpus, sweeping model
+variants, thread counts and beam sizes, and records every run in a SQLite
+results DB.
+
+Per run: wall time, RTF (wall / audio duration, the RunSnapshot.effectiveRtf
+definition), peak RSS of the child (os.wait4 rusage), whisper's own
+encode/decode timings and tokens/s (sampled tokens over total time, parsed
+from whisper_print_timings on stderr).
+
+Results can be saved as a baseline (median per model/threads/beam) and later
+runs checked against it; any metric worse than the tolerance is a regression
+and the exit code is 3.
+
+The vendored whisper.cpp tree has no CLI example, so point --whisper-bin at a
+build of examples/cli (whisper-cli, or main in older trees).
+
+Usage:
+    cd tools && python3 -m mira.whisper.bench --whisper-bin ~/whisper.cpp/build/bin/whisper-cli \
+        --models ggml-tiny.en-q5_1.bin ggml-base.en.bin --corpus /tmp/corpus \
+        --threads 1 2 4 --beams 1 5 --db whisper_bench.sqlite \
+        [--baseline baseline.json --tolerance 0.10] [--save-baseline baseline.json]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from .wav import open_wav
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tag TEXT NOT NULL,
+    created_ms INTEGER NOT NULL,
+    host TEXT NOT NULL,
+    model TEXT NOT NULL,
+    model_sha256 TEXT NOT NULL,
+    audio TEXT NOT NULL,
+    audio_ms INTEGER NOT NULL,
+    threads INTEGER NOT NULL,
+    beam INTEGER NOT NULL,
+    exit_code INTEGER NOT NULL,
+    wall_ms REAL NOT NULL,
+    rtf REAL NOT NULL,
+    peak_rss_mb REAL NOT NULL,
+    load_ms REAL,
+    encode_ms REAL,
+    decode_ms REAL,
+    tokens INTEGER,
+    tokens_per_s REAL
+);
+CREATE INDEX IF NOT EXISTS runs_config ON runs (tag, model, threads, beam);
+"""
+
+TIMING_RE = re.compile(r"whisper_print_timings:\s+(\w+) time\s*=\s*([\d.]+)\s*ms(?:\s*/\s*(\d+)\s*runs)?")
+# Metrics where larger is worse; tokens_per_s is checked the other way round.
+REGRESSION_METRICS = ("rtf", "wall_ms", "peak_rss_mb")
+AUDIO_SUFFIXES = (".wav",)
+
+
+def file_sha256(path, chunk=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def parse_timings(stderr):
+    """whisper_print_timings lines -> {load_ms, encode_ms, decode_ms, total_ms, tokens}."""
+    out = {}
+    runs = {}
+    for name, ms, n in TIMING_RE.findall(stderr):
+        out[f"{name}_ms"] = float(ms)
+        if n:
+            runs[name] = int(n)
+    # Every generated token goes through the sampler once.
+    if "sample" in runs:
+        out["tokens"] = runs["sample"]
+    return out
+
+
+def run_whisper(whisper_bin, model, audio, threads, beam, extra_args=()):
+    """
+    Run the CLI once; returns (exit_code, wall_ms, peak_rss_mb, stderr).
+
+    The child is reaped with os.wait4 so its own peak RSS is measured, not
+    the harness's.
+    """
+    cmd = [str(whisper_bin), "-m", str(model), "-f", str(audio), "-t", str(threads),
+           "-bs", str(beam), "-nt", *extra_args]
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        t0 = time.perf_counter()
+        proc = subprocess.Popen(cmd, stdout=out, stderr=err, stdin=subprocess.DEVNULL)
+        _, status, usage = os.wait4(proc.pid, 0)
+        wall_ms = (time.perf_counter() - t0) * 1000
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        err.seek(0)
+        stderr = err.read().decode("utf-8", "replace")
+    rss_mb = usage.ru_maxrss / (2**20 if sys.platform == "darwin" else 2**10)
+    return proc.returncode, wall_ms, rss_mb, stderr
+
+
+def collect_corpus(paths):
+    """WAV files from files, directories, or a gen_wav manifest.json."""
+    files = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            files.extend(sorted(f for f in p.rglob("*") if f.suffix.lower() in AUDIO_SUFFIXES))
+        elif p.suffix == ".json":
+            manifest = json.loads(p.read_text())
+            files.extend(p.parent / f["file"] for f in manifest.get("files", []))
+        else:
+            files.append(p)
+    return files
+
+
+def open_db(path):
+    db = sqlite3.connect(path)
+    db.executescript(SCHEMA)
+    return db
+
+
+def record_run(db, row):
+    cols = ", ".join(row)
+    db.execute(f"INSERT INTO runs ({cols}) VALUES ({', '.join('?' * len(row))})", list(row.values()))
+    db.commit()
+
+
+def sweep(db, whisper_bin, models, corpus, threads, beams, repeat=1, tag="default", extra_args=()):
+    """Run every (model, threads, beam, audio) combination; returns the recorded rows."""
+    host = platform.node()
+    durations = {a: open_wav(a).duration_ms for a in corpus}
+    rows = []
+    for model in models:
+        model_sha = file_sha256(model)
+        for t in threads:
+            for b in beams:
+                for audio in corpus:
+                    for _ in range(repeat):
+                        code, wall_ms, rss_mb, stderr = run_whisper(whisper_bin, model, audio, t, b, extra_args)
+                        timings = parse_timings(stderr)
+                        audio_ms = durations[audio]
+                        total_ms = timings.get("total_ms", wall_ms)
+                        tokens = timings.get("tokens")
+                        row = {
+                            "tag": tag, "created_ms": int(time.time() * 1000), "host": host,
+                            "model": Path(model).name, "model_sha256": model_sha,
+                            "audio": str(audio), "audio_ms": audio_ms, "threads": t, "beam": b,
+                            "exit_code": code, "wall_ms": round(wall_ms, 2),
+                            "rtf": wall_ms / audio_ms if audio_ms else 0.0,
+                            "peak_rss_mb": round(rss_mb, 1),
+                            "load_ms": timings.get("load_ms"), "encode_ms": timings.get("encode_ms"),
+                            "decode_ms": timings.get("decode_ms"), "tokens": tokens,
+                            "tokens_per_s": tokens / (total_ms / 1000) if tokens and total_ms else None,
+                        }
+                        record_run(db, row)
+                        rows.append(row)
+                        status = "✅" if code == 0 else f"❌ exit {code}"
+                        print(f"  {status} {row['model']} t={t} beam={b} {Path(audio).name}: "
+                              f"RTF {row['rtf']:.3f}, {wall_ms:.0f}ms, {rss_mb:.0f}MB")
+    return rows
+
+
+def config_key(row):
+    return f"{row['model']}|t{row['threads']}|b{row['beam']}"
+
+
+def summarize(rows):
+    """Median metrics per model/threads/beam over successful runs."""
+    groups = {}
+    for r in rows:
+        if r["exit_code"] == 0:
+            groups.setdefault(config_key(r), []).append(r)
+    summary = {}
+    for key, rs in sorted(groups.items()):
+        entry = {"runs": len(rs)}
+        for metric in REGRESSION_METRICS + ("tokens_per_s",):
+            vals = [r[metric] for r in rs if r[metric] is not None]
+            entry[metric] = float(np.median(vals)) if vals else None
+        summary[key] = entry
+    return summary
+
+
+def check_regressions(summary, baseline, tolerance):
+    """List of (config, metric, baseline, current) for every metric outside tolerance."""
+    found = []
+    for key, base in baseline.items():
+        cur = summary.get(key)
+        if cur is None:
+            continue
+        for metric in REGRESSION_METRICS:
+            if base.get(metric) and cur.get(metric) and cur[metric] > base[metric] * (1 + tolerance):
+                found.append((key, metric, base[metric], cur[metric]))
+        b, c = base.get("tokens_per_s"), cur.get("tokens_per_s")
+        if b and c and c < b * (1 - tolerance):
+            found.append((key, "tokens_per_s", b, c))
+    return found
+
+
+def print_summary(summary):
+    print(f"  {'config':<40} | {'runs':>4} | {'RTF':>7} | {'wall ms':>9} | {'RSS MB':>7} | {'tok/s':>7}")
+    for key, s in summary.items():
+        tps = f"{s['tokens_per_s']:>7.1f}" if s["tokens_per_s"] else f"{'-':>7}"
+        print(f"  {key:<40} | {s['runs']:>4} | {s['rtf']:>7.3f} | {s['wall_ms']:>9.0f} | "
+              f"{s['peak_rss_mb']:>7.0f} | {tps}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark whisper.cpp RTF / tokens/s / peak RSS over a corpus")
+    ap.add_argument("--whisper-bin", required=True, help="whisper.cpp CLI binary (whisper-cli or main)")
+    ap.add_argument("--models", nargs="+", required=True, help="ggml model files")
+    ap.add_argument("--corpus", nargs="+", required=True, help="WAV files, directories or a gen_wav manifest.json")
+    ap.add_argument("--threads", nargs="+", type=int, default=[4], help="Thread counts to sweep")
+    ap.add_argument("--beams", nargs="+", type=int, default=[1], help="Beam sizes to sweep (1 = greedy)")
+    ap.add_argument("--repeat", type=int, default=1, help="Runs per combination")
+    ap.add_argument("--db", default="whisper_bench.sqlite", help="SQLite results DB")
+    ap.add_argument("--tag", default="default", help="Label stored with every run")
+    ap.add_argument("--baseline", default=None, help="Baseline JSON to check against")
+    ap.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative slowdown before a regression")
+    ap.add_argument("--save-baseline", default=None, help="Write this run's medians as a baseline JSON")
+    ap.add_argument("--extra", nargs=argparse.REMAINDER, default=[], help="Extra CLI args passed to whisper")
+    args = ap.parse_args()
+
+    if not os.access(args.whisper_bin, os.X_OK):
+        print(f"❌ whisper binary not found or not executable: {args.whisper_bin}")
+        sys.exit(1)
+    corpus = collect_corpus(args.corpus)
+    if not corpus:
+        print("❌ No WAV files in corpus")
+        sys.exit(1)
+
+    total = len(args.models) * len(args.threads) * len(args.beams) * len(corpus) * args.repeat
+    print(f"🚀 {total} runs: {len(args.models)} models x {len(args.threads)} thread counts x "
+          f"{len(args.beams)} beams x {len(corpus)} files x {args.repeat}")
+    db = open_db(args.db)
+    try:
+        rows = sweep(db, args.whisper_bin, args.models, corpus, args.threads, args.beams,
+                     args.repeat, args.tag, args.extra)
+    finally:
+        db.close()
+    summary = summarize(rows)
+    print_summary(summary)
+    print(f"💾 Runs: {args.db}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f"💾 Baseline: {args.save_baseline}")
+
+    failed = sum(r["exit_code"] != 0 for r in rows)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = check_regressions(summary, baseline, args.tolerance)
+        for key, metric, base, cur in regressions:
+            print(f"  ❌ {key} {metric}: {base:.3f} -> {cur:.3f}")
+        if regressions:
+            print(f"⚠️  {len(regressions)} regressions beyond {args.tolerance:.0%}")
+            sys.exit(3)
+        print(f"✅ No regressions beyond {args.tolerance:.0%}")
+    if failed:
+        print(f"⚠️  {failed} runs failed")
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
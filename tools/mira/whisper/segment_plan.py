@@ -0,0 +1,250 @@
+"""
+Whisper Segmentation Planner
+Plans how long audio is chunked for decoding, using the RunSnapshot rails
+(segmentMs=30000, overlapMs=1000), and measures what the overlap costs.
+
+A vectorized energy VAD marks each frame (20 ms by default) as speech or
+silence. Chunks are then planned greedily. Each chunk is at most segment_ms
+long, and its cut is moved into the middle of a silence inside the last
+overlap_ms of the chunk. A chunk cut in silence starts the next one with no
+overlap. Only when the window holds no silence is the cut forced
+mid-speech, and the next chunk then re-decodes overlap_ms as RunSnapshot
+does.
+
+The report compares this plan with fixed chunking at the same rails:
+decoded audio, redundant (re-decoded) time, decoder windows and cuts that
+land in speech.
+
+Usage:
+    cd tools && python3 -m mira.whisper.segment_plan audio.wav \
+        [--segment-ms 30000] [--overlap-ms 1000] [--frame-ms 20] [--out plan.json]
+"""
+
+import argparse
+import json
+import sys
+
+import numpy as np
+
+from .wav import open_wav
+
+SEGMENT_MS = 30000
+OVERLAP_MS = 1000
+DEFAULT_FRAME_MS = 20
+DEFAULT_MARGIN_DB = 12.0
+DEFAULT_MIN_SILENCE_MS = 200
+DEFAULT_MIN_SPEECH_MS = 100
+FLOOR_DB = -120.0
+ABS_SILENCE_DB = -60.0
+BLOCK_FRAMES = 1 << 20
+
+
+def frame_energy_db(audio, frame_ms=DEFAULT_FRAME_MS):
+    """Per-frame RMS energy in dBFS (channels averaged), streamed in blocks."""
+    frame_len = max(1, audio.sr_hz * frame_ms // 1000)
+    n_frames = -(-audio.frames // frame_len)
+    out = np.empty(n_frames, dtype=np.float32)
+    block = max(frame_len, BLOCK_FRAMES // frame_len * frame_len)
+    for start, x in audio.iter_blocks(block):
+        n = -(-len(x) // frame_len)
+        pad = n * frame_len - len(x)
+        if pad:
+            x = np.concatenate([x, np.zeros((pad, x.shape[1]), dtype=x.dtype)])
+        power = np.einsum('fsc,fsc->f', x.reshape(n, frame_len, -1), x.reshape(n, frame_len, -1))
+        power /= frame_len * x.shape[1]
+        out[start // frame_len:start // frame_len + n] = 10 * np.log10(np.maximum(power, 10 ** (FLOOR_DB / 10)))
+    return out
+
+
+def runs(mask):
+    """Run-length encode a boolean array: (starts, ends, values), ends exclusive."""
+    if len(mask) == 0:
+        return np.zeros(0, int), np.zeros(0, int), np.zeros(0, bool)
+    edges = np.flatnonzero(np.diff(mask.astype(np.int8))) + 1
+    starts = np.concatenate([[0], edges])
+    ends = np.concatenate([edges, [len(mask)]])
+    return starts, ends, mask[starts]
+
+
+def fill_short_runs(mask, value, min_len):
+    """Flip runs of `value` shorter than min_len frames to the opposite value."""
+    starts, ends, values = runs(mask)
+    short = (values == value) & (ends - starts < min_len)
+    out = mask.copy()
+    for s, e in zip(starts[short], ends[short]):
+        out[s:e] = not value
+    return out
+
+
+def energy_vad(energy_db, frame_ms=DEFAULT_FRAME_MS, threshold_db=None, margin_db=DEFAULT_MARGIN_DB,
+               min_silence_ms=DEFAULT_MIN_SILENCE_MS, min_speech_ms=DEFAULT_MIN_SPEECH_MS):
+    """
+    Speech mask per frame and the threshold used.
+
+    Without an explicit threshold it is the noise floor (5th percentile of
+    frame energy) plus margin_db, kept at least 3 dB under the 95th percentile
+    and no lower than ABS_SILENCE_DB. Silence runs shorter than min_silence_ms
+    and speech bursts shorter than min_speech_ms are smoothed away.
+    """
+    if threshold_db is None and len(energy_db):
+        floor, peak = np.percentile(energy_db, [5, 95])
+        # Capped below the loud frames so steady signals are not all silence,
+        # but never below ABS_SILENCE_DB so digital silence stays silent.
+        threshold_db = max(min(floor + margin_db, peak - 3.0), ABS_SILENCE_DB)
+    elif threshold_db is None:
+        threshold_db = ABS_SILENCE_DB
+    speech = energy_db > threshold_db
+    speech = fill_short_runs(speech, False, max(1, min_silence_ms // frame_ms))
+    speech = fill_short_runs(speech, True, max(1, min_speech_ms // frame_ms))
+    return speech, threshold_db
+
+
+def silence_intervals(speech, frame_ms):
+    """[t0_ms, t1_ms] of every silence run."""
+    starts, ends, values = runs(speech)
+    return [[int(s * frame_ms), int(e * frame_ms)] for s, e in zip(starts[~values], ends[~values])]
+
+
+def plan_fixed(duration_ms, segment_ms=SEGMENT_MS, overlap_ms=OVERLAP_MS):
+    """Fixed chunking: every chunk segment_ms long, each overlapping the previous by overlap_ms."""
+    chunks, start = [], 0
+    stride = segment_ms - overlap_ms
+    while start < duration_ms:
+        end = min(start + segment_ms, duration_ms)
+        chunks.append({"t0_ms": start, "t1_ms": end, "cut": "end" if end == duration_ms else "fixed",
+                       "overlap_ms": overlap_ms if chunks else 0})
+        if end == duration_ms:
+            break
+        start += stride
+    return chunks
+
+
+def _cut_candidates(speech, energy_db):
+    """
+    Score every frame as a cut point: silent frames score by distance to the
+    centre of their silence run (lower is better), speech frames are inf.
+    """
+    if not len(speech):  # zero-length audio
+        return np.zeros(0, dtype=np.float64)
+    starts, ends, values = runs(speech)
+    centre = np.repeat((starts + ends) / 2.0, ends - starts)
+    score = np.abs(np.arange(len(speech)) - centre) + (energy_db - energy_db.min()) * 1e-3
+    score[speech] = np.inf
+    return score
+
+
+def plan_snapped(duration_ms, speech, energy_db, frame_ms=DEFAULT_FRAME_MS,
+                 segment_ms=SEGMENT_MS, overlap_ms=OVERLAP_MS):
+    """Chunks of at most segment_ms whose cuts snap to silence within the overlap window."""
+    score = _cut_candidates(speech, energy_db)
+    chunks, start, carry = [], 0, 0
+    while start < duration_ms:
+        nominal = start + segment_ms
+        if nominal >= duration_ms:
+            chunks.append({"t0_ms": start, "t1_ms": duration_ms, "cut": "end", "overlap_ms": carry})
+            break
+        lo = max((nominal - overlap_ms) // frame_ms, start // frame_ms + 1)
+        hi = min(nominal // frame_ms, len(score))
+        window = score[lo:hi]
+        if len(window) and np.isfinite(window).any():
+            # Latest of the best-scoring frames keeps chunks as long as possible.
+            best = lo + len(window) - 1 - int(np.argmin(window[::-1]))
+            cut = best * frame_ms
+            chunks.append({"t0_ms": start, "t1_ms": cut, "cut": "silence", "overlap_ms": carry})
+            start, carry = cut, 0
+        else:
+            chunks.append({"t0_ms": start, "t1_ms": nominal, "cut": "forced", "overlap_ms": carry})
+            start, carry = nominal - overlap_ms, overlap_ms
+    return chunks
+
+
+def plan_report(chunks, duration_ms, speech, frame_ms, segment_ms=SEGMENT_MS):
+    """Decode cost of a plan: audio decoded, redundant time, windows, cuts inside speech."""
+    decoded = sum(c["t1_ms"] - c["t0_ms"] for c in chunks)
+    cuts_in_speech = 0
+    for c in chunks[:-1]:
+        f = min(c["t1_ms"] // frame_ms, len(speech) - 1)
+        cuts_in_speech += bool(len(speech) and speech[f])
+    return {
+        "chunks": len(chunks),
+        "decoded_ms": decoded,
+        "redundant_ms": decoded - duration_ms,
+        "redundant_pct": round(100.0 * (decoded - duration_ms) / duration_ms, 3) if duration_ms else 0.0,
+        # Whisper pads every chunk to a full window, so each one costs segment_ms of encoder time.
+        "encoder_ms": len(chunks) * segment_ms,
+        "cuts_in_speech": cuts_in_speech,
+    }
+
+
+def build_plan(path, segment_ms=SEGMENT_MS, overlap_ms=OVERLAP_MS, frame_ms=DEFAULT_FRAME_MS,
+               threshold_db=None, margin_db=DEFAULT_MARGIN_DB, min_silence_ms=DEFAULT_MIN_SILENCE_MS):
+    """Full plan document for one WAV file."""
+    if not 0 <= overlap_ms < segment_ms:
+        raise ValueError(f"overlap_ms must be in [0, segment_ms), got {overlap_ms}")
+    audio = open_wav(path)
+    energy = frame_energy_db(audio, frame_ms)
+    speech, threshold = energy_vad(energy, frame_ms, threshold_db, margin_db, min_silence_ms)
+    duration = audio.duration_ms
+    snapped = plan_snapped(duration, speech, energy, frame_ms, segment_ms, overlap_ms)
+    fixed = plan_fixed(duration, segment_ms, overlap_ms)
+    for i, c in enumerate(snapped):
+        c["index"] = i
+    return {
+        "version": 1,
+        "audio": {"uri": str(path), "sr_hz": audio.sr_hz, "channels": audio.channels, "duration_ms": duration},
+        "params": {"segment_ms": segment_ms, "overlap_ms": overlap_ms, "frame_ms": frame_ms,
+                   "threshold_db": round(float(threshold), 2), "min_silence_ms": min_silence_ms},
+        "vad": {"speech_ms": int(speech.sum()) * frame_ms,
+                "silences": silence_intervals(speech, frame_ms)},
+        "chunks": snapped,
+        "report": {"snapped": plan_report(snapped, duration, speech, frame_ms, segment_ms),
+                   "fixed": plan_report(fixed, duration, speech, frame_ms, segment_ms)},
+    }
+
+
+def print_report(plan):
+    a, r = plan["audio"], plan["report"]
+    print(f"🎧 {a['uri']}: {a['duration_ms'] / 1000:.1f}s, {a['sr_hz']}Hz x{a['channels']}, "
+          f"speech {plan['vad']['speech_ms'] / 1000:.1f}s, {len(plan['vad']['silences'])} silences "
+          f"(threshold {plan['params']['threshold_db']:.1f} dBFS)")
+    print(f"  {'plan':<8} | {'chunks':>6} | {'decoded s':>9} | {'redundant s':>11} | {'redundant %':>11} | "
+          f"{'cuts in speech':>14}")
+    for name in ("fixed", "snapped"):
+        s = r[name]
+        print(f"  {name:<8} | {s['chunks']:>6} | {s['decoded_ms'] / 1000:>9.1f} | {s['redundant_ms'] / 1000:>11.1f} | "
+              f"{s['redundant_pct']:>11.2f} | {s['cuts_in_speech']:>14}")
+    saved = r["fixed"]["redundant_ms"] - r["snapped"]["redundant_ms"]
+    print(f"📊 Snapping to silence saves {saved / 1000:.1f}s of re-decoded audio")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Plan Whisper chunking of a WAV with silence-snapped cuts")
+    ap.add_argument("wav", help="Input WAV (PCM16/32 or float32, RIFF or RF64)")
+    ap.add_argument("--segment-ms", type=int, default=SEGMENT_MS, help="Max chunk length (RunSnapshot.segmentMs)")
+    ap.add_argument("--overlap-ms", type=int, default=OVERLAP_MS, help="Cut search window / fallback overlap (RunSnapshot.overlapMs)")
+    ap.add_argument("--frame-ms", type=int, default=DEFAULT_FRAME_MS, help="VAD frame length")
+    ap.add_argument("--threshold-db", type=float, default=None, help="Speech threshold in dBFS (default: noise floor + margin)")
+    ap.add_argument("--margin-db", type=float, default=DEFAULT_MARGIN_DB, help="Margin above the noise floor")
+    ap.add_argument("--min-silence-ms", type=int, default=DEFAULT_MIN_SILENCE_MS, help="Shorter pauses count as speech")
+    ap.add_argument("--out", default=None, help="Write the plan JSON here (stdout if omitted)")
+    args = ap.parse_args()
+
+    try:
+        plan = build_plan(args.wav, args.segment_ms, args.overlap_ms, args.frame_ms,
+                          args.threshold_db, args.margin_db, args.min_silence_ms)
+    except (OSError, ValueError) as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(plan, f, indent=2)
+        print_report(plan)
+        print(f"💾 Plan: {args.out}")
+    else:
+        json.dump(plan, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
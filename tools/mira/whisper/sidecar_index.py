@@ -0,0 +1,303 @@
+"""
+Whisper Sidecar Indexer
+Walks a batch output tree, validates every sidecar JSON in a process pool and
+writes one columnar summary, so RTF dashboards read a single file instead of
+re-parsing thousands of sidecars.
+
+Three sidecar shapes are recognized:
+
+  * v1          version/audio/job/segments, as checked by tools/sidecar_check.js
+  * bridge      job_id/uri/model_sha/audio_sha/created_at, as written by
+                AndroidWhisperBridge (chinese_transcription_sidecar.json)
+  * transcript  whisper-style segments with start/end plus model, rtf,
+                duration and processing_time (video_v1.transcript.json)
+
+RTF follows RunSnapshot.effectiveRtf: the stored rtf, else infer_ms / audio_ms.
+JSON files of any other shape are skipped (or reported as invalid with --strict).
+
+The summary format follows the output extension: .parquet (needs pyarrow),
+.npz (one array per column) or .csv.
+
+Usage:
+    cd tools && python3 -m mira.whisper.sidecar_index <output_dir> --out sidecars.parquet \
+        [--pattern '*.json'] [--workers N] [--strict]
+"""
+
+import argparse
+import csv
+import fnmatch
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+V1_KEYS = ("version", "audio", "job", "segments")
+V1_AUDIO = ("uri", "sr_hz", "channels", "duration_ms")
+V1_JOB = ("model", "threads", "beam", "lang", "translate", "rtf", "infer_ms")
+V1_SEGMENT = ("t0_ms", "t1_ms", "text")
+BRIDGE_REQUIRED = ("job_id", "uri", "model_sha", "audio_sha", "created_at")
+TRANSCRIPT_SEGMENT = ("start", "end", "text")
+
+# Column name -> kind; missing values are "" for str, NaN for float, -1 for int.
+COLUMNS = {
+    "path": "str", "schema": "str", "ok": "bool", "error": "str",
+    "job_id": "str", "model": "str", "lang": "str",
+    "rtf": "float", "infer_ms": "int", "audio_ms": "int",
+    "segments": "int", "threads": "int", "beam": "int", "created_ms": "int",
+}
+
+
+class SidecarError(ValueError):
+    pass
+
+
+def _require(obj, keys, where):
+    if not isinstance(obj, dict):
+        raise SidecarError(f"{where or 'sidecar'} must be an object")
+    for key in keys:
+        if key not in obj:
+            raise SidecarError(f"Missing {where + '.' if where else ''}{key}")
+
+
+def _number(value, where, minimum=0):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise SidecarError(f"{where} must be a number, got {type(value).__name__}")
+    if value < minimum:
+        raise SidecarError(f"{where} must be >= {minimum}, got {value}")
+    return value
+
+
+def _segments(segments, keys, t0, t1):
+    if not isinstance(segments, list):
+        raise SidecarError("segments must be an array")
+    for i, seg in enumerate(segments):
+        _require(seg, keys, f"segments[{i}]")
+        if _number(seg[t1], f"segments[{i}].{t1}") < _number(seg[t0], f"segments[{i}].{t0}"):
+            raise SidecarError(f"segments[{i}] ends before it starts")
+    return len(segments)
+
+
+def detect_schema(data):
+    """
+    Sidecar shape of parsed JSON, or None for unrelated files. v1 is picked on a
+    distinctive subset (an audio or job object next to version, or both objects)
+    so that parse_v1 reports whatever else is missing.
+
+    >>> detect_schema({"version": "1.0", "audio": {}, "job": {}})  # no segments: invalid v1, not skipped
+    'v1'
+    >>> detect_schema({"version": "1.0", "audio": {"uri": "a.wav"}, "segments": []})
+    'v1'
+    >>> detect_schema({"name": "app", "version": "1.2.3", "dependencies": {}}) is None  # package.json
+    True
+    """
+    if not isinstance(data, dict):
+        return None
+    objects = [isinstance(data.get(k), dict) for k in ("audio", "job")]
+    if ("version" in data and any(objects)) or all(objects):
+        return "v1"
+    if "job_id" in data:
+        return "bridge"
+    if "segments" in data and ("duration" in data or "model" in data):
+        return "transcript"
+    return None
+
+
+def parse_v1(data):
+    _require(data, V1_KEYS, "")
+    audio, job = data["audio"], data["job"]
+    _require(audio, V1_AUDIO, "audio")
+    _require(job, V1_JOB, "job")
+    return {
+        "job_id": str(data.get("job_id", job.get("id", ""))),
+        "model": str(job["model"]),
+        "lang": str(job["lang"]),
+        "rtf": _number(job["rtf"], "job.rtf"),
+        "infer_ms": int(_number(job["infer_ms"], "job.infer_ms")),
+        "audio_ms": int(_number(audio["duration_ms"], "audio.duration_ms")),
+        "segments": _segments(data["segments"], V1_SEGMENT, "t0_ms", "t1_ms"),
+        "threads": int(_number(job["threads"], "job.threads", 1)),
+        "beam": int(_number(job["beam"], "job.beam", 1)),
+    }
+
+
+def parse_bridge(data):
+    _require(data, BRIDGE_REQUIRED, "")
+    row = {
+        "job_id": str(data["job_id"]),
+        "model": str(data.get("model_variant") or data["model_sha"]),
+        "created_ms": int(_number(data["created_at"], "created_at")),
+    }
+    if data.get("rtf") is not None:
+        row["rtf"] = _number(data["rtf"], "rtf")
+    if "infer_ms" in data:
+        row["infer_ms"] = int(_number(data["infer_ms"], "infer_ms"))
+    if "audio_ms" in data:
+        row["audio_ms"] = int(_number(data["audio_ms"], "audio_ms"))
+    if "lid" in data and isinstance(data["lid"], dict):
+        row["lang"] = str(data["lid"].get("chosen", data["lid"].get("lang", "")))
+    return row
+
+
+def parse_transcript(data, path):
+    _require(data, ("segments", "model"), "")
+    row = {
+        "job_id": os.path.splitext(str(data.get("video_file") or os.path.basename(path)))[0],
+        "model": str(data["model"]),
+        "lang": str(data.get("language", "")),
+        "segments": _segments(data["segments"], TRANSCRIPT_SEGMENT, "start", "end"),
+    }
+    if "rtf" in data:
+        row["rtf"] = _number(data["rtf"], "rtf")
+    if "processing_time" in data:
+        row["infer_ms"] = int(round(_number(data["processing_time"], "processing_time") * 1000))
+    if "duration" in data:
+        row["audio_ms"] = int(round(_number(data["duration"], "duration") * 1000))
+    return row
+
+
+def effective_rtf(row):
+    """RunSnapshot.effectiveRtf: stored rtf, else infer_ms / audio_ms."""
+    if row.get("rtf") is not None:
+        return float(row["rtf"])
+    if row.get("infer_ms", -1) >= 0 and row.get("audio_ms", 0) > 0:
+        return row["infer_ms"] / row["audio_ms"]
+    return None
+
+
+def index_file(path):
+    """One summary row for a file (never raises); schema is "" for unrecognized JSON."""
+    row = {"path": path, "schema": "", "ok": False, "error": ""}
+    try:
+        with open(path, 'rb') as f:
+            data = json.load(f)
+        schema = detect_schema(data)
+        if schema is None:
+            row["error"] = "unrecognized sidecar shape"
+            return row
+        row["schema"] = schema
+        if schema == "v1":
+            row.update(parse_v1(data))
+        elif schema == "bridge":
+            row.update(parse_bridge(data))
+        else:
+            row.update(parse_transcript(data, path))
+        row["rtf"] = effective_rtf(row)
+        row["ok"] = True
+    except (OSError, ValueError, TypeError, KeyError) as e:
+        row["error"] = str(e)
+    return row
+
+
+def find_sidecars(root, pattern="*.json"):
+    if os.path.isfile(root):
+        return [root]
+    found = []
+    for dirpath, _, files in os.walk(root):
+        found.extend(os.path.join(dirpath, f) for f in fnmatch.filter(files, pattern))
+    found.sort()
+    return found
+
+
+def index_tree(root, pattern="*.json", workers=None, strict=False, chunksize=64):
+    """Index every sidecar under root; returns (rows, skipped_count)."""
+    files = find_sidecars(root, pattern)
+    rows, skipped = [], 0
+    if not files:
+        return rows, skipped
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for row in pool.map(index_file, files, chunksize=chunksize):
+            if not row["schema"] and not strict and row["error"] == "unrecognized sidecar shape":
+                skipped += 1
+                continue
+            rows.append(row)
+    return rows, skipped
+
+
+def to_columns(rows):
+    """Rows to NumPy columns with typed missing values."""
+    cols = {}
+    for name, kind in COLUMNS.items():
+        values = [r.get(name) for r in rows]
+        if kind == "float":
+            cols[name] = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+        elif kind == "int":
+            cols[name] = np.array([-1 if v is None else v for v in values], dtype=np.int64)
+        elif kind == "bool":
+            cols[name] = np.array([bool(v) for v in values], dtype=bool)
+        else:
+            cols[name] = np.array(["" if v is None else str(v) for v in values], dtype=str)
+    return cols
+
+
+def write_summary(rows, out):
+    """Write the columnar summary; the format follows the extension."""
+    cols = to_columns(rows)
+    ext = os.path.splitext(out)[1].lower()
+    if ext == ".parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet output needs pyarrow; install it with 'pip install pyarrow' "
+                              "or write .npz/.csv instead")
+        pq.write_table(pa.table({k: pa.array(v) for k, v in cols.items()}), out, compression="zstd")
+    elif ext == ".npz":
+        np.savez_compressed(out, **cols)
+    elif ext == ".csv":
+        with open(out, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(cols)
+            writer.writerows(zip(*(c.tolist() for c in cols.values())))
+    else:
+        raise ValueError(f"Unsupported summary format '{ext}' (use .parquet, .npz or .csv)")
+
+
+def print_summary(rows, skipped, seconds):
+    cols = to_columns(rows)
+    ok = cols["ok"]
+    print(f"🔍 Indexed {len(rows)} sidecars in {seconds:.2f}s: {int(ok.sum())} valid, "
+          f"{int((~ok).sum())} invalid, {skipped} other JSON skipped")
+    for schema in sorted(set(cols["schema"][ok])):
+        print(f"  {schema}: {int((cols['schema'][ok] == schema).sum())}")
+    rtf, models = cols["rtf"], cols["model"]
+    has = ok & np.isfinite(rtf)
+    if has.any():
+        print(f"  {'model':<32} | {'n':>6} | {'RTF p50':>8} | {'RTF p95':>8}")
+        for model in sorted(set(models[has])):
+            r = rtf[has & (models == model)]
+            print(f"  {model[:32]:<32} | {len(r):>6} | {np.percentile(r, 50):>8.3f} | {np.percentile(r, 95):>8.3f}")
+    for r in rows:
+        if not r["ok"]:
+            print(f"  ❌ {r['path']}: {r['error']}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Validate Whisper sidecars in parallel and build a columnar summary")
+    ap.add_argument("root", help="Output tree (or a single sidecar file)")
+    ap.add_argument("--out", default=None, help="Summary file: .parquet, .npz or .csv")
+    ap.add_argument("--pattern", default="*.json", help="File name pattern")
+    ap.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    ap.add_argument("--strict", action="store_true", help="Report unrecognized JSON files as invalid")
+    args = ap.parse_args()
+
+    t0 = time.time()
+    rows, skipped = index_tree(args.root, args.pattern, args.workers, args.strict)
+    if not rows:
+        print(f"❌ No sidecars found under {args.root}")
+        sys.exit(1)
+    print_summary(rows, skipped, time.time() - t0)
+    if args.out:
+        try:
+            write_summary(rows, args.out)
+        except (ImportError, ValueError) as e:
+            print(f"❌ Error: {e}")
+            sys.exit(1)
+        print(f"💾 Summary: {args.out}")
+    sys.exit(0 if all(r["ok"] for r in rows) else 2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+WAV Reader
+Memory-mapped access to PCM WAV files, including RF64 files over 4 GB as
+written by tools/gen_wav.py.
+
+Only the header is parsed; samples stay on disk as an (frames, channels)
+memmap, so hours-long audio can be scanned block by block.
+"""
+
+import struct
+from dataclasses import dataclass
+
+import numpy as np
+
+PCM_DTYPES = {(1, 2): '<i2', (1, 4): '<i4', (3, 4): '<f4'}
+PCM_SCALE = {'<i2': 32768.0, '<i4': 2147483648.0, '<f4': 1.0}
+
+
+@dataclass
+class WavAudio:
+    path: str
+    sr_hz: int
+    channels: int
+    dtype: str
+    data_offset: int
+    frames: int
+
+    @property
+    def duration_ms(self):
+        return self.frames * 1000 // self.sr_hz
+
+    def samples(self):
+        """Raw samples as a read-only (frames, channels) memmap."""
+        if self.frames == 0:
+            return np.zeros((0, self.channels), dtype=self.dtype)
+        return np.memmap(self.path, dtype=self.dtype, mode='r', offset=self.data_offset,
+                         shape=(self.frames, self.channels))
+
+    def iter_blocks(self, block_frames):
+        """Yield (start_frame, float32 block in [-1, 1]) pairs."""
+        data = self.samples()
+        scale = np.float32(PCM_SCALE[self.dtype])
+        for start in range(0, self.frames, block_frames):
+            yield start, np.asarray(data[start:start + block_frames], dtype=np.float32) / scale
+
+
+def open_wav(path):
+    """Parse RIFF/RF64 chunks and return a WavAudio; raises ValueError on unsupported files."""
+    with open(path, 'rb') as f:
+        head = f.read(12)
+        if len(head) < 12 or head[8:12] != b"WAVE" or head[:4] not in (b"RIFF", b"RF64"):
+            raise ValueError(f"{path}: not a RIFF/RF64 WAVE file")
+        fmt = None
+        ds64_data = None
+        while True:
+            hdr = f.read(8)
+            if len(hdr) < 8:
+                raise ValueError(f"{path}: no data chunk")
+            cid, size = hdr[:4], struct.unpack('<I', hdr[4:])[0]
+            if cid == b"ds64":
+                body = f.read(size)
+                ds64_data = struct.unpack('<Q', body[8:16])[0]
+            elif cid == b"fmt ":
+                body = f.read(size)
+                tag, channels, sr, _, _, bits = struct.unpack('<HHIIHH', body[:16])
+                if tag == 0xFFFE and size >= 26:
+                    tag = struct.unpack('<H', body[24:26])[0]  # WAVE_FORMAT_EXTENSIBLE subformat
+                fmt = (tag, channels, sr, bits)
+            elif cid == b"data":
+                if fmt is None:
+                    raise ValueError(f"{path}: data chunk before fmt chunk")
+                if size == 0xFFFFFFFF and ds64_data is not None:
+                    size = ds64_data
+                offset = f.tell()
+                f.seek(0, 2)
+                size = min(size, f.tell() - offset)
+                break
+            else:
+                f.seek(size + (size & 1), 1)
+    tag, channels, sr, bits = fmt
+    dtype = PCM_DTYPES.get((tag, bits // 8))
+    if dtype is None:
+        raise ValueError(f"{path}: unsupported format tag {tag} with {bits} bits")
+    frame_bytes = channels * bits // 8
+    return WavAudio(str(path), sr, channels, dtype, offset, size // frame_bytes)
@@ -1,103 +1,262 @@
 #!/usr/bin/env python3
 """
 CLIP Embedding Validator
-Validates .f32 embedding files and computes cosine similarity with query vectors.
+Validates .f32 embedding files (and self-describing .emb stores, whose dim
+comes from the header) and computes cosine similarity with query vectors.
+
+Given a directory or glob instead of a single file, validates every match in
+parallel across a process pool and streams a JSON Lines or CSV report.
 """
 
-import struct
+import csv
+import glob
 import json
+import os
 import sys
-import math
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+import numpy as np
+
+from mira.clip.embedding_store import dequantize, open_vectors, read_header, read_quant
+
+NORM_TOLERANCE = 0.01
+REPORT_FIELDS = ["path", "ok", "error", "dims", "rows", "norm", "norm_min", "norm_max",
+                 "min", "max", "mean", "nan_count", "inf_count", "not_normalized"]
+
+def read_store(path, expected_dim=None):
+    """(flat float32 data, dim) of an .emb store; dim is None for headerless .f32 files."""
+    header = read_header(path)
+    if header is None:
+        return None, None
+    return dequantize(open_vectors(path, expected_dim), read_quant(path, header)).ravel(), header.dim
+
 def read_f32_embedding(file_path, expected_dim=None):
-    """Read a .f32 embedding file (little-endian float32)."""
-    with open(file_path, 'rb') as f:
-        data = f.read()
-    
-    # Each float is 4 bytes
-    num_floats = len(data) // 4
-    if len(data) % 4 != 0:
-        raise ValueError(f"File size {len(data)} is not multiple of 4")
-    
-    if expected_dim and num_floats != expected_dim:
-        raise ValueError(f"Expected {expected_dim} floats, got {num_floats}")
-    
-    # Unpack as little-endian float32
-    embedding = struct.unpack(f'<{num_floats}f', data)
-    return list(embedding)
+    """Read a .f32 embedding file (little-endian float32) or a one-row .emb store."""
+    data, dim = read_store(file_path, expected_dim)
+    if data is not None:
+        if data.size != dim:
+            raise ValueError(f"{file_path} holds {data.size // max(dim, 1)} rows; validate it in batch mode")
+        return data
+    data = np.fromfile(file_path, dtype='<f4')
+    size = os.path.getsize(file_path)
+    if size % 4 != 0:
+        raise ValueError(f"File size {size} is not multiple of 4")
+
+    if expected_dim and data.size != expected_dim:
+        raise ValueError(f"Expected {expected_dim} floats, got {data.size}")
+
+    return data
 
 def l2_norm(vec):
     """Compute L2 norm of a vector."""
-    return math.sqrt(sum(x * x for x in vec))
+    v = np.asarray(vec, dtype=np.float64)
+    return float(np.sqrt(np.dot(v, v)))
 
 def cosine_similarity(a, b):
     """Compute cosine similarity between two vectors."""
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
     if len(a) != len(b):
         raise ValueError(f"Vector dimensions don't match: {len(a)} vs {len(b)}")
-    
-    dot_product = sum(x * y for x, y in zip(a, b))
-    norm_a = l2_norm(a)
-    norm_b = l2_norm(b)
-    
+
+    norm_a = np.sqrt(np.dot(a, a))
+    norm_b = np.sqrt(np.dot(b, b))
+
     if norm_a == 0 or norm_b == 0:
         return 0.0
-    
-    return dot_product / (norm_a * norm_b)
+
+    return float(np.dot(a, b) / (norm_a * norm_b))
+
+def embedding_stats(data, dim=None):
+    """
+    All validation statistics of one file from a single read.
+
+    `data` may hold one vector or N rows of `dim`; norm fields are per row.
+    """
+    dim = dim or data.size
+    rows = data.reshape(-1, dim) if data.size else data.reshape(0, max(dim, 1))
+    finite = np.isfinite(data)
+    nan_count = int(np.isnan(data).sum())
+    inf_count = int(data.size - finite.sum() - nan_count)
+    clean = np.where(np.isfinite(rows), rows, 0).astype(np.float64)
+    norms = np.sqrt(np.einsum('ij,ij->i', clean, clean))
+    vals = data[finite]
+    return {
+        "dims": int(dim),
+        "rows": int(rows.shape[0]),
+        "norm": float(norms[0]) if len(norms) == 1 else float(norms.mean()) if len(norms) else 0.0,
+        "norm_min": float(norms.min()) if len(norms) else 0.0,
+        "norm_max": float(norms.max()) if len(norms) else 0.0,
+        "min": float(vals.min()) if vals.size else float('nan'),
+        "max": float(vals.max()) if vals.size else float('nan'),
+        "mean": float(vals.mean(dtype=np.float64)) if vals.size else float('nan'),
+        "nan_count": nan_count,
+        "inf_count": inf_count,
+        "not_normalized": int((np.abs(norms - 1.0) >= NORM_TOLERANCE).sum()),
+    }
+
+def validate_file(path, expected_dim=None):
+    """Validate one file into a report record (never raises)."""
+    record = {"path": str(path), "ok": False, "error": ""}
+    try:
+        data, dim = read_store(path, expected_dim)
+        if data is not None:
+            expected_dim = dim
+        else:
+            data = np.fromfile(path, dtype='<f4')
+            size = os.path.getsize(path)
+            if size % 4 != 0:
+                raise ValueError(f"File size {size} is not multiple of 4")
+        if expected_dim and data.size % expected_dim != 0:
+            raise ValueError(f"{data.size} floats is not a multiple of dim {expected_dim}")
+        if data.size == 0:
+            raise ValueError("Empty file")
+        record.update(embedding_stats(data, expected_dim))
+        record["ok"] = record["nan_count"] == 0 and record["inf_count"] == 0 and record["not_normalized"] == 0
+    except Exception as e:
+        record["error"] = str(e)
+    return record
+
+def _validate_task(args):
+    return validate_file(*args)
 
 def validate_embedding(embedding_path, expected_dim=None):
     """Validate an embedding file."""
     print(f"🔍 Validating: {embedding_path}")
-    
+
     try:
         embedding = read_f32_embedding(embedding_path, expected_dim)
-        print(f"  ✅ Dimensions: {len(embedding)}")
-        print(f"  ✅ L2 norm: {l2_norm(embedding):.6f}")
-        print(f"  ✅ Min value: {min(embedding):.6f}")
-        print(f"  ✅ Max value: {max(embedding):.6f}")
-        print(f"  ✅ Mean value: {sum(embedding)/len(embedding):.6f}")
-        
+        stats = embedding_stats(embedding)
+        print(f"  ✅ Dimensions: {stats['dims']}")
+        print(f"  ✅ L2 norm: {stats['norm']:.6f}")
+        print(f"  ✅ Min value: {stats['min']:.6f}")
+        print(f"  ✅ Max value: {stats['max']:.6f}")
+        print(f"  ✅ Mean value: {stats['mean']:.6f}")
+        if stats['nan_count'] or stats['inf_count']:
+            print(f"  ⚠️  Non-finite values: {stats['nan_count']} NaN, {stats['inf_count']} Inf")
+
         # Check if normalized (L2 norm should be close to 1.0)
-        norm = l2_norm(embedding)
-        if abs(norm - 1.0) < 0.01:
+        norm = stats['norm']
+        if abs(norm - 1.0) < NORM_TOLERANCE:
             print(f"  ✅ Normalized (L2 norm ≈ 1.0)")
         else:
             print(f"  ⚠️  Not normalized (L2 norm = {norm:.6f})")
-        
+
         return embedding
-        
+
     except Exception as e:
         print(f"  ❌ Error: {e}")
         return None
 
+def expand_inputs(target, pattern="*.f32"):
+    """Files for a directory (recursive pattern match) or a glob expression."""
+    if os.path.isdir(target):
+        return sorted(str(p) for p in Path(target).rglob(pattern))
+    return sorted(glob.glob(target, recursive=True))
+
+class ReportWriter:
+    """Streams records as JSON Lines or CSV (by extension or explicit format)."""
+
+    def __init__(self, path=None, fmt=None):
+        self.fmt = fmt or ("csv" if path and str(path).endswith(".csv") else "jsonl")
+        self.fh = open(path, 'w', newline='') if path else sys.stdout
+        self.csv = None
+        if self.fmt == "csv":
+            self.csv = csv.DictWriter(self.fh, fieldnames=REPORT_FIELDS, extrasaction='ignore')
+            self.csv.writeheader()
+
+    def write(self, record):
+        if self.csv:
+            self.csv.writerow(record)
+        else:
+            self.fh.write(json.dumps(record) + "\n")
+
+    def close(self):
+        if self.fh is not sys.stdout:
+            self.fh.close()
+        else:
+            self.fh.flush()
+
+def validate_many(files, expected_dim=None, workers=None, report=None, fmt=None, chunksize=64):
+    """Validate files across a process pool, streaming each record to the report."""
+    writer = ReportWriter(report, fmt)
+    summary = {"files": 0, "ok": 0, "errors": 0, "non_finite": 0, "not_normalized": 0}
+    t0 = time.time()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            tasks = ((f, expected_dim) for f in files)
+            for record in pool.map(_validate_task, tasks, chunksize=chunksize):
+                writer.write(record)
+                summary["files"] += 1
+                if record["error"]:
+                    summary["errors"] += 1
+                    continue
+                summary["ok"] += record["ok"]
+                summary["non_finite"] += bool(record["nan_count"] or record["inf_count"])
+                summary["not_normalized"] += bool(record["not_normalized"])
+    finally:
+        writer.close()
+    summary["seconds"] = round(time.time() - t0, 3)
+    return summary
+
+def main_batch(argv):
+    import argparse
+    ap = argparse.ArgumentParser(description="Validate many .f32 embedding files in parallel")
+    ap.add_argument("target", help="Directory (searched recursively) or glob, e.g. 'out/**/*.f32'")
+    ap.add_argument("expected_dim", nargs="?", type=int, default=None,
+                    help="Embedding dimension; files may hold several rows of it")
+    ap.add_argument("--pattern", default="*.f32", help="File pattern for directory mode")
+    ap.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    ap.add_argument("--report", default=None, help="Report file (.jsonl or .csv); stdout if omitted")
+    ap.add_argument("--format", choices=("jsonl", "csv"), default=None, help="Report format override")
+    args = ap.parse_args(argv)
+
+    files = expand_inputs(args.target, args.pattern)
+    if not files:
+        print(f"❌ No embedding files match: {args.target}", file=sys.stderr)
+        sys.exit(1)
+    print(f"🔍 Validating {len(files)} files...", file=sys.stderr)
+    s = validate_many(files, args.expected_dim, args.workers, args.report, args.format)
+    print(f"🎉 {s['files']} files in {s['seconds']}s: {s['ok']} ok, {s['errors']} errors, "
+          f"{s['non_finite']} with NaN/Inf, {s['not_normalized']} not normalized", file=sys.stderr)
+    sys.exit(0 if s['ok'] == s['files'] else 2)
+
 def main():
     if len(sys.argv) < 2:
         print("Usage: python3 retrieval_check.py <embedding.f32> [expected_dim] [query.json]")
+        print("       python3 retrieval_check.py <dir|glob> [expected_dim] [--report out.jsonl|out.csv] [--workers N]")
         print("  embedding.f32: Path to .f32 embedding file")
         print("  expected_dim: Expected embedding dimension (optional)")
         print("  query.json: Path to query vector JSON file (optional)")
+        print("  dir|glob: Validate every matching file in parallel and stream a report")
         sys.exit(1)
-    
+
     embedding_path = sys.argv[1]
+    if os.path.isdir(embedding_path) or glob.has_magic(embedding_path) or any(a.startswith('--') for a in sys.argv[2:]):
+        main_batch(sys.argv[1:])
+        return
+
     expected_dim = int(sys.argv[2]) if len(sys.argv) > 2 else None
     query_path = sys.argv[3] if len(sys.argv) > 3 else None
-    
+
     if not Path(embedding_path).exists():
         print(f"❌ Embedding file not found: {embedding_path}")
         sys.exit(1)
-    
+
     # Validate embedding
     embedding = validate_embedding(embedding_path, expected_dim)
     if embedding is None:
         sys.exit(1)
-    
+
     # Load and validate query if provided
     if query_path and Path(query_path).exists():
         print(f"\n🔍 Validating query: {query_path}")
         try:
             with open(query_path, 'r') as f:
                 query_data = json.load(f)
-            
+
             if 'vector' in query_data:
                 query_vec = query_data['vector']
             elif isinstance(query_data, list):
@@ -105,18 +264,18 @@ def main():
             else:
                 print(f"  ❌ Invalid query format. Expected 'vector' key or array.")
                 sys.exit(1)
-            
+
             if len(query_vec) != len(embedding):
                 print(f"  ❌ Query dimension {len(query_vec)} doesn't match embedding dimension {len(embedding)}")
                 sys.exit(1)
-            
+
             similarity = cosine_similarity(embedding, query_vec)
             print(f"  ✅ Cosine similarity: {similarity:.6f}")
-            
+
         except Exception as e:
             print(f"  ❌ Error loading query: {e}")
             sys.exit(1)
-    
+
     print(f"\n🎉 Validation complete!")
 
 if __name__ == "__main__":